@@ -0,0 +1,79 @@
+import math
+import numpy as np
+from SceneModel import multiplyQuaternions
+
+PATTERNS = ('linear', 'grid', 'radial')
+MAX_COPIES = 100000
+
+"""
+Offsets of count copies placed step apart along a line, starting one step
+from the source
+"""
+def linearOffsets(count, step):
+    index = np.arange(1, count + 1, dtype=np.float64)
+    return index[:, None] * np.asarray(step, dtype=np.float64)
+
+
+"""
+Offsets of count copies filling a grid row by row. Columns advance by the x
+step, rows by the y and z steps. Cell 0 is the source itself.
+"""
+def gridOffsets(count, step, columns):
+    columns = max(1, columns)
+    index = np.arange(1, count + 1)
+    column = (index % columns).astype(np.float64)
+    row = (index // columns).astype(np.float64)
+    step = np.asarray(step, dtype=np.float64)
+    return np.stack([column * step[0], row * step[1], row * step[2]], axis=-1)
+
+
+"""
+Offsets of count copies spaced evenly on a circle of radius around the
+source in the XZ plane, with the yaw rotation turning each copy to face out
+"""
+def radialOffsets(count, radius):
+    angles = np.arange(count, dtype=np.float64) * (2.0 * math.pi / max(1, count))
+    offsets = np.stack([np.cos(angles) * radius, np.zeros(count),
+                        np.sin(angles) * radius], axis=-1)
+    half = -angles * 0.5
+    yaw = np.stack([np.zeros(count), np.sin(half), np.zeros(count), np.cos(half)], axis=-1)
+    return offsets, yaw
+
+
+"""
+Colors blended linearly from start towards end, reaching end at the last copy
+"""
+def colorRamp(start, end, count):
+    start = np.asarray(start, dtype=np.float64)
+    end = np.asarray(end, dtype=np.float64)
+    t = np.arange(1, count + 1, dtype=np.float64) / max(1, count)
+    return np.rint(start + (end - start) * t[:, None]).astype(np.uint8)
+
+
+"""
+Positions, rotations (x, y, z, w) and RGBA colors of count copies of the
+primitive in slot, computed in one vectorized pass over the scene model.
+Without endColor every copy keeps the source color.
+"""
+def arrayLayout(model, slot, pattern, count, step=(1.0, 0.0, 0.0), columns=1,
+                radius=1.0, endColor=None):
+    if pattern not in PATTERNS:
+        raise ValueError(f"Unknown array pattern {pattern!r}")
+    count = min(int(count), MAX_COPIES)
+
+    rotations = np.repeat(model.rotations[slot:slot + 1].astype(np.float64), count, axis=0)
+    if pattern == 'linear':
+        offsets = linearOffsets(count, step)
+    elif pattern == 'grid':
+        offsets = gridOffsets(count, step, columns)
+    else:
+        offsets, yaw = radialOffsets(count, radius)
+        rotations = multiplyQuaternions(yaw, rotations)
+
+    positions = model.positions[slot].astype(np.float64) + offsets
+    start = model.colors[slot]
+    if endColor is None:
+        colors = np.repeat(start[None, :], count, axis=0)
+    else:
+        colors = colorRamp(start, endColor, count)
+    return positions, rotations, colors
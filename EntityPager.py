@@ -0,0 +1,155 @@
+import time
+import numpy as np
+from PySide2 import QtCore
+from SpatialIndex import frustumPlanes
+
+# world units around the camera within which primitives get live entities
+PAGING_RADIUS = 150.0
+# live entities are only released once this fraction beyond the radius
+PAGING_HYSTERESIS = 0.1
+MAX_LIVE_ENTITIES = 20000
+# entities created per update, so paging in never stalls a frame for long
+MATERIALIZE_BUDGET = 500
+PAGING_INTERVAL_MS = 100
+
+"""
+Keeps Qt3D entities only for primitives near the camera. Primitives
+without an entity remain lightweight views on their scene model slot.
+Entities are created nearest first, a budget per update, and released as
+the camera moves away, with at most maxLive alive at once. With paging off
+every primitive is materialized, as before.
+"""
+class EntityPager(QtCore.QObject):
+    def __init__(self, cameraEntity, shapeEditor, radius=PAGING_RADIUS,
+                 maxLive=MAX_LIVE_ENTITIES, budget=MATERIALIZE_BUDGET):
+        super().__init__()
+        self.m_cameraEntity = cameraEntity
+        self.shapeEditor = shapeEditor
+        self.radius = radius
+        self.maxLive = maxLive
+        self.budget = budget
+        self.enabled = False
+        self.useFrustum = False
+        self.m_live = {}
+        self.m_stats = {'hits': 0, 'misses': 0, 'created': 0, 'released': 0,
+                        'deferred': 0, 'last_update_ms': 0.0}
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(PAGING_INTERVAL_MS)
+        self.timer.timeout.connect(self.update)
+
+        self.m_cameraEntity.viewMatrixChanged.connect(self.markDirty)
+
+    def setEnabled(self, enabled):
+        self.enabled = enabled
+        self.markDirty()
+
+    def setRadius(self, radius):
+        self.radius = radius
+        self.markDirty()
+
+    def setMaxLive(self, maxLive):
+        self.maxLive = maxLive
+        self.markDirty()
+
+    """
+    Also limits live entities to those inside the view frustum
+    """
+    def setUseFrustum(self, useFrustum):
+        self.useFrustum = useFrustum
+        self.markDirty()
+
+    def markDirty(self):
+        if not self.timer.isActive():
+            self.timer.start()
+
+    """
+    Materializes new primitives right away when paging is off, otherwise
+    leaves them to the next update
+    """
+    def primitivesAdded(self, primitives):
+        if not self.enabled:
+            for primitive in primitives:
+                self.materialize(primitive)
+        else:
+            self.markDirty()
+
+    def primitiveRemoved(self, primitive):
+        self.m_live.pop(primitive.persist_id, None)
+
+    def materialize(self, primitive):
+        primitive.materialize()
+        self.m_live[primitive.persist_id] = primitive
+        self.shapeEditor.entityMaterialized(primitive)
+        self.m_stats['created'] += 1
+
+    def release(self, primitive):
+        self.shapeEditor.entityReleased(primitive)
+        primitive.dematerialize()
+        self.m_stats['released'] += 1
+
+    """
+    Persist ids of primitives within radius of the camera, nearest first,
+    at most maxLive of them
+    """
+    def nearest(self, radius):
+        model = self.shapeEditor.sceneModel
+        camera = self.m_cameraEntity.position()
+        center = np.array([camera.x(), camera.y(), camera.z()], dtype=np.float32)
+        slots = model.slotsWithin(center, radius)
+        offsets = model.worldPositions(slots) - center
+        order = np.argsort(np.einsum('ij,ij->i', offsets, offsets), kind='stable')
+        return model.ids[slots[order[:self.maxLive]]].tolist()
+
+    def update(self):
+        start = time.perf_counter()
+        shapeEditor = self.shapeEditor
+        if not self.enabled:
+            if len(self.m_live) >= len(shapeEditor.sceneModel):
+                return
+            wanted = [primitive.persist_id for primitive in shapeEditor.primitives()]
+            keep = set(wanted)
+        else:
+            wanted = self.nearest(self.radius)
+            keep = set(self.nearest(self.radius * (1.0 + PAGING_HYSTERESIS)))
+            if self.useFrustum:
+                camera = self.m_cameraEntity
+                visible = shapeEditor.spatialIndex.frustumQuery(
+                    frustumPlanes(camera.projectionMatrix() * camera.viewMatrix()))
+                wanted = [key for key in wanted if key in visible]
+                keep &= visible
+
+        # the primitive open in the editor stays live
+        selected = shapeEditor.instancedRenderer.selected
+        if selected is not None:
+            keep.add(selected.persist_id)
+
+        for key in [key for key in self.m_live if key not in keep]:
+            self.release(self.m_live.pop(key))
+
+        created = 0
+        limit = self.maxLive if self.enabled else float('inf')
+        for key in wanted:
+            if key in self.m_live:
+                self.m_stats['hits'] += 1
+                continue
+            if created >= self.budget or len(self.m_live) >= limit:
+                self.m_stats['deferred'] += 1
+                continue
+            primitive = shapeEditor.primitiveFor(key)
+            if primitive is not None:
+                self.m_stats['misses'] += 1
+                self.materialize(primitive)
+                created += 1
+
+        self.m_stats['last_update_ms'] = (time.perf_counter() - start) * 1000.0
+        if created >= self.budget:
+            self.markDirty()
+
+    def stats(self):
+        stats = dict(self.m_stats)
+        stats['live'] = len(self.m_live)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = stats['hits'] / lookups if lookups else 0.0
+        return stats
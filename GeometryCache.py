@@ -0,0 +1,83 @@
+from PySide2 import QtGui
+from PySide2.Qt3DExtras import Qt3DExtras
+
+SPHERE_RINGS = 20
+SPHERE_SLICES = 20
+
+"""
+Shares meshes and materials between primitives. Components are keyed by
+their parameters and reference counted, so identical shapes and colors use
+a single Qt3D node. Shared components are never edited in place: a
+primitive changing its radius or color releases its component and acquires
+the one matching the new value.
+"""
+class GeometryCache:
+    def __init__(self, rootEntity, shared=True):
+        self.m_rootEntity = rootEntity
+        self.shared = shared
+        self.m_components = {}
+        self.m_refCounts = {}
+        self.m_keys = {}
+
+    def sphereMesh(self, radius, rings=SPHERE_RINGS, slices=SPHERE_SLICES):
+        key = ('sphere', round(radius, 5), rings, slices)
+        return self.acquire(key, lambda: Qt3DExtras.QSphereMesh(
+            self.m_rootEntity, rings=rings, slices=slices, radius=radius))
+
+    def cuboidMesh(self, xExtent=1.0, yExtent=1.0, zExtent=1.0):
+        key = ('cuboid', round(xExtent, 5), round(yExtent, 5), round(zExtent, 5))
+        return self.acquire(key, lambda: Qt3DExtras.QCuboidMesh(
+            self.m_rootEntity, xExtent=xExtent, yExtent=yExtent, zExtent=zExtent))
+
+    def material(self, color):
+        color = QtGui.QColor(color)
+        key = ('phong', color.name())
+        return self.acquire(key, lambda: Qt3DExtras.QPhongMaterial(
+            self.m_rootEntity, diffuse=color))
+
+    def acquire(self, key, create):
+        if not self.shared:
+            return create()
+
+        component = self.m_components.get(key)
+        if component is None:
+            component = create()
+            self.m_components[key] = component
+            self.m_refCounts[key] = 0
+            self.m_keys[id(component)] = key
+        self.m_refCounts[key] += 1
+        return component
+
+    """
+    Drops one reference to component and destroys it when no primitive uses it
+    """
+    def release(self, component):
+        if not self.shared:
+            component.deleteLater()
+            return
+
+        key = self.m_keys.get(id(component))
+        if key is None:
+            return
+        self.m_refCounts[key] -= 1
+        if self.m_refCounts[key] == 0:
+            del self.m_components[key]
+            del self.m_refCounts[key]
+            del self.m_keys[id(component)]
+            component.deleteLater()
+
+    """
+    Replaces current with a component from acquire on entity
+    """
+    def swap(self, entity, current, replacement):
+        if replacement is current:
+            self.release(current)
+            return current
+        entity.removeComponent(current)
+        entity.addComponent(replacement)
+        self.release(current)
+        return replacement
+
+    def stats(self):
+        return {'components': len(self.m_components),
+                'references': sum(self.m_refCounts.values())}
@@ -0,0 +1,230 @@
+import contextlib
+from PySide2 import QtCore, QtGui
+from PySide2.Qt3DCore import Qt3DCore
+from SceneStore import newId
+
+"""
+A named group of primitives and nested groups. Like a primitive onto its
+slot, a group is a view onto its row of the scene model group table. It
+owns the entity that the entities of its members are parented to, so
+moving or turning the group is one transform change and one stored
+record. Members keep their transforms relative to the group. A group
+color, once set, is given to every member, including members loaded later.
+"""
+class Group(QtCore.QObject):
+    groupTag = 1
+
+    def __init__(self, rootEntity, shapeEditor, persist_id=None):
+        super().__init__()
+        self.m_rootEntity = rootEntity
+        self.shapeEditor = shapeEditor
+        self.model = shapeEditor.sceneModel
+        # groups have no primitive slot; the persistence queue stores toDict
+        self.slot = None
+        self.persist_id = persist_id or newId()
+        self.index = self.model.groupIndex(self.persist_id)
+        if not self.model.groupNames[self.index]:
+            self.model.groupNames[self.index] = f'Group {Group.groupTag}'
+            Group.groupTag += 1
+        self.m_transactionDepth = 0
+        self.m_transactionDirty = False
+
+        self.m_Entity = Qt3DCore.QEntity(rootEntity)
+        self.transform = Qt3DCore.QTransform()
+        self.m_Entity.addComponent(self.transform)
+        self.syncToQt()
+
+    def primitiveType(self):
+        return 'group'
+
+    def name(self):
+        return self.model.groupNames[self.index]
+
+    def position(self):
+        return QtGui.QVector3D(*self.model.groupPositions[self.index].tolist())
+
+    def rotation(self):
+        x, y, z, w = self.model.groupRotations[self.index].tolist()
+        return QtGui.QQuaternion(w, x, y, z).toEulerAngles()
+
+    def color(self):
+        color = self.model.groupColors[self.index]
+        return QtGui.QColor(color) if color else QtGui.QColor(QtCore.Qt.gray)
+
+    def parentGroup(self):
+        return self.shapeEditor.groupAt(int(self.model.groupParents[self.index]))
+
+    """
+    Enclosing groups, innermost first
+    """
+    def ancestors(self):
+        groups = []
+        group = self.parentGroup()
+        while group is not None:
+            groups.append(group)
+            group = group.parentGroup()
+        return groups
+
+    def entity(self):
+        return self.m_Entity
+
+    """
+    Group entities stay enabled; whether members draw is up to them
+    """
+    def setEntityEnabled(self, enabled):
+        pass
+
+    def worldMatrix(self):
+        self.model.updateWorld()
+        x, y, z, w = self.model.groupWorldRotations[self.index].tolist()
+        matrix = QtGui.QMatrix4x4()
+        matrix.translate(QtGui.QVector3D(*self.model.groupWorldPositions[self.index].tolist()))
+        matrix.rotate(QtGui.QQuaternion(w, x, y, z))
+        return matrix
+
+    def setPosition(self, vector, doPersist=True):
+        self.model.groupPositions[self.index] = (vector.x(), vector.y(), vector.z())
+        self.transform.setTranslation(vector)
+        self.transformChanged()
+        self.persist(doPersist)
+
+    def setRotation(self, vector, doPersist=True):
+        quat = QtGui.QQuaternion.fromEulerAngles(vector)
+        self.model.groupRotations[self.index] = (quat.x(), quat.y(), quat.z(), quat.scalar())
+        self.transform.setRotation(quat)
+        self.transformChanged()
+        self.persist(doPersist)
+
+    def fields(self):
+        return self.model.groupFields(self.index)
+
+    """
+    Writes fields (see SceneModel.setGroupFields) to the group row and the
+    entity, used by undo and redo
+    """
+    def applyFields(self, fields):
+        oldName = self.name()
+        self.model.setGroupFields(self.index, fields)
+        self.syncToQt()
+        self.transformChanged()
+        if 'color' in fields:
+            self.applyColor()
+        if 'name' in fields:
+            self.shapeEditor.primitiveRenamed(self, oldName)
+        self.persist(True)
+
+    """
+    Moves the group into group, None for the top level, keeping its place
+    in the world
+    """
+    def setParentGroup(self, group, doPersist=True):
+        self.model.setGroupParent(self.index, group.index if group is not None else -1)
+        self.syncToQt()
+        self.transformChanged()
+        self.persist(doPersist)
+
+    def transformChanged(self):
+        self.model.markWorldDirty()
+        self.shapeEditor.groupMoved(self)
+
+    """
+    Gives every member the color; only the group record is stored. Nested
+    groups with a color of their own keep it.
+    """
+    def setColor(self, color, doPersist=True):
+        self.model.groupColors[self.index] = color.name()
+        self.applyColor()
+        self.persist(doPersist)
+
+    """
+    Color of the nearest enclosing group that has one, as a color name
+    """
+    def colorName(self):
+        for group in [self] + self.ancestors():
+            color = group.model.groupColors[group.index]
+            if color:
+                return color
+        return None
+
+    def applyColor(self):
+        color = self.colorName()
+        if not color:
+            return
+        for primitive in self.shapeEditor.groupMembers(self):
+            primitive.setColor(QtGui.QColor(color), False)
+        for group in self.shapeEditor.childGroups(self):
+            if not self.model.groupColors[group.index]:
+                group.applyColor()
+        self.shapeEditor.groupChanged(self)
+
+    def applyColorTo(self, primitive):
+        color = self.colorName()
+        if color:
+            primitive.setColor(QtGui.QColor(color), False)
+
+    def setName(self, name, doPersist=True):
+        oldName = self.name()
+        self.model.groupNames[self.index] = name
+        self.shapeEditor.primitiveRenamed(self, oldName)
+        self.persist(doPersist)
+
+    """
+    Pushes the group row to the entity and places the entity under the
+    entity of the parent group
+    """
+    def syncToQt(self):
+        x, y, z, w = self.model.groupRotations[self.index].tolist()
+        self.transform.setTranslation(self.position())
+        self.transform.setRotation(QtGui.QQuaternion(w, x, y, z))
+        self.m_Entity.setParent(self.shapeEditor.groupEntity(
+            int(self.model.groupParents[self.index])))
+
+    """
+    Restores the group from a stored record
+    """
+    def restore(self, json_dict):
+        self.model.setGroupRecord(dict(json_dict, id=self.persist_id))
+        self.syncToQt()
+        self.applyColor()
+        self.transformChanged()
+
+    """
+    Groups property changes into one undo step and one stored record
+    """
+    @contextlib.contextmanager
+    def transaction(self):
+        if self.m_transactionDepth == 0:
+            self.m_undoFields = self.fields()
+        self.m_transactionDepth += 1
+        try:
+            yield self
+        finally:
+            self.m_transactionDepth -= 1
+            if self.m_transactionDepth == 0:
+                self.shapeEditor.undoStack.recordEdit(self, self.m_undoFields)
+                self.shapeEditor.noteAction()
+                if self.m_transactionDirty:
+                    self.m_transactionDirty = False
+                    self.persist(True)
+
+    def persist(self, doPersist):
+        if not doPersist:
+            return
+        if self.m_transactionDepth > 0:
+            self.m_transactionDirty = True
+            self.shapeEditor.persistenceQueue.noteDeferred()
+            return
+        self.shapeEditor.persistenceQueue.markDirty(self)
+
+    def toDict(self):
+        return self.model.groupRecord(self.index)
+
+    def primitiveClicked(self):
+        self.shapeEditor.handleClickedPrimitive(self)
+
+    """
+    Dissolves the group. Members and nested groups move to the parent
+    group and keep their place in the world.
+    """
+    def remove(self):
+        self.shapeEditor.ungroup(self)
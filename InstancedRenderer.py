@@ -0,0 +1,235 @@
+import numpy as np
+from PySide2 import QtCore
+from PySide2.Qt3DCore import Qt3DCore
+from PySide2.Qt3DExtras import Qt3DExtras
+from PySide2.Qt3DRender import Qt3DRender
+from SceneModel import TYPE_CODES
+
+# translation (3), rotation quaternion xyzw (4), scale (3), color (3)
+INSTANCE_FLOATS = 13
+INSTANCE_STRIDE = INSTANCE_FLOATS * 4
+
+INSTANCED_VERTEX_SHADER = b"""
+#version 150 core
+in vec3 vertexPosition;
+in vec3 vertexNormal;
+in vec3 instanceTranslation;
+in vec4 instanceRotation;
+in vec3 instanceScale;
+in vec3 instanceColor;
+
+out vec3 worldPosition;
+out vec3 worldNormal;
+out vec3 color;
+
+uniform mat4 viewProjectionMatrix;
+
+vec3 rotate(vec4 q, vec3 v)
+{
+    return v + 2.0 * cross(q.xyz, cross(q.xyz, v) + q.w * v);
+}
+
+void main()
+{
+    worldPosition = rotate(instanceRotation, vertexPosition * instanceScale) + instanceTranslation;
+    worldNormal = normalize(rotate(instanceRotation, vertexNormal / instanceScale));
+    color = instanceColor;
+    gl_Position = viewProjectionMatrix * vec4(worldPosition, 1.0);
+}
+"""
+
+INSTANCED_FRAGMENT_SHADER = b"""
+#version 150 core
+in vec3 worldPosition;
+in vec3 worldNormal;
+in vec3 color;
+
+out vec4 fragColor;
+
+uniform vec3 eyePosition;
+
+void main()
+{
+    vec3 toEye = normalize(eyePosition - worldPosition);
+    float diffuse = abs(dot(normalize(worldNormal), toEye));
+    fragColor = vec4(color * (0.2 + 0.8 * diffuse), 1.0);
+}
+"""
+
+"""
+Material that places and colors each instance from per-instance attributes
+"""
+def createInstancedMaterial(parent):
+    return createShaderMaterial(parent, INSTANCED_VERTEX_SHADER, INSTANCED_FRAGMENT_SHADER)
+
+
+"""
+Material running the given GLSL 1.50 shaders in the forward render pass
+"""
+def createShaderMaterial(parent, vertexShader, fragmentShader):
+    # every node gets a parent, PySide deletes unparented ones on return
+    material = Qt3DRender.QMaterial(parent)
+    effect = Qt3DRender.QEffect(material)
+    technique = Qt3DRender.QTechnique(effect)
+    technique.graphicsApiFilter().setApi(Qt3DRender.QGraphicsApiFilter.OpenGL)
+    technique.graphicsApiFilter().setProfile(Qt3DRender.QGraphicsApiFilter.CoreProfile)
+    technique.graphicsApiFilter().setMajorVersion(3)
+    technique.graphicsApiFilter().setMinorVersion(2)
+
+    # matched by the technique filter of the default forward renderer
+    filterKey = Qt3DRender.QFilterKey(technique)
+    filterKey.setName("renderingStyle")
+    filterKey.setValue("forward")
+    technique.addFilterKey(filterKey)
+
+    renderPass = Qt3DRender.QRenderPass(technique)
+    shader = Qt3DRender.QShaderProgram(renderPass)
+    shader.setVertexShaderCode(vertexShader)
+    shader.setFragmentShaderCode(fragmentShader)
+    renderPass.setShaderProgram(shader)
+
+    technique.addRenderPass(renderPass)
+    effect.addTechnique(technique)
+    material.setEffect(effect)
+    return material
+
+
+"""
+One instanced draw for every primitive of a single type. Instances share a
+unit geometry and take transform and color from a per-instance buffer.
+"""
+class InstanceBatch:
+    def __init__(self, parentEntity, geometry, material):
+        self.m_Entity = Qt3DCore.QEntity(parentEntity)
+        self.geometry = geometry
+        self.instanceBuffer = Qt3DRender.QBuffer(self.geometry)
+        self.attributes = []
+
+        offset = 0
+        for name, size in (('instanceTranslation', 3), ('instanceRotation', 4),
+                           ('instanceScale', 3), ('instanceColor', 3)):
+            attribute = Qt3DRender.QAttribute(self.geometry)
+            attribute.setName(name)
+            attribute.setAttributeType(Qt3DRender.QAttribute.VertexAttribute)
+            attribute.setVertexBaseType(Qt3DRender.QAttribute.Float)
+            attribute.setVertexSize(size)
+            attribute.setByteOffset(offset)
+            attribute.setByteStride(INSTANCE_STRIDE)
+            attribute.setDivisor(1)
+            attribute.setBuffer(self.instanceBuffer)
+            self.geometry.addAttribute(attribute)
+            self.attributes.append(attribute)
+            offset += size * 4
+
+        self.renderer = Qt3DRender.QGeometryRenderer()
+        self.renderer.setGeometry(self.geometry)
+        self.renderer.setPrimitiveType(Qt3DRender.QGeometryRenderer.Triangles)
+        self.m_Entity.addComponent(self.renderer)
+        self.m_Entity.addComponent(material)
+
+    def setInstances(self, data, count):
+        self.instanceBuffer.setData(QtCore.QByteArray(data.tobytes()))
+        for attribute in self.attributes:
+            attribute.setCount(count)
+        self.renderer.setInstanceCount(count)
+        self.m_Entity.setEnabled(count > 0)
+
+
+"""
+Optional rendering mode that draws all spheres and all cubes with one
+instanced draw each. Primitive entities are disabled while the mode is on,
+except the primitive open in the editor, which stays live so edits show
+immediately.
+"""
+class InstancedRenderer(QtCore.QObject):
+    def __init__(self, rootEntity, shapeEditor):
+        super().__init__()
+        self.m_rootEntity = rootEntity
+        self.shapeEditor = shapeEditor
+        self.enabled = False
+        self.selected = None
+        self.m_rebuildPending = False
+        self.m_batches = None
+
+    def createBatches(self):
+        self.m_Entity = Qt3DCore.QEntity(self.m_rootEntity)
+        self.material = createInstancedMaterial(self.m_Entity)
+
+        sphereGeometry = Qt3DExtras.QSphereGeometry(self.m_Entity)
+        sphereGeometry.setRadius(1.0)
+        sphereGeometry.setRings(20)
+        sphereGeometry.setSlices(20)
+        cubeGeometry = Qt3DExtras.QCuboidGeometry(self.m_Entity)
+
+        self.m_batches = {'sphere': InstanceBatch(self.m_Entity, sphereGeometry, self.material),
+                          'cube': InstanceBatch(self.m_Entity, cubeGeometry, self.material)}
+
+    def setEnabled(self, enabled):
+        if enabled == self.enabled:
+            return
+        self.enabled = enabled
+        if enabled and self.m_batches is None:
+            self.createBatches()
+
+        self.m_Entity.setEnabled(enabled)
+        for primitive in self.shapeEditor.primitives():
+            primitive.setEntityEnabled(not enabled or primitive is self.selected)
+        if not enabled:
+            self.shapeEditor.frustumCuller.reset()
+        self.markDirty()
+
+    def setSelected(self, primitive):
+        previous = self.selected
+        self.selected = primitive
+        if not self.enabled:
+            return
+        if previous is not None and previous is not primitive:
+            previous.setEntityEnabled(False)
+        if primitive is not None:
+            primitive.setEntityEnabled(True)
+        self.markDirty()
+
+    """
+    Schedules one instance buffer rebuild for the next event loop tick
+    """
+    def markDirty(self):
+        if not self.enabled or self.m_rebuildPending:
+            return
+        self.m_rebuildPending = True
+        QtCore.QTimer.singleShot(0, self.rebuild)
+
+    def primitiveAdded(self, primitive):
+        if self.enabled and primitive is not self.selected:
+            primitive.setEntityEnabled(False)
+        self.markDirty()
+
+    def rebuild(self):
+        self.m_rebuildPending = False
+        if not self.enabled:
+            return
+
+        model = self.shapeEditor.sceneModel
+        excluded = self.selected.slot if self.selected is not None else -1
+        for primitiveType, batch in self.m_batches.items():
+            slots = model.slotsOfType(primitiveType)
+            slots = slots[slots != excluded]
+            batch.setInstances(instanceData(model, slots), len(slots))
+
+    def drawCalls(self):
+        if not self.enabled:
+            return sum(1 for primitive in self.shapeEditor.primitives())
+        return 2 + (1 if self.selected is not None else 0)
+
+
+"""
+Per-instance attributes of the given model slots in InstanceBatch layout,
+built in one vectorized pass with world transforms
+"""
+def instanceData(model, slots):
+    dimensions = model.dimensions[slots]
+    if model.types[slots[:1]].tolist() == [TYPE_CODES['sphere']]:
+        dimensions = np.repeat(dimensions[:, :1], 3, axis=1)
+    return np.hstack([model.worldPositions(slots),
+                      model.worldRotations(slots),
+                      model.scales[slots] * dimensions,
+                      model.colors[slots, :3] / np.float32(255.0)]).astype(np.float32)
@@ -0,0 +1,119 @@
+import bisect
+import math
+import time
+from PySide2 import QtCore
+
+# rings and slices of each sphere level, coarse to fine
+LOD_LEVELS = (8, 16, 32, 64)
+# projected diameter in pixels above which the next finer level is used
+LOD_THRESHOLDS = (24.0, 96.0, 320.0)
+# fraction a threshold must be crossed by before switching, to avoid popping
+LOD_HYSTERESIS = 0.15
+VIEWPORT_HEIGHT = 800
+UPDATE_INTERVAL_MS = 100
+
+"""
+Picks sphere tessellation from projected screen-space size. Spheres are
+re-evaluated when the camera moves or spheres change, at most once per
+update interval. Meshes of each level come from the geometry cache, so
+spheres with the same radius and level share one mesh.
+"""
+class SphereLOD(QtCore.QObject):
+    def __init__(self, cameraEntity, shapeEditor, levels=LOD_LEVELS,
+                 thresholds=LOD_THRESHOLDS, hysteresis=LOD_HYSTERESIS):
+        super().__init__()
+        self.m_cameraEntity = cameraEntity
+        self.shapeEditor = shapeEditor
+        self.levels = levels
+        self.thresholds = thresholds
+        self.hysteresis = hysteresis
+        self.viewportHeight = VIEWPORT_HEIGHT
+        self.enabled = True
+        # finest rings and slices allowed, lowered by the quality governor
+        self.maxLevel = None
+        self.m_stats = {'switches': 0, 'last_update_ms': 0.0}
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(UPDATE_INTERVAL_MS)
+        self.timer.timeout.connect(self.update)
+
+        self.m_cameraEntity.viewMatrixChanged.connect(self.markDirty)
+        self.m_cameraEntity.projectionMatrixChanged.connect(self.markDirty)
+
+    def setEnabled(self, enabled):
+        self.enabled = enabled
+        self.markDirty()
+
+    def setViewportHeight(self, height):
+        self.viewportHeight = height
+        self.markDirty()
+
+    """
+    Caps the tessellation of every sphere at level, or lifts the cap when
+    level is None
+    """
+    def setMaxLevel(self, level):
+        self.maxLevel = level
+        self.markDirty()
+
+    def markDirty(self):
+        if not self.timer.isActive():
+            self.timer.start()
+
+    """
+    Diameter of sphere on screen in pixels
+    """
+    def projectedSize(self, sphere):
+        radius = sphere.boundingRadius()
+        distance = (sphere.worldPosition() - self.m_cameraEntity.position()).length()
+        if distance <= radius:
+            return float('inf')
+
+        halfFov = math.radians(self.m_cameraEntity.fieldOfView()) / 2.0
+        return radius / (distance * math.tan(halfFov)) * self.viewportHeight
+
+    """
+    Level for a sphere of the given projected size, moving away from the
+    current level only once a threshold is passed by the hysteresis margin
+    """
+    def chooseLevel(self, pixels, current):
+        if current not in self.levels:
+            return self.levels[bisect.bisect(self.thresholds, pixels)]
+
+        index = self.levels.index(current)
+        while index < len(self.levels) - 1 and \
+                pixels >= self.thresholds[index] * (1.0 + self.hysteresis):
+            index += 1
+        while index > 0 and pixels < self.thresholds[index - 1] * (1.0 - self.hysteresis):
+            index -= 1
+        return self.levels[index]
+
+    def update(self):
+        start = time.perf_counter()
+        for primitive in self.shapeEditor.primitives():
+            if primitive.primitiveType() != 'sphere':
+                continue
+            if self.enabled:
+                level = self.chooseLevel(self.projectedSize(primitive), primitive.tessellation())
+            else:
+                level = primitive.defaultTessellation()
+            if self.maxLevel is not None:
+                level = min(level, self.maxLevel)
+            if level != primitive.tessellation():
+                primitive.setTessellation(level)
+                self.m_stats['switches'] += 1
+        self.m_stats['last_update_ms'] = (time.perf_counter() - start) * 1000.0
+
+    """
+    Triangles submitted for all spheres at their current levels
+    """
+    def triangles(self):
+        return sum(2 * primitive.tessellation() * primitive.tessellation()
+                   for primitive in self.shapeEditor.primitives()
+                   if primitive.primitiveType() == 'sphere')
+
+    def stats(self):
+        stats = dict(self.m_stats)
+        stats['sphere_triangles'] = self.triangles()
+        return stats
@@ -0,0 +1,190 @@
+import sys
+import time
+from PySide2 import QtCore
+from Tracing import span
+
+FLUSH_INTERVAL_MS = 250
+RETRY_MAX_MS = 10000
+
+"""
+Write-behind queue for primitive persistence. Primitives are marked dirty
+instead of being written immediately; repeated updates to the same persist_id
+are coalesced and flushed in one batch on the write lane of the storage
+worker, which applies batches in order. A batch the store rejects is kept
+and retried with backoff on later flushes.
+"""
+class PersistenceQueue(QtCore.QObject):
+    flushed = QtCore.Signal(dict)
+
+    def __init__(self, worker, model=None, interval=FLUSH_INTERVAL_MS):
+        super().__init__()
+        self.worker = worker
+        self.model = model
+        self.m_dirty = {}
+        self.m_deleted = set()
+        self.m_retryUpdates = {}
+        self.m_retryDeleted = set()
+        self.m_retryDelay = 0
+        self.m_retryAt = 0.0
+        # number of the last submitted batch that wrote or deleted each id,
+        # kept until that batch is written
+        self.m_sequence = 0
+        self.m_lastBatch = {}
+
+        self.m_stats = {'requested': 0, 'written': 0, 'coalesced': 0,
+                        'deferred': 0, 'actions': 0, 'failed': 0,
+                        'flushes': 0, 'last_flush_ms': 0.0, 'max_flush_ms': 0.0}
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(interval)
+        self.timer.timeout.connect(self.flush)
+        self.timer.start()
+
+    def setInterval(self, interval):
+        self.timer.setInterval(interval)
+
+    """
+    Schedules primitive to be written on the next flush. A primitive
+    recreated under a persist_id pending deletion cancels the deletion.
+    """
+    def markDirty(self, primitive):
+        self.m_stats['requested'] += 1
+        self.m_deleted.discard(primitive.persist_id)
+        self.m_retryDeleted.discard(primitive.persist_id)
+        if primitive.persist_id in self.m_dirty:
+            self.m_stats['coalesced'] += 1
+        self.m_dirty[primitive.persist_id] = primitive
+
+    """
+    Counts a persist call absorbed by an open transaction
+    """
+    def noteDeferred(self):
+        self.m_stats['deferred'] += 1
+
+    """
+    Counts a committed user action, used to report writes per action
+    """
+    def noteAction(self):
+        self.m_stats['actions'] += 1
+
+    """
+    Schedules a stored record to be deleted on the next flush
+    """
+    def markDeleted(self, persist_id):
+        self.m_dirty.pop(persist_id, None)
+        self.m_retryUpdates.pop(persist_id, None)
+        self.m_deleted.add(persist_id)
+
+    def hasPending(self):
+        return bool(self.m_dirty or self.m_deleted or
+                    self.m_retryUpdates or self.m_retryDeleted)
+
+    """
+    Snapshots dirty primitives on the GUI thread and hands the batch to the worker
+    """
+    def flush(self):
+        if not self.hasPending() or time.monotonic() < self.m_retryAt:
+            return None
+
+        if self.model is not None:
+            # primitives in one vectorized pass; groups have no slot
+            dirty = [(key, item) for key, item in self.m_dirty.items() if item.slot is not None]
+            records = self.model.toRecords([item.slot for _, item in dirty])
+            updates = dict(zip((key for key, _ in dirty), records))
+            updates.update((key, item.toDict()) for key, item in self.m_dirty.items()
+                           if item.slot is None)
+        else:
+            updates = {persist_id: primitive.toDict()
+                       for persist_id, primitive in self.m_dirty.items()}
+        # a failed batch goes out again underneath anything newer
+        retry = self.m_retryUpdates
+        retry.update(updates)
+        updates = retry
+        deletions = self.m_retryDeleted | self.m_deleted
+        self.m_dirty = {}
+        self.m_deleted = set()
+        self.m_retryUpdates = {}
+        self.m_retryDeleted = set()
+
+        self.m_sequence += 1
+        sequence = self.m_sequence
+        self.m_lastBatch.update(dict.fromkeys(updates, sequence))
+        self.m_lastBatch.update(dict.fromkeys(deletions, sequence))
+        return self.worker.write(
+            self.runBatch, updates, deletions,
+            callback=lambda result: self.batchWritten(sequence, updates, deletions),
+            errback=lambda error: self.batchFailed(sequence, updates, deletions))
+
+    def runBatch(self, updates, deletions):
+        start = time.perf_counter()
+        with span('SceneStore.applyBatch'):
+            self.worker.store().applyBatch(updates, deletions)
+        elapsed = (time.perf_counter() - start) * 1000.0
+
+        self.m_stats['written'] += len(updates)
+        self.m_stats['flushes'] += 1
+        self.m_stats['last_flush_ms'] = elapsed
+        self.m_stats['max_flush_ms'] = max(self.m_stats['max_flush_ms'], elapsed)
+        self.flushed.emit(self.stats())
+
+    def batchWritten(self, sequence, updates, deletions):
+        self.m_retryDelay = 0
+        self.m_retryAt = 0.0
+        self.forgetBatch(sequence, updates, deletions)
+
+    def forgetBatch(self, sequence, updates, deletions):
+        for persist_id in (*updates, *deletions):
+            if self.m_lastBatch.get(persist_id) == sequence:
+                del self.m_lastBatch[persist_id]
+
+    """
+    Runs on the GUI thread when the store rejected a batch, possibly after
+    later batches were written. Entries that a later batch wrote or deleted,
+    or that newer edits still pending replace, are dropped; the rest are
+    queued for retry. Flushes back off exponentially up to RETRY_MAX_MS.
+    """
+    def batchFailed(self, sequence, updates, deletions):
+        self.m_stats['failed'] += 1
+        for persist_id, record in updates.items():
+            if self.m_lastBatch.get(persist_id) == sequence and \
+                    persist_id not in self.m_deleted and persist_id not in self.m_retryDeleted:
+                self.m_retryUpdates.setdefault(persist_id, record)
+        self.m_retryDeleted.update(persist_id for persist_id in deletions
+                                   if self.m_lastBatch.get(persist_id) == sequence and
+                                   persist_id not in self.m_dirty and
+                                   persist_id not in self.m_retryUpdates)
+        self.forgetBatch(sequence, updates, deletions)
+        self.m_retryDelay = min(max(self.m_retryDelay * 2, self.timer.interval()), RETRY_MAX_MS)
+        self.m_retryAt = time.monotonic() + self.m_retryDelay / 1000.0
+
+    """
+    Counters plus writes per action without transactions (every persist call)
+    and with them (calls that reached the queue)
+    """
+    def stats(self):
+        stats = dict(self.m_stats)
+        actions = max(stats['actions'], 1)
+        stats['persist_calls_per_action'] = (stats['requested'] + stats['deferred']) / actions
+        stats['writes_per_action'] = stats['requested'] / actions
+        return stats
+
+    """
+    Flushes everything still pending and waits for the storage worker to
+    write it. Connected to application exit. A batch that still fails is
+    tried once more directly and reported if it is lost.
+    """
+    def shutdown(self):
+        self.timer.stop()
+        self.m_retryAt = 0.0
+        self.flush()
+        self.worker.shutdown()
+        # deliver errbacks of batches that failed while draining
+        QtCore.QCoreApplication.sendPostedEvents(self.worker)
+        if not (self.m_retryUpdates or self.m_retryDeleted):
+            return
+        try:
+            self.worker.store().applyBatch(self.m_retryUpdates, self.m_retryDeleted)
+        except Exception as error:
+            print("Lost %d unsaved primitive changes: %s"
+                  % (len(self.m_retryUpdates) + len(self.m_retryDeleted), error),
+                  file=sys.stderr)
@@ -1,4 +1,5 @@
 from multiprocessing.sharedctypes import Value
+import functools
 import sys
 from PySide2 import QtWidgets, QtCore, QtGui
 from PySide2.Qt3DCore import Qt3DCore
@@ -20,6 +21,18 @@ def validate_float(text):
         return None
 
 
+"""
+ Sets the text of a line edit without emitting textChanged, so populating
+ the editor never writes back to the primitive.
+"""
+
+
+def set_text_silently(line_edit, text):
+    blocked = line_edit.blockSignals(True)
+    line_edit.setText(text)
+    line_edit.blockSignals(blocked)
+
+
 """
 A reusable widget that allows the user to edit a 3D vector
 """
@@ -63,9 +76,9 @@ class XYZEditorWidget(QtWidgets.QWidget):
     def populate_fields(self, vector, setVector):
         self.vector = vector
         self.setVector = setVector
-        self.X_edit.setText(str(round(self.vector.x(), 5)))
-        self.Y_edit.setText(str(round(self.vector.y(), 5)))
-        self.Z_edit.setText(str(round(self.vector.z(), 5)))
+        set_text_silently(self.X_edit, str(round(self.vector.x(), 5)))
+        set_text_silently(self.Y_edit, str(round(self.vector.y(), 5)))
+        set_text_silently(self.Z_edit, str(round(self.vector.z(), 5)))
 
     def x_changed(self, text):
         number = validate_float(text)
@@ -86,6 +99,80 @@ class XYZEditorWidget(QtWidgets.QWidget):
             self.setVector(self.vector)
 
 
+"""
+ Dialog for duplicating a primitive in a linear, grid or radial array,
+ optionally ramping the color of the copies towards an end color.
+"""
+
+
+class ArrayDialog(QtWidgets.QDialog):
+    def __init__(self, parent=None):
+        QtWidgets.QDialog.__init__(self, parent)
+        self.setWindowTitle("Array")
+        layout = QtWidgets.QFormLayout()
+        self.setLayout(layout)
+
+        self.pattern_box = QtWidgets.QComboBox()
+        self.pattern_box.addItems(["linear", "grid", "radial"])
+        layout.addRow("Pattern", self.pattern_box)
+
+        self.count_box = QtWidgets.QSpinBox()
+        self.count_box.setRange(1, 100000)
+        self.count_box.setValue(10)
+        layout.addRow("Copies", self.count_box)
+
+        self.step_boxes = []
+        step_widget = QtWidgets.QWidget()
+        step_layout = QtWidgets.QHBoxLayout()
+        step_layout.setContentsMargins(0, 0, 0, 0)
+        step_widget.setLayout(step_layout)
+        for axis, value in zip("XYZ", (3.0, 0.0, 3.0)):
+            box = QtWidgets.QDoubleSpinBox()
+            box.setRange(-10000.0, 10000.0)
+            box.setValue(value)
+            step_layout.addWidget(QtWidgets.QLabel(axis))
+            step_layout.addWidget(box)
+            self.step_boxes.append(box)
+        layout.addRow("Offset", step_widget)
+
+        self.columns_box = QtWidgets.QSpinBox()
+        self.columns_box.setRange(1, 10000)
+        self.columns_box.setValue(10)
+        layout.addRow("Grid columns", self.columns_box)
+
+        self.radius_box = QtWidgets.QDoubleSpinBox()
+        self.radius_box.setRange(0.0, 10000.0)
+        self.radius_box.setValue(10.0)
+        layout.addRow("Radial radius", self.radius_box)
+
+        self.ramp_box = QtWidgets.QCheckBox("Ramp color")
+        self.end_color = QtGui.QColor(QtCore.Qt.white)
+        self.end_color_button = QtWidgets.QPushButton()
+        self.end_color_button.setStyleSheet(f"background-color:{self.end_color.name()}")
+        self.end_color_button.clicked.connect(self.pick_end_color)
+        layout.addRow(self.ramp_box, self.end_color_button)
+
+        buttons = QtWidgets.QDialogButtonBox(
+            QtWidgets.QDialogButtonBox.Ok | QtWidgets.QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addRow(buttons)
+
+    def pick_end_color(self):
+        color = QtWidgets.QColorDialog.getColor(self.end_color, self)
+        if color.isValid():
+            self.end_color = color
+            self.end_color_button.setStyleSheet(f"background-color:{color.name()}")
+
+    def options(self):
+        options = {'step': tuple(box.value() for box in self.step_boxes),
+                   'columns': self.columns_box.value(),
+                   'radius': self.radius_box.value()}
+        if self.ramp_box.isChecked():
+            options['endColor'] = self.end_color.getRgb()
+        return self.pattern_box.currentText(), self.count_box.value(), options
+
+
 """
 The UI for editing a primitive objects fields
 """
@@ -105,6 +192,14 @@ class PrimitiveEditorWidget(QtWidgets.QWidget):
         self.deleteButton.clicked.connect(self.delete_primitive)
         layout.addWidget(self.deleteButton)
 
+        # array button
+        self.arrayButton = QtWidgets.QPushButton(self)
+        self.arrayButton.setText("Array...")
+        self.arrayButton.clicked.connect(self.open_array_dialog)
+        layout.addWidget(self.arrayButton)
+        self.array_dialog = ArrayDialog(self)
+        self.array_dialog.accepted.connect(self.create_array)
+
         # name field
         self.name_label = QtWidgets.QLabel("Name")
         layout.addWidget(self.name_label)
@@ -135,47 +230,58 @@ class PrimitiveEditorWidget(QtWidgets.QWidget):
         self.rotation_widget = XYZEditorWidget()
         layout.addWidget(self.rotation_widget)
 
-        self.listItem = None
         self.primitiveObject = None
 
-    def populate_fields(self, listItem, primitive):
-        self.listItem = listItem
+    def populate_fields(self, primitive):
         self.primitiveObject = primitive
 
-        self.name_edit_box.setText(primitive.name())
+        set_text_silently(self.name_edit_box, primitive.name())
         self.colorButton.setStyleSheet(
             f"background-color:{ primitive.color().name()}")
 
         self.transform_widget.populate_fields(
-            primitive.position(), primitive.setPosition)
+            primitive.position(), functools.partial(self.apply_edit, primitive.setPosition))
         self.rotation_widget.populate_fields(
-            primitive.rotation(), primitive.setRotation)
+            primitive.rotation(), functools.partial(self.apply_edit, primitive.setRotation))
+
+    """
+    Queues one user edit to the primitive. The update scheduler applies the
+    latest value of each field once per rendered frame, as one transaction.
+    """
+    def apply_edit(self, setter, *args):
+        self.primitiveObject.shapeEditor.updateScheduler.schedule(
+            self.primitiveObject, setter, *args)
 
     def delete_primitive(self):
 
         # TODO: if this is last primitive object,
         # app freezes until creating a new one
 
-        # delete from list widget
-        listView = self.listItem.listWidget()
-        item = listView.takeItem(listView.row(self.listItem))
-        item.sceneObject().remove()
+        # removing the primitive also drops its row from the object list
+        self.primitiveObject.remove()
 
         # hide this dialog until it is garbage collected
-        self.listItem = None
         self.primitiveObject = None
         self.hide()
 
+    def open_array_dialog(self):
+        self.array_dialog.open()
+
+    def create_array(self):
+        pattern, count, options = self.array_dialog.options()
+        shapeEditor = self.primitiveObject.shapeEditor
+        shapeEditor.createArray(self.primitiveObject, pattern, count, **options)
+
     def name_changed(self, text):
-        self.primitiveObject.setName(text)
-        self.listItem.setName(text)
+        with self.primitiveObject.transaction():
+            self.primitiveObject.setName(text)
 
     def open_color_dialog(self):
         self.color_dialog.open()
 
     def save_selected_color(self, new_color):
         self.colorButton.setStyleSheet(f"background-color:{new_color.name()}")
-        self.primitiveObject.setColor(new_color)
+        self.apply_edit(self.primitiveObject.setColor, new_color)
 
 
 class SphereEditorWidget(PrimitiveEditorWidget):
@@ -194,11 +300,11 @@ class SphereEditorWidget(PrimitiveEditorWidget):
     def radius_changed(self, text):
         num = validate_float(text)
         if num is not None:
-            self.primitiveObject.setRadius(num)
+            self.apply_edit(self.primitiveObject.setRadius, num)
 
-    def populate_fields(self, listItem, primitive):
-        super().populate_fields(listItem, primitive)
-        self.radius_edit.setText(str(round(self.primitiveObject.radius(), 5)))
+    def populate_fields(self, primitive):
+        super().populate_fields(primitive)
+        set_text_silently(self.radius_edit, str(round(self.primitiveObject.radius(), 5)))
         self.show()
 
 
@@ -229,24 +335,46 @@ class CubeEditorWidget(PrimitiveEditorWidget):
 
         self.setLayout(self.layout)
 
-    def populate_fields(self, listItem, primitive):
-        super().populate_fields(listItem, primitive)
-        self.length_edit.setText(str(round(self.primitiveObject.length(), 5)))
-        self.width_edit.setText(str(round(self.primitiveObject.width(), 5)))
-        self.height_edit.setText(str(round(self.primitiveObject.height(), 5)))
+    def populate_fields(self, primitive):
+        super().populate_fields(primitive)
+        set_text_silently(self.length_edit, str(round(self.primitiveObject.length(), 5)))
+        set_text_silently(self.width_edit, str(round(self.primitiveObject.width(), 5)))
+        set_text_silently(self.height_edit, str(round(self.primitiveObject.height(), 5)))
         self.show()
 
     def length_changed(self, text):
         num = validate_float(text)
         if num is not None:
-            self.primitiveObject.setLength(num)
+            self.apply_edit(self.primitiveObject.setLength, num)
 
     def width_changed(self, text):
         num = validate_float(text)
         if num is not None:
-            self.primitiveObject.setWidth(num)
+            self.apply_edit(self.primitiveObject.setWidth, num)
 
     def height_changed(self, text):
         num = validate_float(text)
         if num is not None:
-            self.primitiveObject.setHeight(num)
+            self.apply_edit(self.primitiveObject.setHeight, num)
+
+
+"""
+Edits a group. Position and rotation are relative to the enclosing group
+and move every member; deleting dissolves the group and keeps its members.
+"""
+class GroupEditorWidget(PrimitiveEditorWidget):
+    def __init__(self):
+        PrimitiveEditorWidget.__init__(self)
+        self.deleteButton.setText("Ungroup")
+        self.arrayButton.hide()
+
+        self.members_label = QtWidgets.QLabel()
+        self.layout.addWidget(self.members_label)
+
+        self.setLayout(self.layout)
+
+    def populate_fields(self, primitive):
+        super().populate_fields(primitive)
+        members = len(primitive.shapeEditor.groupMembers(primitive, nested=True))
+        self.members_label.setText(f"{members} members")
+        self.show()
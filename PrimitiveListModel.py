@@ -0,0 +1,270 @@
+import bisect
+from PySide2 import QtCore
+from SceneModel import TYPE_CODES
+
+# rows handed to the view per fetchMore call
+FETCH_BATCH = 1000
+PrimitiveRole = QtCore.Qt.UserRole + 1
+
+"""
+Sorted (lowercase name, persist_id) pairs answering name prefix queries in
+O(log n + matches). Kept current through Primitive.setName.
+"""
+class PrefixIndex:
+    def __init__(self):
+        self.m_entries = []
+
+    def __len__(self):
+        return len(self.m_entries)
+
+    def add(self, name, key):
+        bisect.insort(self.m_entries, (name.lower(), key))
+
+    def remove(self, name, key):
+        entry = (name.lower(), key)
+        position = bisect.bisect_left(self.m_entries, entry)
+        if position < len(self.m_entries) and self.m_entries[position] == entry:
+            del self.m_entries[position]
+
+    """
+    Removes (name, key) pairs in one pass over the entries
+    """
+    def removeMany(self, pairs):
+        if len(pairs) == 1:
+            self.remove(*pairs[0])
+            return
+        entries = {(name.lower(), key) for name, key in pairs}
+        self.m_entries = [entry for entry in self.m_entries if entry not in entries]
+
+    def rename(self, oldName, newName, key):
+        self.remove(oldName, key)
+        self.add(newName, key)
+
+    """
+    Keys of all names starting with prefix, in name order
+    """
+    def search(self, prefix):
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self.m_entries, (prefix,))
+        end = bisect.bisect_left(self.m_entries, (prefix + '\U0010ffff',))
+        return [key for _, key in self.m_entries[start:end]]
+
+
+"""
+Object list backed directly by the scene: rows are the primitives
+themselves and names are read from the scene model on demand, so no item
+object exists per primitive. Rows are exposed to the view in batches as it
+scrolls. A name prefix and type filter narrows the rows through the prefix
+index.
+"""
+class PrimitiveListModel(QtCore.QAbstractListModel):
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.m_primitives = []
+        self.m_byId = {}
+        self.m_rowOf = None
+        self.m_fetched = 0
+        self.m_names = PrefixIndex()
+        self.m_filterText = ''
+        self.m_filterType = None
+        self.m_filtered = None
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        if self.m_filtered is not None:
+            return len(self.m_filtered)
+        return self.m_fetched
+
+    def canFetchMore(self, parent=QtCore.QModelIndex()):
+        return self.m_filtered is None and self.m_fetched < len(self.m_primitives)
+
+    def fetchMore(self, parent=QtCore.QModelIndex()):
+        self.fetchTo(self.m_fetched + FETCH_BATCH)
+
+    def fetchTo(self, rows):
+        rows = min(rows, len(self.m_primitives))
+        if rows <= self.m_fetched:
+            return
+        self.beginInsertRows(QtCore.QModelIndex(), self.m_fetched, rows - 1)
+        self.m_fetched = rows
+        self.endInsertRows()
+
+    def rows(self):
+        return self.m_filtered if self.m_filtered is not None else self.m_primitives
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or index.row() >= self.rowCount():
+            return None
+        primitive = self.rows()[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return primitive.name()
+        if role == QtCore.Qt.ToolTipRole:
+            groups = primitive.ancestors()
+            if groups:
+                path = ' / '.join(group.name() for group in reversed(groups))
+                return f"{primitive.primitiveType()} in {path}"
+            return primitive.primitiveType()
+        if role == PrimitiveRole:
+            return primitive
+        return None
+
+    def primitiveAt(self, index):
+        if not index.isValid() or index.row() >= self.rowCount():
+            return None
+        return self.rows()[index.row()]
+
+    def primitive(self, persist_id):
+        return self.m_byId.get(persist_id)
+
+    def primitives(self):
+        return self.m_byId.values()
+
+    def __len__(self):
+        return len(self.m_primitives)
+
+    """
+    Row of primitive in the unfiltered list, rebuilt lazily after removals
+    """
+    def rowOf(self, primitive):
+        if self.m_rowOf is None:
+            self.m_rowOf = {p.persist_id: row for row, p in enumerate(self.m_primitives)}
+        return self.m_rowOf.get(primitive.persist_id)
+
+    """
+    Model index of primitive, fetching rows up to it if necessary. Invalid
+    when the primitive is filtered out.
+    """
+    def indexOf(self, primitive):
+        if self.m_filtered is not None:
+            try:
+                return self.index(self.m_filtered.index(primitive))
+            except ValueError:
+                return QtCore.QModelIndex()
+        row = self.rowOf(primitive)
+        if row is None:
+            return QtCore.QModelIndex()
+        self.fetchTo(row + 1)
+        return self.index(row)
+
+    """
+    Appends primitives in one go; while the view shows every row the first
+    batch is exposed right away, the rest on demand
+    """
+    def addPrimitives(self, primitives):
+        if not primitives:
+            return
+        start = len(self.m_primitives)
+        for primitive in primitives:
+            if self.m_rowOf is not None:
+                self.m_rowOf[primitive.persist_id] = len(self.m_primitives)
+            self.m_primitives.append(primitive)
+            self.m_byId[primitive.persist_id] = primitive
+            self.m_names.add(primitive.name(), primitive.persist_id)
+
+        if self.m_filtered is not None:
+            self.refilter()
+        elif self.m_fetched == start and start < FETCH_BATCH:
+            self.fetchTo(FETCH_BATCH)
+
+    def removePrimitive(self, primitive):
+        self.removePrimitives([primitive])
+
+    """
+    Removes primitives in one pass over the rows, telling the view about
+    each run of consecutive rows it has been shown
+    """
+    def removePrimitives(self, primitives):
+        removed = [primitive for primitive in primitives
+                   if self.m_byId.pop(primitive.persist_id, None) is not None]
+        if not removed:
+            return
+        self.m_names.removeMany([(primitive.name(), primitive.persist_id) for primitive in removed])
+        removed = set(removed)
+
+        if self.m_filtered is None:
+            self.removeRuns(self.m_primitives, removed, True)
+        else:
+            self.m_primitives = [primitive for primitive in self.m_primitives
+                                 if primitive not in removed]
+            self.removeRuns(self.m_filtered, removed, False)
+        self.m_rowOf = None
+
+    """
+    Deletes the primitives in removed from rows. Rows the view has been
+    shown go in runs of consecutive rows, last run first, the rest in one
+    pass. fetched tells that rows are the unfiltered rows, shown up to
+    m_fetched.
+    """
+    def removeRuns(self, rows, removed, fetched):
+        shown = self.m_fetched if fetched else len(rows)
+        if len(removed) == 1:
+            try:
+                row = rows.index(next(iter(removed)))
+            except ValueError:
+                return
+            runs = [[row, row + 1]] if row < shown else []
+            hidden = rows[shown:]
+            if row >= shown:
+                del hidden[row - shown]
+        else:
+            runs = []
+            for row, primitive in enumerate(rows[:shown]):
+                if primitive not in removed:
+                    continue
+                if runs and runs[-1][1] == row:
+                    runs[-1][1] = row + 1
+                else:
+                    runs.append([row, row + 1])
+            hidden = [primitive for primitive in rows[shown:] if primitive not in removed]
+
+        del rows[shown:]
+        for start, end in reversed(runs):
+            self.beginRemoveRows(QtCore.QModelIndex(), start, end - 1)
+            del rows[start:end]
+            if fetched:
+                self.m_fetched -= end - start
+            self.endRemoveRows()
+        rows.extend(hidden)
+
+    """
+    Called by a primitive whose name changed from oldName
+    """
+    def primitiveRenamed(self, primitive, oldName):
+        if primitive.persist_id not in self.m_byId:
+            return
+        self.m_names.rename(oldName, primitive.name(), primitive.persist_id)
+        if self.m_filtered is not None:
+            self.refilter()
+            return
+        row = self.rowOf(primitive)
+        if row < self.m_fetched:
+            index = self.index(row)
+            self.dataChanged.emit(index, index, [QtCore.Qt.DisplayRole])
+
+    """
+    Shows only primitives whose name starts with text and, unless
+    primitiveType is None, that are of that type
+    """
+    def setFilter(self, text, primitiveType=None):
+        self.m_filterText = text
+        self.m_filterType = primitiveType
+        self.refilter()
+
+    def refilter(self):
+        self.beginResetModel()
+        if not self.m_filterText and self.m_filterType is None:
+            self.m_filtered = None
+            self.m_fetched = min(len(self.m_primitives), max(self.m_fetched, FETCH_BATCH))
+        else:
+            primitives = [self.m_byId[key] for key in self.m_names.search(self.m_filterText)]
+            if self.m_filterType == 'group':
+                # groups have no scene model slot
+                primitives = [primitive for primitive in primitives if primitive.slot is None]
+            elif self.m_filterType is not None:
+                code = TYPE_CODES[self.m_filterType]
+                primitives = [primitive for primitive in primitives
+                              if primitive.slot is not None and
+                              primitive.model.types[primitive.slot] == code]
+            self.m_filtered = primitives
+        self.endResetModel()
@@ -1,42 +1,137 @@
+import contextlib
 import json
+import math
 import sys
 from PySide2 import QtWidgets, QtCore, QtGui
 from PySide2.Qt3DCore import Qt3DCore
 from PySide2.Qt3DExtras import Qt3DExtras
 from PySide2.Qt3DRender import Qt3DRender
 from PySide2.Qt3DInput import Qt3DInput
-from pysondb import db
-
-
-PRIMITIVE_OBJECTS = "primitive_objects.json"
+from SceneStore import newId, PRIMITIVE_OBJECTS
+from GeometryCache import SPHERE_RINGS
+from SceneModel import BASE_SCALES
 
 """
-Represents a generic namable, colorable three-dimensional primitive object
+Represents a generic namable, colorable three-dimensional primitive object.
+State lives in the editor's SceneModel; the primitive is a view onto its
+slot that pushes changes to its Qt3D components. A slot already filled in
+by a bulk load can be passed in to build the primitive from it. The Qt3D
+entity only exists while the primitive is materialized, which the entity
+pager decides.
 """
 class Primitive(QtCore.QObject):
-    def __init__(self, root_entity, cameraEntity, shapeEditor, persist_id=None):
+    def __init__(self, root_entity, cameraEntity, shapeEditor, persist_id=None, slot=None):
         super().__init__()
         self.m_rootEntity = root_entity
         self.m_cameraEntity = cameraEntity
-        self.m_Entity = Qt3DCore.QEntity(self.m_rootEntity)
-        self.persist_id = persist_id
-        self.m_displayName = 'Primitive Object'
+        self.m_Entity = None
+        self.transform = None
+        self.m_material = None
         self.shapeEditor = shapeEditor
+        self.model = shapeEditor.sceneModel
+        self.isPreloaded = slot is not None
+        self.slot = slot if self.isPreloaded else self.model.allocate(self.primitiveType())
+        self.persist_id = persist_id
+        self.m_transactionDepth = 0
+        self.m_transactionDirty = False
+        self.geometryCache = shapeEditor.geometryCache
+
+        if not self.isPreloaded:
+            viewCenter = self.m_cameraEntity.viewCenter()
+            self.model.positions[self.slot] = (viewCenter.x(), viewCenter.y(), viewCenter.z())
+            self.model.colors[self.slot] = QtGui.QColor(QtCore.Qt.gray).getRgb()
+            self.model.names[self.slot] = 'Primitive Object'
+        self.model.scales[self.slot] = BASE_SCALES[self.primitiveType()]
 
-        self.m_material = Qt3DExtras.QPhongMaterial(
-            diffuse=QtGui.QColor(QtCore.Qt.gray))
+    def isMaterialized(self):
+        return self.m_Entity is not None
+
+    """
+    Creates the Qt3D entity and its components from the slot
+    """
+    def materialize(self):
+        if self.m_Entity is not None:
+            return
+        x, y, z, w = self.model.rotations[self.slot].tolist()
+        self.m_Entity = Qt3DCore.QEntity(self.parentEntity())
+        self.m_material = self.geometryCache.material(self.color())
         self.transform = Qt3DCore.QTransform(
-            scale=1.3, translation=self.m_cameraEntity.viewCenter(),
+            translation=self.position(), rotation=QtGui.QQuaternion(w, x, y, z),
+            scale3D=QtGui.QVector3D(*self.model.scales[self.slot].tolist()),
         )
         self.m_Entity.addComponent(self.m_material)
         self.m_Entity.addComponent(self.transform)
+        self.m_Entity.addComponent(self.acquireMesh())
 
-        self.picker = Qt3DRender.QObjectPicker()
-        self.picker.setHoverEnabled(True)
-        self.picker.setDragEnabled(True)
-        self.picker.clicked.connect(self.primitiveClicked)
-        self.m_Entity.addComponent(self.picker)
-    
+    """
+    Deletes the Qt3D entity, returning shared components to the cache. The
+    primitive keeps its state in the scene model.
+    """
+    def dematerialize(self):
+        if self.m_Entity is None:
+            return
+        self.geometryCache.release(self.releaseMesh())
+        self.m_Entity.removeComponent(self.m_material)
+        self.geometryCache.release(self.m_material)
+        self.m_Entity.setParent(None)
+        self.m_Entity.deleteLater()
+        self.m_Entity = None
+        self.transform = None
+        self.m_material = None
+
+    def setEntityEnabled(self, enabled):
+        if self.m_Entity is not None:
+            self.m_Entity.setEnabled(enabled)
+
+    """
+    Entity of the enclosing group, or the root entity
+    """
+    def parentEntity(self):
+        return self.shapeEditor.groupEntity(int(self.model.parents[self.slot]))
+
+    def group(self):
+        return self.shapeEditor.groupAt(int(self.model.parents[self.slot]))
+
+    """
+    Enclosing groups, innermost first
+    """
+    def ancestors(self):
+        group = self.group()
+        return [group] + group.ancestors() if group is not None else []
+
+    """
+    World matrix of the primitive computed from the scene model, valid
+    whether or not it is materialized
+    """
+    def worldMatrix(self):
+        x, y, z, w = self.model.rotations[self.slot].tolist()
+        group = self.group()
+        matrix = group.worldMatrix() if group is not None else QtGui.QMatrix4x4()
+        matrix.translate(self.position())
+        matrix.rotate(QtGui.QQuaternion(w, x, y, z))
+        matrix.scale(QtGui.QVector3D(*self.model.scales[self.slot].tolist()))
+        return matrix
+
+    """
+    Position in the world, which differs from position() inside a group
+    """
+    def worldPosition(self):
+        if self.model.parents[self.slot] < 0:
+            return self.position()
+        return QtGui.QVector3D(*self.model.worldPositions([self.slot])[0].tolist())
+
+    @property
+    def persist_id(self):
+        return self.m_persistId
+
+    @persist_id.setter
+    def persist_id(self, persist_id):
+        self.m_persistId = persist_id
+        self.model.ids[self.slot] = persist_id or 0
+
+    """
+    Called by the pick dispatcher when a ray from the view hits this object
+    """
     def primitiveClicked(self):
         self.shapeEditor.handleClickedPrimitive(self)
 
@@ -44,46 +139,118 @@ class Primitive(QtCore.QObject):
     Deletes 3D object and removes it from the database
     """
     def remove(self):
-        database = db.getDb(PRIMITIVE_OBJECTS)
-        if self.persist_id:
-            database.deleteById(self.persist_id)
-
-        self.m_Entity.removeComponent(self.m_material)
-        self.deleteLater()
+        self.shapeEditor.removePrimitives([self])
 
     def setRotation(self, vector, doPersist=True):
         quat = QtGui.QQuaternion.fromEulerAngles(vector)
-        self.transform.setRotation(quat)
+        self.model.rotations[self.slot] = (quat.x(), quat.y(), quat.z(), quat.scalar())
+        if self.transform is not None:
+            self.transform.setRotation(quat)
+        self.boundsChanged()
         self.persist(doPersist)
     
     def setPosition(self, vector, doPersist=True):
-        self.transform.setTranslation(vector)
+        self.model.positions[self.slot] = (vector.x(), vector.y(), vector.z())
+        if self.transform is not None:
+            self.transform.setTranslation(vector)
+        self.boundsChanged()
         self.persist(doPersist)
 
+    """
+    Sets the uniform base scale of the shape. Not persisted.
+    """
+    def setScale(self, scale):
+        self.model.scales[self.slot] = scale
+        if self.transform is not None:
+            self.transform.setScale(scale)
+        self.boundsChanged()
+
+    def boundsChanged(self):
+        self.shapeEditor.primitiveMoved(self)
+
+    def maxScale(self):
+        return float(self.model.scales[self.slot].max())
+
     def setColor(self, color, doPersist=True):
-        self.m_material.setDiffuse(color)
+        self.model.colors[self.slot] = color.getRgb()
+        if self.m_Entity is not None:
+            self.m_material = self.geometryCache.swap(
+                self.m_Entity, self.m_material, self.geometryCache.material(color))
         self.persist(doPersist)
 
     def setName(self, name, doPersist=True):
-        self.m_displayName = name
+        oldName = self.model.names[self.slot]
+        self.model.names[self.slot] = name
+        self.shapeEditor.primitiveRenamed(self, oldName)
         self.persist(doPersist)
 
     def color(self):
-        return self.m_material.diffuse()
+        return QtGui.QColor(*self.model.colors[self.slot].tolist())
     
     def name(self):
-        return self.m_displayName
+        return self.model.names[self.slot]
 
     def position(self):
-        return self.transform.translation()
+        return QtGui.QVector3D(*self.model.positions[self.slot].tolist())
     
     def rotation(self):
-        return self.transform.rotation().toEulerAngles()
+        x, y, z, w = self.model.rotations[self.slot].tolist()
+        return QtGui.QQuaternion(w, x, y, z).toEulerAngles()
+
+    """
+    Pushes the slot's state to the Qt3D components after the model arrays
+    were written directly, as bulk operations do, including the group the
+    slot belongs to. Not persisted.
+    """
+    def syncToQt(self):
+        if self.m_Entity is None:
+            return
+        self.m_Entity.setParent(self.parentEntity())
+        x, y, z, w = self.model.rotations[self.slot].tolist()
+        self.transform.setTranslation(self.position())
+        self.transform.setRotation(QtGui.QQuaternion(w, x, y, z))
+        self.transform.setScale3D(QtGui.QVector3D(*self.model.scales[self.slot].tolist()))
+        self.m_material = self.geometryCache.swap(
+            self.m_Entity, self.m_material, self.geometryCache.material(self.color()))
+
+    """
+    Persisted fields of the slot, see SceneModel.fields
+    """
+    def fields(self):
+        return self.model.fields(self.slot)
+
+    """
+    Moves the primitive into group, None for the top level, keeping its
+    place in the world
+    """
+    def setParentGroup(self, group, doPersist=True):
+        self.model.setParents([self.slot], group.index if group is not None else -1)
+        self.syncToQt()
+        self.boundsChanged()
+        self.persist(doPersist)
+
+    """
+    Writes persisted fields (see SceneModel.setFields) to the slot and the
+    Qt3D components, used by undo and redo
+    """
+    def applyFields(self, fields):
+        oldName = self.name()
+        self.model.setFields(self.slot, fields)
+        self.syncToQt()
+        self.boundsChanged()
+        if 'name' in fields:
+            self.shapeEditor.primitiveRenamed(self, oldName)
+        self.persist(True)
 
     """
     Restore object from a serialized representation
     """
     def restore(self, json_dict):
+        # restore group membership; the group record may arrive later
+        parent = json_dict.get('parent')
+        if parent:
+            self.model.parents[self.slot] = self.shapeEditor.groupFor(parent).index
+
         # restore position
         xyz_dict = json_dict['position']
         vector = QtGui.QVector3D(xyz_dict['x'], xyz_dict['y'], xyz_dict['z'])
@@ -97,35 +264,67 @@ class Primitive(QtCore.QObject):
         # restore color
         color_str = json_dict['color']
         self.setColor(QtGui.QColor(color_str), False)
+        group = self.group()
+        if group is not None:
+            group.applyColorTo(self)
 
         self.setName(json_dict['name'], False)
     
     """
-    Persist object fields and save to local storage
+    Groups property changes so the primitive is persisted once, when the
+    outermost transaction commits
+    """
+    @contextlib.contextmanager
+    def transaction(self):
+        self.beginTransaction()
+        try:
+            yield self
+        finally:
+            self.commitTransaction()
+
+    def beginTransaction(self):
+        if self.m_transactionDepth == 0:
+            self.m_undoFields = self.fields()
+        self.m_transactionDepth += 1
+
+    def commitTransaction(self):
+        self.m_transactionDepth -= 1
+        if self.m_transactionDepth > 0:
+            return
+
+        self.shapeEditor.undoStack.recordEdit(self, self.m_undoFields)
+        self.shapeEditor.noteAction()
+        if self.m_transactionDirty:
+            self.m_transactionDirty = False
+            self.persist(True)
+            self.shapeEditor.primitiveChanged(self)
+
+    """
+    Persist object fields and save to local storage. New objects get their
+    id here and, like updates, are queued and written behind by the storage
+    worker. Inside a transaction the write is deferred until commit.
     """
     def persist(self, doPersist):
         if not doPersist:
             return 
 
-        object_dict = self.toDict()
-        database = db.getDb(PRIMITIVE_OBJECTS)
-
-        if self.persist_id == None:
-            id = database.add(object_dict)
-            self.persist_id = id
-        else:
-            database.updateById(self.persist_id, object_dict)
+        if self.persist_id is None:
+            # the store upserts, so the first queued write adds the record
+            self.persist_id = newId()
+        if self.m_transactionDepth > 0:
+            self.m_transactionDirty = True
+            self.shapeEditor.persistenceQueue.noteDeferred()
+            return
+        if self.shapeEditor.deferPersist(self):
+            return
+
+        self.shapeEditor.persistenceQueue.markDirty(self)
     
     """
     Serialized representation of object
     """ 
     def toDict(self):
-        translation = self.transform.translation()
-        rotation = self.transform.rotation().toEulerAngles()
-        return {'name': self.m_displayName,
-                'position': {'x': translation.x(), 'y': translation.y(), 'z': translation.z()},
-                'rotation': {'x': rotation.x(), 'y': rotation.y(), 'z': rotation.z()},
-                'color': self.m_material.diffuse().name()}
+        return self.model.toRecords([self.slot])[0]
 
 """
 Represents a spherical 3D object
@@ -133,35 +332,71 @@ Represents a spherical 3D object
 class Sphere(Primitive):
     sphereTag = 1
 
-    def __init__(self, root_entity, cameraEntity, shapeEditor, persist_id=None):
-        super().__init__(root_entity, cameraEntity, shapeEditor, persist_id)
-
-        self.sphereMesh = Qt3DExtras.QSphereMesh(
-            rings=20, slices=20, radius=2)
+    def __init__(self, root_entity, cameraEntity, shapeEditor, persist_id=None, slot=None):
+        super().__init__(root_entity, cameraEntity, shapeEditor, persist_id, slot)
 
-        self.m_Entity.addComponent(self.sphereMesh)
-        self.m_displayName = f'Sphere {Sphere.sphereTag}'
+        self.m_tessellation = self.defaultTessellation()
+        if not self.isPreloaded:
+            self.model.dimensions[self.slot] = (2.0, 0.0, 0.0)
+            self.model.names[self.slot] = f'Sphere {Sphere.sphereTag}'
+        self.sphereMesh = None
 
         if persist_id is None:
             self.persist(True)
 
         Sphere.sphereTag += 1
     
-    def toDict(self):
-        object_dict = super().toDict()
-        object_dict['type'] = 'sphere'
-        object_dict['primitive_specific'] = {'radius': self.sphereMesh.radius()}
-        return object_dict
-    
     def radius(self):
-        return self.sphereMesh.radius()
+        return float(self.model.dimensions[self.slot][0])
 
     def primitiveType(self):
         return 'sphere'
-    
+
+    def boundingRadius(self):
+        return self.radius() * self.maxScale()
+
+    def tessellation(self):
+        return self.m_tessellation
+
+    def defaultTessellation(self):
+        return SPHERE_RINGS
+
+    """
+    Switches to the shared mesh with the given rings and slices, used by the
+    level of detail manager. Not persisted.
+    """
+    def setTessellation(self, level):
+        if level == self.m_tessellation:
+            return
+        self.m_tessellation = level
+        self.updateMesh()
+
+    def acquireMesh(self):
+        self.sphereMesh = self.geometryCache.sphereMesh(
+            self.radius(), self.m_tessellation, self.m_tessellation)
+        return self.sphereMesh
+
+    def releaseMesh(self):
+        mesh, self.sphereMesh = self.sphereMesh, None
+        self.m_Entity.removeComponent(mesh)
+        return mesh
+
+    def updateMesh(self):
+        if self.m_Entity is None:
+            return
+        self.sphereMesh = self.geometryCache.swap(
+            self.m_Entity, self.sphereMesh,
+            self.geometryCache.sphereMesh(self.radius(), self.m_tessellation, self.m_tessellation))
+
     def setRadius(self, radius, doPersist=True):
-        self.sphereMesh.setRadius(radius)
+        self.model.dimensions[self.slot] = (radius, 0.0, 0.0)
+        self.updateMesh()
+        self.boundsChanged()
         self.persist(doPersist)
+
+    def syncToQt(self):
+        super().syncToQt()
+        self.updateMesh()
     
     def restore(self, json_dict):
         super().restore(json_dict)
@@ -175,55 +410,72 @@ Represents a cubical 3D object
 class Cube(Primitive):
     cubeTag = 1
 
-    def __init__(self, root_entity, cameraEntity, shapeEditor, persist_id=None):
-        super().__init__(root_entity, cameraEntity, shapeEditor, persist_id)
-        self.cuboid = Qt3DExtras.QCuboidMesh()
-
-        self.m_Entity.addComponent(self.cuboid)
-        self.m_displayName = f'Cube {Cube.cubeTag}'
-        self.transform.setScale(4.0)
+    def __init__(self, root_entity, cameraEntity, shapeEditor, persist_id=None, slot=None):
+        super().__init__(root_entity, cameraEntity, shapeEditor, persist_id, slot)
+        if not self.isPreloaded:
+            self.model.dimensions[self.slot] = (1.0, 1.0, 1.0)
+            self.model.names[self.slot] = f'Cube {Cube.cubeTag}'
+        self.cuboid = None
+        self.setScale(BASE_SCALES['cube'])
 
         if persist_id is None:
             self.persist(True)
 
         Cube.cubeTag += 1
 
-    def toDict(self):
-        object_dict = super().toDict()
-        object_dict['type'] = 'cube'
-        object_dict['primitive_specific'] = {
-            'length': self.cuboid.xExtent(),
-            'width': self.cuboid.zExtent(),
-            'height': self.cuboid.yExtent()}
-        return object_dict
-    
     def restore(self, json_dict):
         super().restore(json_dict)
         cubeInfo = json_dict['primitive_specific']
-        self.setLength(cubeInfo['length'], False)
-        self.setWidth(cubeInfo['width'], False)
-        self.setHeight(cubeInfo['height'], False)
+        self.setExtents(cubeInfo['length'], cubeInfo['height'],
+                        cubeInfo['width'], False)
 
     def primitiveType(self):
         return 'cube'
 
+    def acquireMesh(self):
+        self.cuboid = self.geometryCache.cuboidMesh(self.length(), self.height(), self.width())
+        return self.cuboid
+
+    def releaseMesh(self):
+        mesh, self.cuboid = self.cuboid, None
+        self.m_Entity.removeComponent(mesh)
+        return mesh
+
+    def updateMesh(self):
+        if self.m_Entity is None:
+            return
+        self.cuboid = self.geometryCache.swap(
+            self.m_Entity, self.cuboid,
+            self.geometryCache.cuboidMesh(self.length(), self.height(), self.width()))
+
+    def syncToQt(self):
+        super().syncToQt()
+        self.updateMesh()
+
+    def boundingRadius(self):
+        diagonal = math.sqrt(self.length() ** 2 + self.height() ** 2 + self.width() ** 2)
+        return diagonal / 2.0 * self.maxScale()
+
     def length(self):
-        return self.cuboid.xExtent()
+        return float(self.model.dimensions[self.slot][0])
     
     def width(self):
-        return self.cuboid.zExtent()
+        return float(self.model.dimensions[self.slot][2])
     
     def height(self):
-        return self.cuboid.yExtent()
+        return float(self.model.dimensions[self.slot][1])
     
     def setLength(self, length, doPersist=True):
-        self.cuboid.setXExtent(length)
-        self.persist(doPersist)
+        self.setExtents(length, self.height(), self.width(), doPersist)
 
     def setWidth(self, length, doPersist=True):
-        self.cuboid.setZExtent(length)
-        self.persist(doPersist)
+        self.setExtents(self.length(), self.height(), length, doPersist)
 
     def setHeight(self, length, doPersist=True):
-        self.cuboid.setYExtent(length)
+        self.setExtents(self.length(), length, self.width(), doPersist)
+
+    def setExtents(self, xExtent, yExtent, zExtent, doPersist=True):
+        self.model.dimensions[self.slot] = (xExtent, yExtent, zExtent)
+        self.updateMesh()
+        self.boundsChanged()
         self.persist(doPersist)
\ No newline at end of file
@@ -0,0 +1,187 @@
+import collections
+import statistics
+import time
+from PySide2 import QtCore, QtGui, QtWidgets
+from PySide2.Qt3DLogic import Qt3DLogic
+from PySide2.Qt3DRender import Qt3DRender
+from LevelOfDetail import LOD_LEVELS
+
+# median frame time above which quality steps down, and below which it steps back up
+DEGRADE_FRAME_MS = 1000.0 / 30.0
+RECOVER_FRAME_MS = 1000.0 / 50.0
+# frames in the median, and time a tier is kept before the next step
+FRAME_WINDOW = 30
+SETTLE_MS = 1000
+# rendering switches to on demand after this long without input
+IDLE_MS = 2000
+STATS_INTERVAL_MS = 500
+
+# sphere rings and slices from the first degraded tier on
+DEGRADED_SPHERE_LEVEL = LOD_LEVELS[0]
+TIER_NAMES = ('full', 'coarse spheres', 'no hover picking', 'bounds picking')
+
+INPUT_EVENTS = (QtCore.QEvent.MouseButtonPress, QtCore.QEvent.MouseButtonRelease,
+                QtCore.QEvent.MouseMove, QtCore.QEvent.Wheel, QtCore.QEvent.KeyPress,
+                QtCore.QEvent.Resize, QtCore.QEvent.Expose)
+
+"""
+Keeps the editor at frame rate. Frame times come from a QFrameAction. When
+the median over the last frames exceeds degradeMs, quality steps down one
+tier: coarse spheres, then no hover picking, then picking against bounding
+volumes only. Once the median falls below recoverMs, quality steps back up
+one tier. Each step is held for SETTLE_MS before the next, so one step's
+effect is measured before another is taken. Without input for idleMs the
+view renders on demand, only when the scene changes; frames rendered then
+are not counted.
+"""
+class QualityGovernor(QtCore.QObject):
+    changed = QtCore.Signal(dict)
+
+    def __init__(self, view, rootEntity, cameraEntity, shapeEditor, pickDispatcher,
+                 degradeMs=DEGRADE_FRAME_MS, recoverMs=RECOVER_FRAME_MS, idleMs=IDLE_MS):
+        super().__init__()
+        self.view = view
+        self.shapeEditor = shapeEditor
+        self.pickDispatcher = pickDispatcher
+        # hover picking is only ever turned off, never on against the setting
+        self.m_hoverEnabled = pickDispatcher.hoverEnabled
+        self.degradeMs = degradeMs
+        self.recoverMs = recoverMs
+        self.enabled = True
+        self.tier = 0
+        self.onDemand = False
+        self.m_frames = collections.deque(maxlen=FRAME_WINDOW)
+        # the first frame after rendering resumes spans the idle time
+        self.m_skipFrames = 1
+        self.m_lastStep = time.perf_counter()
+        self.m_cpu = (time.perf_counter(), time.process_time())
+        self.m_stats = {'steps_down': 0, 'steps_up': 0, 'idle_switches': 0,
+                        'frame_ms': 0.0, 'cpu_percent': 0.0}
+
+        self.frameAction = Qt3DLogic.QFrameAction(rootEntity)
+        rootEntity.addComponent(self.frameAction)
+        self.frameAction.triggered.connect(self.recordFrame)
+
+        self.idleTimer = QtCore.QTimer(self)
+        self.idleTimer.setSingleShot(True)
+        self.idleTimer.setInterval(idleMs)
+        self.idleTimer.timeout.connect(self.goIdle)
+        self.idleTimer.start()
+
+        self.statsTimer = QtCore.QTimer(self)
+        self.statsTimer.setInterval(STATS_INTERVAL_MS)
+        self.statsTimer.timeout.connect(self.sample)
+        self.statsTimer.start()
+
+        view.installEventFilter(self)
+        cameraEntity.viewMatrixChanged.connect(self.markActive)
+
+    """
+    Turns the governor off and restores full quality and continuous
+    rendering, or back on
+    """
+    def setEnabled(self, enabled):
+        self.enabled = enabled
+        if not enabled:
+            self.setTier(0)
+        self.markActive()
+
+    def setThresholds(self, degradeMs, recoverMs):
+        self.degradeMs = degradeMs
+        self.recoverMs = recoverMs
+        self.m_frames.clear()
+
+    def eventFilter(self, watched, event):
+        if event.type() in INPUT_EVENTS:
+            self.markActive()
+        return False
+
+    """
+    Renders continuously again and restarts the idle countdown
+    """
+    def markActive(self):
+        if self.onDemand:
+            self.onDemand = False
+            self.m_skipFrames = 1
+            self.view.renderSettings().setRenderPolicy(Qt3DRender.QRenderSettings.Always)
+        if self.enabled:
+            self.idleTimer.start()
+
+    def goIdle(self):
+        if not self.enabled:
+            return
+        self.onDemand = True
+        self.m_frames.clear()
+        self.m_stats['idle_switches'] += 1
+        self.view.renderSettings().setRenderPolicy(Qt3DRender.QRenderSettings.OnDemand)
+
+    def recordFrame(self, dt):
+        if self.onDemand or not self.enabled:
+            return
+        if self.m_skipFrames:
+            self.m_skipFrames -= 1
+            return
+        self.m_frames.append(dt * 1000.0)
+        if len(self.m_frames) < FRAME_WINDOW:
+            return
+        if (time.perf_counter() - self.m_lastStep) * 1000.0 < SETTLE_MS:
+            return
+
+        frameMs = statistics.median(self.m_frames)
+        if frameMs > self.degradeMs and self.tier < len(TIER_NAMES) - 1:
+            self.m_stats['steps_down'] += 1
+            self.setTier(self.tier + 1)
+        elif frameMs < self.recoverMs and self.tier > 0:
+            self.m_stats['steps_up'] += 1
+            self.setTier(self.tier - 1)
+
+    """
+    Applies the settings of tier; every tier includes the reductions of the
+    tiers before it
+    """
+    def setTier(self, tier):
+        self.tier = tier
+        self.m_lastStep = time.perf_counter()
+        self.m_frames.clear()
+        self.shapeEditor.sphereLod.setMaxLevel(DEGRADED_SPHERE_LEVEL if tier >= 1 else None)
+        self.pickDispatcher.setHoverEnabled(self.m_hoverEnabled and tier < 2)
+        self.pickDispatcher.setExact(tier < 3)
+        self.changed.emit(self.stats())
+
+    """
+    Updates frame time and CPU use, the share of one core used by this
+    process since the last sample
+    """
+    def sample(self):
+        wall, cpu = time.perf_counter(), time.process_time()
+        previousWall, previousCpu = self.m_cpu
+        self.m_cpu = (wall, cpu)
+        if wall > previousWall:
+            self.m_stats['cpu_percent'] = (cpu - previousCpu) / (wall - previousWall) * 100.0
+        if self.m_frames:
+            self.m_stats['frame_ms'] = statistics.median(self.m_frames)
+        self.changed.emit(self.stats())
+
+    def stats(self):
+        stats = dict(self.m_stats)
+        stats['tier'] = self.tier
+        stats['tier_name'] = TIER_NAMES[self.tier]
+        stats['on_demand'] = self.onDemand
+        return stats
+
+
+"""
+One line summary of the governor: frame time, quality tier and CPU use
+"""
+class QualityOverlay(QtWidgets.QLabel):
+    def __init__(self, governor):
+        QtWidgets.QLabel.__init__(self)
+        self.setFont(QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont))
+        self.setStyleSheet("background-color: rgba(0, 0, 0, 160); color: white; padding: 2px;")
+        governor.changed.connect(self.refresh)
+        self.refresh(governor.stats())
+
+    def refresh(self, stats):
+        frame = "idle" if stats['on_demand'] else f"{stats['frame_ms']:5.1f} ms"
+        self.setText(f"{frame} | tier {stats['tier']} {stats['tier_name']} | "
+                     f"CPU {stats['cpu_percent']:3.0f}%")
@@ -1,12 +1,38 @@
+import argparse
+import contextlib
+import os
 import sys
+import numpy as np
 from PySide2 import QtWidgets, QtCore, QtGui
 from PySide2.Qt3DCore import Qt3DCore
 from PySide2.Qt3DExtras import Qt3DExtras
 from PySide2.Qt3DRender import Qt3DRender
 from PySide2.Qt3DInput import Qt3DInput
 from Primitives import *
+from Groups import Group
 from PrimitiveEditorWidgets import *
-from PrimitiveListItems import *
+from PrimitiveListModel import PrimitiveListModel
+from PersistenceQueue import PersistenceQueue
+from StorageWorker import StorageWorker
+from SceneStore import closeStore, newId
+from SceneLoader import SceneLoader
+from GeometryCache import GeometryCache
+from InstancedRenderer import InstancedRenderer
+from StaticBatching import StaticBatcher
+from LevelOfDetail import SphereLOD
+from SpatialIndex import BVH, FrustumCuller, PickDispatcher
+from QualityGovernor import (QualityGovernor, QualityOverlay, DEGRADE_FRAME_MS,
+                             RECOVER_FRAME_MS, IDLE_MS)
+from SceneModel import SceneModel, TYPE_CODES
+from ArrayModifier import arrayLayout
+from UndoStack import UndoStack
+from UpdateScheduler import UpdateScheduler
+from EntityPager import EntityPager
+from SceneFile import SCENE_BINARY, sceneColumns, writeScene
+from Tracing import TRACE_ENV, enableTracing, activeTracer, TraceStatsPanel
+
+# background of the 3D view
+CLEAR_COLOR = "#4d4d4f"
 
 # SOURCES: Anything besides QT documentation listed here
 # https://www.tutorialspoint.com/pyqt/pyqt_qstackedwidget.htm
@@ -22,82 +48,493 @@ from PrimitiveListItems import *
 Handles creating primitive objects and connecting them to UI
 """
 class ShapeEditor(QtCore.QObject):
-    def __init__(self, rootEntity, cameraEntity, objectListWidget, stackedLayout):
+    # a storage read or write failed; failed writes are retried
+    storageFailed = QtCore.Signal(str)
+
+    def __init__(self, rootEntity, cameraEntity, objectListView, stackedLayout):
         super().__init__()
         self.stackedLayout = stackedLayout
         self.m_rootEntity = rootEntity
         self.m_cameraEntity = cameraEntity
-        self.m_objectListWidget = objectListWidget
-
-        # connect list widget to functionality
-        self.m_objectListWidget.itemActivated.connect(
-            self.initPrimitiveEditorWidget)
-        self.m_objectListWidget.itemClicked.connect(
-            self.initPrimitiveEditorWidget)
-        self.m_objectListWidget.itemDoubleClicked.connect(
-            self.initPrimitiveEditorWidget)
-        self.m_objectListWidget.itemEntered.connect(
-            self.initPrimitiveEditorWidget)
+        self.m_objectListView = objectListView
+
+        # rows of the object list, indexed by persist_id and by name
+        self.objectListModel = PrimitiveListModel(self)
+        self.m_objectListView.setModel(self.objectListModel)
+        # groups by their row in the scene model group table
+        self.m_groups = {}
+
+        # primitives changed inside an open ShapeEditor transaction
+        self.m_transactionDepth = 0
+        self.m_transactionPrimitives = {}
+        self.sceneModel = SceneModel()
+        # storage I/O runs on this worker, off the GUI thread
+        self.storageWorker = StorageWorker()
+        self.persistenceQueue = PersistenceQueue(self.storageWorker, self.sceneModel)
+        self.storageWorker.failed.connect(self.reportStorageFailure)
+        self.geometryCache = GeometryCache(rootEntity)
+        self.instancedRenderer = InstancedRenderer(rootEntity, self)
+        self.staticBatcher = StaticBatcher(rootEntity, self)
+        self.sphereLod = SphereLOD(cameraEntity, self)
+        self.spatialIndex = BVH()
+        self.frustumCuller = FrustumCuller(cameraEntity, self)
+        self.undoStack = UndoStack(self)
+        # live edits from the editor widgets, applied once per frame
+        self.updateScheduler = UpdateScheduler(rootEntity, self)
+        self.entityPager = EntityPager(cameraEntity, self)
+
+        # connect list view to functionality
+        self.m_objectListView.activated.connect(self.indexActivated)
+        self.m_objectListView.clicked.connect(self.indexActivated)
 
     def createCube(self):
         cube = Cube(self.m_rootEntity, self.m_cameraEntity, self)
-        cubeListItem = CubeListItem(cube.m_displayName, cube)
-        self.initPrimitiveEditorWidget(cubeListItem)
-        self.m_objectListWidget.addItem(cubeListItem)
-        return cubeListItem
+        self.addPrimitive(cube)
+        self.undoStack.recordCreate([cube])
+        self.handleClickedPrimitive(cube)
+        return cube
 
     def createSphere(self):
         sphere = Sphere(self.m_rootEntity, self.m_cameraEntity, self)
-        sphereListItem = SphereListItem(sphere.m_displayName, sphere)
-        self.initPrimitiveEditorWidget(sphereListItem)
-        self.m_objectListWidget.addItem(sphereListItem)
-        return sphereListItem
+        self.addPrimitive(sphere)
+        self.undoStack.recordCreate([sphere])
+        self.handleClickedPrimitive(sphere)
+        return sphere
+
+    def indexActivated(self, index):
+        primitive = self.objectListModel.primitiveAt(index)
+        if primitive is not None:
+            self.initPrimitiveEditorWidget(primitive)
+
+    def initPrimitiveEditorWidget(self, primitive):
+        self.instancedRenderer.setSelected(primitive)
+        self.staticBatcher.setSelected(primitive)
+        self.stackedLayout.openPrimitiveEditor(primitive)
+
+    """
+    Adds primitive to the object list and the scene indexes
+    """
+    def addPrimitive(self, primitive):
+        self.addPrimitives([primitive])
+
+    """
+    Adds many primitives with one list model insert and a single spatial
+    index update
+    """
+    def addPrimitives(self, primitives):
+        self.objectListModel.addPrimitives(primitives)
+        self.spatialIndex.insertMany(primitives)
+        self.entityPager.primitivesAdded(primitives)
+        self.instancedRenderer.markDirty()
+        self.staticBatcher.markDirty()
+        self.sphereLod.markDirty()
+
+    """
+    Called when the entity pager creates the Qt3D entity of primitive
+    """
+    def entityMaterialized(self, primitive):
+        self.instancedRenderer.primitiveAdded(primitive)
+        self.staticBatcher.primitiveAdded(primitive)
+        self.frustumCuller.primitiveAdded(primitive)
+
+    """
+    Called before the entity pager deletes the Qt3D entity of primitive
+    """
+    def entityReleased(self, primitive):
+        self.frustumCuller.primitiveRemoved(primitive)
+
+    """
+    Duplicates source count times in the given array pattern. Transforms and
+    colors are computed in one vectorized pass and written straight into the
+    scene model; the copies reach storage in a single queued batch.
+    """
+    def createArray(self, source, pattern, count, **options):
+        positions, rotations, colors = arrayLayout(
+            self.sceneModel, source.slot, pattern, count, **options)
+        model = self.sceneModel
+
+        with self.transaction():
+            slots = model.allocateMany([model.types[source.slot]] * len(positions))
+            model.ids[slots] = [newId() for _ in range(len(slots))]
+            model.positions[slots] = positions
+            model.rotations[slots] = rotations
+            model.colors[slots] = colors
+            model.dimensions[slots] = model.dimensions[source.slot]
+            model.parents[slots] = model.parents[source.slot]
+            baseName = source.name()
+            for number, slot in enumerate(slots.tolist(), 1):
+                model.names[slot] = f"{baseName} {number}"
+            primitives = self.createFromSlots(slots)
+
+            for primitive in primitives:
+                self.persistenceQueue.markDirty(primitive)
+            self.addPrimitives(primitives)
+            self.undoStack.recordCreate(primitives)
+        self.instancedRenderer.markDirty()
+        return primitives
+
+    """
+    Builds primitives for scene model slots already filled in by a bulk
+    operation, without adding them to the scene lists
+    """
+    def createFromSlots(self, slots):
+        model = self.sceneModel
+        primitives = []
+        for slot, code, persist_id in zip(slots.tolist(), model.types[slots].tolist(),
+                                          model.ids[slots].tolist()):
+            primitiveClass = Sphere if code == TYPE_CODES['sphere'] else Cube
+            primitives.append(primitiveClass(self.m_rootEntity, self.m_cameraEntity,
+                                             self, persist_id, slot))
+        return primitives
+
+    def primitiveFor(self, persist_id):
+        return self.objectListModel.primitive(persist_id)
+
+    """
+    Primitives currently in the scene, in creation order, without groups
+    """
+    def primitives(self):
+        return (primitive for primitive in self.objectListModel.primitives()
+                if primitive.slot is not None)
+
+    """
+    Group at row index of the group table, None for the top level
+    """
+    def groupAt(self, index):
+        return self.m_groups.get(index) if index >= 0 else None
+
+    """
+    Loaded group with persist_id, or None
+    """
+    def findGroup(self, persist_id):
+        index = self.sceneModel.m_groupIndex.get(persist_id)
+        return self.m_groups.get(index) if index is not None else None
+
+    """
+    Group with persist_id, created empty if it is not loaded yet, as when a
+    member is restored before its group record
+    """
+    def groupFor(self, persist_id):
+        group = self.findGroup(persist_id)
+        if group is not None:
+            return group
+        group = Group(self.m_rootEntity, self, persist_id)
+        self.m_groups[group.index] = group
+        self.objectListModel.addPrimitives([group])
+        return group
+
+    """
+    Entity that members of group row index are parented to
+    """
+    def groupEntity(self, index):
+        if index < 0:
+            return self.m_rootEntity
+        group = self.groupAt(index)
+        if group is None:
+            group = self.groupFor(int(self.sceneModel.groupIds[index]))
+        return group.entity()
+
+    """
+    Primitives directly in group, or anywhere below it when nested
+    """
+    def groupMembers(self, group, nested=False):
+        model = self.sceneModel
+        slots = model.slotsInGroup(group.index)
+        members = [self.primitiveFor(key) for key in model.ids[slots].tolist()]
+        members = [primitive for primitive in members if primitive is not None]
+        if nested:
+            for child in self.childGroups(group):
+                members.extend(self.groupMembers(child, nested=True))
+        return members
+
+    def childGroups(self, group):
+        return [self.m_groups[index] for index in self.sceneModel.childGroups(group.index).tolist()
+                if index in self.m_groups]
+
+    """
+    Called after a group moved or turned. Only the world bounds of its
+    members change; their records and entities stay as they are.
+    """
+    def groupMoved(self, group):
+        self.spatialIndex.updateMany(self.groupMembers(group, nested=True))
+        self.frustumCuller.markDirty()
+        self.entityPager.markDirty()
+        self.sphereLod.markDirty()
+        self.groupChanged(group)
+
+    """
+    Called after the members of group were changed as a whole
+    """
+    def groupChanged(self, group):
+        self.instancedRenderer.markDirty()
+        self.staticBatcher.markDirty()
+
+    """
+    Puts primitives and groups into a new group at their common center,
+    inside their common enclosing group if they share one. Members keep
+    their place in the world; their local transforms are rewritten and
+    queued for storage once. The grouping is one undo step.
+    """
+    def createGroup(self, items):
+        model = self.sceneModel
+        primitives = [item for item in items if item.slot is not None]
+        groups = [item for item in items if item.slot is None]
+        slots = [primitive.slot for primitive in primitives]
+        before = self.placements(primitives, groups)
+        model.updateWorld()
+
+        parents = set(model.parents[slots].tolist())
+        parents.update(int(model.groupParents[group.index]) for group in groups)
+        centers = [model.worldPositions(slots)] if slots else []
+        centers += [model.groupWorldPositions[[group.index for group in groups]]]
+
+        group = Group(self.m_rootEntity, self)
+        self.m_groups[group.index] = group
+        model.groupPositions[group.index] = np.concatenate(centers).mean(axis=0)
+        model.markWorldDirty()
+        model.setGroupParent(group.index, parents.pop() if len(parents) == 1 else -1)
+        group.syncToQt()
+
+        model.setParents(slots, group.index)
+        for child in groups:
+            model.setGroupParent(child.index, group.index)
+            child.syncToQt()
+            self.persistenceQueue.markDirty(child)
+        for primitive in primitives:
+            primitive.syncToQt()
+            self.persistenceQueue.markDirty(primitive)
+        self.persistenceQueue.markDirty(group)
+        self.objectListModel.addPrimitives([group])
+        group.applyColor()
+        self.undoStack.recordGroup('group', group, before, self.placements(primitives, groups))
+        return group
+
+    """
+    Parent and local transform of each primitive and group by persist_id,
+    see SceneModel.placement
+    """
+    def placements(self, primitives, groups):
+        placements = {primitive.persist_id: self.sceneModel.placement(primitive.slot)
+                      for primitive in primitives}
+        placements.update((group.persist_id, self.sceneModel.groupPlacement(group.index))
+                          for group in groups)
+        return placements
+
+    """
+    Dissolves group into its enclosing group. Members keep their place in
+    the world; the group record is deleted. The ungrouping is one undo step.
+    """
+    def ungroup(self, group):
+        model = self.sceneModel
+        parent = int(model.groupParents[group.index])
+        slots = model.slotsInGroup(group.index)
+        children = self.childGroups(group)
+        members = self.groupMembers(group)
+        before = self.placements(members, children)
+        model.setParents(slots, parent)
+        for child in children:
+            model.setGroupParent(child.index, parent)
+            child.syncToQt()
+            self.persistenceQueue.markDirty(child)
+        for primitive in members:
+            primitive.syncToQt()
+            self.persistenceQueue.markDirty(primitive)
+        self.undoStack.recordGroup('ungroup', group, before, self.placements(members, children))
+
+        self.persistenceQueue.markDeleted(group.persist_id)
+        self.objectListModel.removePrimitive(group)
+        self.updateScheduler.primitiveRemoved(group)
+        self.stackedLayout.closePrimitiveEditor(group)
+        if self.instancedRenderer.selected is group:
+            self.instancedRenderer.setSelected(None)
+        self.staticBatcher.primitiveRemoved(group)
+        del self.m_groups[group.index]
+        model.releaseGroup(group.index)
+        group.entity().setParent(None)
+        group.entity().deleteLater()
+        group.deleteLater()
+
+    """
+    Called by a primitive after its name changed from oldName
+    """
+    def primitiveRenamed(self, primitive, oldName):
+        self.objectListModel.primitiveRenamed(primitive, oldName)
 
-    def initPrimitiveEditorWidget(self, item):
-        self.stackedLayout.openPrimitiveEditor(item)
+    """
+    Deletes primitives from the scene and from storage as one undo step,
+    updating the object list once
+    """
+    def removePrimitives(self, primitives):
+        if not primitives:
+            return
+        self.undoStack.recordRemove(primitives)
+        for primitive in primitives:
+            if primitive.persist_id:
+                self.persistenceQueue.markDeleted(primitive.persist_id)
+            primitive.dematerialize()
+
+        self.objectListModel.removePrimitives(primitives)
+        for primitive in primitives:
+            self.entityPager.primitiveRemoved(primitive)
+            self.m_transactionPrimitives.pop(primitive.persist_id, None)
+            self.updateScheduler.primitiveRemoved(primitive)
+            self.stackedLayout.closePrimitiveEditor(primitive)
+            self.spatialIndex.remove(primitive)
+            self.frustumCuller.primitiveRemoved(primitive)
+            if self.instancedRenderer.selected is primitive:
+                self.instancedRenderer.setSelected(None)
+            self.staticBatcher.primitiveRemoved(primitive)
+            self.sceneModel.release(primitive.slot)
+            primitive.deleteLater()
+        self.instancedRenderer.markDirty()
     
     
     """
-    Finds and opens editor menu for supplied primitive
+    Groups changes to any number of primitives into one scene update; each
+    changed primitive is persisted once when the outermost transaction commits
+    """
+    @contextlib.contextmanager
+    def transaction(self):
+        self.beginTransaction()
+        try:
+            yield self
+        finally:
+            self.commitTransaction()
+
+    def beginTransaction(self):
+        self.m_transactionDepth += 1
+
+    def commitTransaction(self):
+        self.m_transactionDepth -= 1
+        if self.m_transactionDepth > 0:
+            return
+
+        primitives = self.m_transactionPrimitives
+        self.m_transactionPrimitives = {}
+        self.noteAction()
+        for primitive in primitives.values():
+            primitive.persist(True)
+            self.primitiveChanged(primitive)
+
+    """
+    Counts a committed user action. Primitive and group transactions inside
+    an editor transaction are part of its action, counted when it commits.
+    """
+    def noteAction(self):
+        if self.m_transactionDepth == 0:
+            self.persistenceQueue.noteAction()
+
+    """
+    Called whenever the position or extent of primitive changes
+    """
+    def primitiveMoved(self, primitive):
+        self.spatialIndex.update(primitive)
+        self.frustumCuller.markDirty()
+
+    """
+    Called once per committed change to primitive
+    """
+    def primitiveChanged(self, primitive):
+        self.instancedRenderer.markDirty()
+        self.staticBatcher.primitiveChanged(primitive)
+        if primitive.primitiveType() == 'sphere':
+            self.sphereLod.markDirty()
+
+    """
+    Records primitive for persisting at commit. Returns False when no
+    transaction is open and the primitive should persist right away.
+    """
+    def deferPersist(self, primitive):
+        if self.m_transactionDepth == 0:
+            return False
+        self.m_transactionPrimitives[primitive.persist_id] = primitive
+        self.persistenceQueue.noteDeferred()
+        return True
+
+    """
+    Finds and opens editor menu for supplied primitive. A primitive in a
+    group selects the outermost group first; clicking again steps one group
+    further in, down to the primitive itself.
     """
     def handleClickedPrimitive(self, primitive):
-        for i in range(self.m_objectListWidget.count()):
-            listItem = self.m_objectListWidget.item(i)
-            if listItem.sceneObject() == primitive:
-                self.initPrimitiveEditorWidget(listItem)
-                self.m_objectListWidget.setCurrentItem(listItem)
+        if self.primitiveFor(primitive.persist_id) is None:
+            return
+        chain = [primitive] + primitive.ancestors()
+        current = self.stackedLayout.currentPrimitive()
+        if current in chain:
+            primitive = chain[max(chain.index(current) - 1, 0)]
+        else:
+            primitive = chain[-1]
+        self.initPrimitiveEditorWidget(primitive)
+        index = self.objectListModel.indexOf(primitive)
+        if index.isValid():
+            self.m_objectListView.setCurrentIndex(index)
+
+    def reportStorageFailure(self, task, error):
+        self.storageFailed.emit(f"Storage error in {task}: {error}")
 
     """
-    Creates and populates editor with persisted primitive objects
+    Creates and populates editor with persisted primitive objects, or with
+    the primitives of a binary scene file, which are then imported into
+    storage. Loading runs progressively; the returned loader reports progress.
+    A chunked store is loaded around the camera and streamed in as it moves.
     """
-    def restoreData(self):
-        database = db.getDb(PRIMITIVE_OBJECTS)
-        json_data = database.getAll()
+    def restoreData(self, sceneFile=None):
+        self.sceneLoader = SceneLoader(self, sceneFile)
+        self.sceneLoader.start()
+        return self.sceneLoader
 
-        for primitive in json_data:
-            if primitive['type'] == 'cube':
-                cube = Cube(self.m_rootEntity,
+    """
+    Creates a primitive from a stored record without adding it to the scene
+    lists, for loaders that add whole batches at once
+    """
+    def createPrimitive(self, primitive):
+        if primitive['type'] == 'group':
+            # groups are not primitives; restoring one only fills in the group
+            self.groupFor(primitive['id']).restore(primitive)
+            return None
+        elif primitive['type'] == 'cube':
+            cube = Cube(self.m_rootEntity,
+                        self.m_cameraEntity, self, primitive['id'])
+            cube.restore(primitive)
+            return cube
+        elif primitive['type'] == 'sphere':
+            sphere = Sphere(self.m_rootEntity,
                             self.m_cameraEntity, self, primitive['id'])
-                listItem = CubeListItem(cube.m_displayName, cube)
-                cube.restore(primitive)
-            elif primitive['type'] == 'sphere':
-                sphere = Sphere(self.m_rootEntity,
-                                self.m_cameraEntity, self, primitive['id'])
-                listItem = SphereListItem(sphere.m_displayName, sphere)
-                sphere.restore(primitive)
-            else:
-                print("Found invalid object in database")
-                continue
-
-            listItem.setName(primitive['name'])
-            self.m_objectListWidget.addItem(listItem)
+            sphere.restore(primitive)
+            return sphere
+        else:
+            print("Found invalid object in database")
+            return None
+
+    """
+    Recreates removed primitives from their records under their old ids and
+    queues them for storage
+    """
+    def restorePrimitives(self, records):
+        primitives = [primitive for primitive in map(self.createPrimitive, records)
+                      if primitive is not None]
+        self.addPrimitives(primitives)
+        for primitive in primitives:
+            self.persistenceQueue.markDirty(primitive)
+        self.instancedRenderer.markDirty()
+        return primitives
+
+    """
+    Creates a primitive from a stored record and adds it to the scene
+    """
+    def restorePrimitive(self, primitive):
+        primitive = self.createPrimitive(primitive)
+        if primitive is not None:
+            self.addPrimitive(primitive)
+        return primitive
 
 """
 Contains primitive editor widgets
 """
 class RightSideMenu(QtWidgets.QWidget):
 
-    PRIMITIVE_MAP = {'sphere': 1, 'cube': 2}
+    PRIMITIVE_MAP = {'sphere': 1, 'cube': 2, 'group': 3}
 
     def __init__(self):
         QtWidgets.QWidget.__init__(self)
@@ -110,31 +547,52 @@ class RightSideMenu(QtWidgets.QWidget):
 
         self.sphereEditor = SphereEditorWidget()
         self.boxEditor = CubeEditorWidget()
+        self.groupEditor = GroupEditorWidget()
         self.emptyWidget = QtWidgets.QWidget()
 
         self.stackWidget.addWidget(self.emptyWidget)
         self.stackWidget.addWidget(self.sphereEditor)
         self.stackWidget.addWidget(self.boxEditor)
+        self.stackWidget.addWidget(self.groupEditor)
 
         layout.addWidget(self.stackWidget, 1)
 
     """
-    Determines the type of the list item and opens and populates the correct primitive editor
+    Determines the type of the primitive and opens and populates the correct primitive editor
     """
-    def openPrimitiveEditor(self, listItem):
-        primObj = listItem.sceneObject()
+    def openPrimitiveEditor(self, primObj):
         self.stackWidget.setCurrentIndex(self.PRIMITIVE_MAP[primObj.primitiveType()])
-        self.stackWidget.currentWidget().populate_fields(listItem, primObj)
+        self.stackWidget.currentWidget().populate_fields(primObj)
+
+    def currentPrimitive(self):
+        return getattr(self.stackWidget.currentWidget(), 'primitiveObject', None)
+
+    """
+    Re-reads the fields of the open editor, after undo or redo changed them
+    """
+    def refreshPrimitiveEditor(self):
+        primObj = self.currentPrimitive()
+        if primObj is not None:
+            self.stackWidget.currentWidget().populate_fields(primObj)
+
+    def closePrimitiveEditor(self, primObj):
+        if self.currentPrimitive() is primObj:
+            self.stackWidget.currentWidget().primitiveObject = None
+            self.stackWidget.setCurrentWidget(self.emptyWidget)
 
 """
-Contains the object list and the create primitive buttons
+Contains the object list with its search fields and the create primitive buttons
 """
 class LeftSideMenu(QtWidgets.QWidget):
+
+    TYPE_FILTERS = {'All types': None, 'Cubes': 'cube', 'Spheres': 'sphere', 'Groups': 'group'}
+
     def __init__(self, shapeEditor, objectList):
         QtWidgets.QWidget.__init__(self)
         layout = QtWidgets.QVBoxLayout()
         layout.setAlignment(QtCore.Qt.AlignTop)
         self.setLayout(layout)
+        self.shapeEditor = shapeEditor
         self.setMinimumSize(300, 300)
         self.setMaximumWidth(300)
 
@@ -147,12 +605,165 @@ class LeftSideMenu(QtWidgets.QWidget):
         self.createCubeButton.clicked.connect(shapeEditor.createCube)
         self.createSphereButton.clicked.connect(shapeEditor.createSphere)
 
+        # undo and redo of edits, creations and deletions
+        self.undoStack = shapeEditor.undoStack
+        self.undoButton = QtWidgets.QPushButton("Undo", self)
+        self.redoButton = QtWidgets.QPushButton("Redo", self)
+        self.undoButton.clicked.connect(self.undoStack.undo)
+        self.redoButton.clicked.connect(self.undoStack.redo)
+        self.undoStack.changed.connect(self.updateUndoButtons)
+        self.updateUndoButtons()
+        undoLayout = QtWidgets.QHBoxLayout()
+        undoLayout.addWidget(self.undoButton)
+        undoLayout.addWidget(self.redoButton)
+
+        # draw all primitives of a type with a single instanced draw call
+        self.instancedCheckBox = QtWidgets.QCheckBox("Instanced rendering", self)
+        self.instancedCheckBox.toggled.connect(self.setInstanced)
+
+        # bake unselected primitives into a few merged meshes
+        self.bakingCheckBox = QtWidgets.QCheckBox("Static batching", self)
+        self.bakingCheckBox.toggled.connect(self.setBaking)
+
+        # pick sphere tessellation from on-screen size
+        self.lodCheckBox = QtWidgets.QCheckBox("Sphere level of detail", self)
+        self.lodCheckBox.setChecked(shapeEditor.sphereLod.enabled)
+        self.lodCheckBox.toggled.connect(shapeEditor.sphereLod.setEnabled)
+
+        # progress of the scene restore, hidden once loading finishes
+        self.loadProgress = QtWidgets.QProgressBar(self)
+        self.loadProgress.setFormat("Loading scene %v/%m")
+        self.loadProgress.hide()
+
+        # last storage error, hidden again once a batch is written
+        self.storageError = QtWidgets.QLabel(self)
+        self.storageError.setWordWrap(True)
+        self.storageError.setStyleSheet("color: #c0392b")
+        self.storageError.hide()
+        shapeEditor.storageFailed.connect(self.showStorageError)
+        shapeEditor.persistenceQueue.flushed.connect(self.clearStorageError)
+
+        # writes the scene as a binary scene file on the storage worker
+        self.exportButton = QtWidgets.QPushButton("Export scene...", self)
+        self.exportButton.clicked.connect(self.exportScene)
+        self.exportStatus = QtWidgets.QLabel(self)
+        self.exportStatus.setWordWrap(True)
+        self.exportStatus.hide()
+        self.storageWorker = shapeEditor.storageWorker
+        self.sceneModel = shapeEditor.sceneModel
+
+        # only keep entities for primitives near the camera
+        self.pagingCheckBox = QtWidgets.QCheckBox("Page entities near camera", self)
+        self.pagingCheckBox.toggled.connect(shapeEditor.entityPager.setEnabled)
+        self.pagingRadius = QtWidgets.QDoubleSpinBox(self)
+        self.pagingRadius.setRange(1.0, 100000.0)
+        self.pagingRadius.setPrefix("Paging radius ")
+        self.pagingRadius.setValue(shapeEditor.entityPager.radius)
+        self.pagingRadius.valueChanged.connect(shapeEditor.entityPager.setRadius)
+
+        # group the objects selected in the list; groups are dissolved from their editor
+        self.groupButton = QtWidgets.QPushButton("Group selected", self)
+        self.groupButton.clicked.connect(self.groupSelected)
+        objectList.setSelectionMode(QtWidgets.QAbstractItemView.ExtendedSelection)
+        self.objectList = objectList
+
         layout.addWidget(self.createCubeButton)
         layout.addWidget(self.createSphereButton)
+        layout.addLayout(undoLayout)
+        layout.addWidget(self.exportButton)
+        layout.addWidget(self.exportStatus)
+        layout.addWidget(self.groupButton)
+        layout.addWidget(self.instancedCheckBox)
+        layout.addWidget(self.bakingCheckBox)
+        layout.addWidget(self.lodCheckBox)
+        layout.addWidget(self.pagingCheckBox)
+        layout.addWidget(self.pagingRadius)
+
+        # incremental search over names and types
+        self.searchEdit = QtWidgets.QLineEdit(self)
+        self.searchEdit.setPlaceholderText("Search by name")
+        self.searchEdit.setClearButtonEnabled(True)
+        self.typeFilter = QtWidgets.QComboBox(self)
+        self.typeFilter.addItems(list(self.TYPE_FILTERS))
+        self.objectListModel = shapeEditor.objectListModel
+        self.searchEdit.textChanged.connect(self.updateFilter)
+        self.typeFilter.currentTextChanged.connect(self.updateFilter)
+
+        layout.addWidget(self.loadProgress)
+        layout.addWidget(self.storageError)
+        layout.addWidget(self.searchEdit)
+        layout.addWidget(self.typeFilter)
         layout.addWidget(objectList)
 
+    def updateFilter(self):
+        self.objectListModel.setFilter(
+            self.searchEdit.text(), self.TYPE_FILTERS[self.typeFilter.currentText()])
+
+    """
+    Copies the scene columns on the GUI thread and writes them on the write
+    lane of the storage worker, reporting the outcome below the button
+    """
+    def exportScene(self):
+        filename, _ = QtWidgets.QFileDialog.getSaveFileName(
+            self, "Export scene", SCENE_BINARY, "Scene files (*.scene)")
+        if not filename:
+            return
+        self.exportButton.setEnabled(False)
+        self.showExportStatus(f"Exporting to {os.path.basename(filename)}...")
+        self.storageWorker.write(
+            writeScene, filename, *sceneColumns(self.sceneModel),
+            callback=lambda count: self.exportFinished(
+                f"Exported {count} primitives to {os.path.basename(filename)}"),
+            errback=lambda error: self.exportFinished(
+                f"Export to {os.path.basename(filename)} failed: {error}"))
+
+    def exportFinished(self, message):
+        self.exportButton.setEnabled(True)
+        self.showExportStatus(message)
+
+    def showExportStatus(self, message):
+        self.exportStatus.setText(message)
+        self.exportStatus.show()
+
+    def groupSelected(self):
+        items = [self.objectListModel.primitiveAt(index)
+                 for index in self.objectList.selectionModel().selectedIndexes()]
+        items = [item for item in items if item is not None]
+        if items:
+            self.shapeEditor.initPrimitiveEditorWidget(self.shapeEditor.createGroup(items))
+
+    """
+    Instanced rendering and static batching both replace the primitive
+    entities, so at most one of them is on
+    """
+    def setInstanced(self, enabled):
+        if enabled:
+            self.bakingCheckBox.setChecked(False)
+        self.shapeEditor.instancedRenderer.setEnabled(enabled)
+
+    def setBaking(self, enabled):
+        if enabled:
+            self.instancedCheckBox.setChecked(False)
+        self.shapeEditor.staticBatcher.setEnabled(enabled)
+
+    def updateUndoButtons(self):
+        self.undoButton.setEnabled(self.undoStack.canUndo())
+        self.redoButton.setEnabled(self.undoStack.canRedo())
+
+    def showStorageError(self, message):
+        self.storageError.setText(message)
+        self.storageError.show()
+
+    def clearStorageError(self, stats):
+        self.storageError.hide()
+
+    def updateLoadProgress(self, loaded, total):
+        self.loadProgress.setMaximum(total)
+        self.loadProgress.setValue(loaded)
+        self.loadProgress.setVisible(loaded < total)
+
 class Application(QtWidgets.QWidget):
-    def __init__(self, rootEntity, cameraEntity, container):
+    def __init__(self, rootEntity, cameraEntity, container, sceneFile=None):
         QtWidgets.QWidget.__init__(self)
         layout = QtWidgets.QHBoxLayout()
         self.setLayout(layout)
@@ -161,16 +772,35 @@ class Application(QtWidgets.QWidget):
         self.cameraEntity = cameraEntity
 
         self.rightMenu = RightSideMenu()
-        self.objectList = QtWidgets.QListWidget(self)
+        # virtualized: rows are fetched lazily and all share one height
+        self.objectList = QtWidgets.QListView(self)
+        self.objectList.setUniformItemSizes(True)
         self.shapeEditor = ShapeEditor(
             self.rootEntity, self.cameraEntity, self.objectList, self.rightMenu)
         self.leftMenu = LeftSideMenu(self.shapeEditor, self.objectList)
 
+        tracer = activeTracer()
+        if tracer is not None:
+            self.leftMenu.layout().addWidget(TraceStatsPanel(tracer))
+            self.shapeEditor.persistenceQueue.flushed.connect(
+                lambda stats: tracer.counter('persistence', stats))
+
+        # the 3D view, with room below it for status overlays
+        self.viewLayout = QtWidgets.QVBoxLayout()
+        self.viewLayout.setSpacing(0)
+        self.viewLayout.addWidget(self.container, 1)
+
         layout.addWidget(self.leftMenu, 1)
-        layout.addWidget(self.container, 1)
+        layout.addLayout(self.viewLayout, 1)
         layout.addWidget(self.rightMenu, 1)
 
-        self.shapeEditor.restoreData()
+        undoShortcut = QtWidgets.QShortcut(QtGui.QKeySequence(QtGui.QKeySequence.Undo), self)
+        undoShortcut.activated.connect(self.shapeEditor.undoStack.undo)
+        redoShortcut = QtWidgets.QShortcut(QtGui.QKeySequence(QtGui.QKeySequence.Redo), self)
+        redoShortcut.activated.connect(self.shapeEditor.undoStack.redo)
+
+        loader = self.shapeEditor.restoreData(sceneFile)
+        loader.progress.connect(self.leftMenu.updateLoadProgress)
 
         self.setWindowTitle("3D Editor")
         self.resize(1200, 800)
@@ -202,23 +832,34 @@ def initialize_lighting(rootEntity, cameraEntity):
 
 
 if __name__ == "__main__":
-    app = QtWidgets.QApplication(sys.argv)
+    parser = argparse.ArgumentParser(description="3D Editor")
+    parser.add_argument("--trace", metavar="FILE", default=os.environ.get(TRACE_ENV),
+                        help=f"write a Chrome trace of editor hot paths (or set {TRACE_ENV})")
+    parser.add_argument("--scene", metavar="FILE",
+                        help="load a binary scene file instead of the store and import it")
+    parser.add_argument("--degrade-ms", type=float, default=DEGRADE_FRAME_MS,
+                        help="median frame time above which rendering quality steps down")
+    parser.add_argument("--recover-ms", type=float, default=RECOVER_FRAME_MS,
+                        help="median frame time below which rendering quality steps back up")
+    parser.add_argument("--idle-ms", type=int, default=IDLE_MS,
+                        help="time without input after which the view renders on demand")
+    args, qt_args = parser.parse_known_args()
+    app = QtWidgets.QApplication(sys.argv[:1] + qt_args)
+
+    if args.trace:
+        tracer = enableTracing(args.trace, [Primitive, Sphere, Cube, ShapeEditor, SceneLoader,
+                                            PrimitiveEditorWidget, SphereEditorWidget,
+                                            CubeEditorWidget, UndoStack, UpdateScheduler])
+        app.aboutToQuit.connect(tracer.save)
 
     # init 3D environment
     view = Qt3DExtras.Qt3DWindow()
-    view.defaultFrameGraph().setClearColor(QtGui.QColor("#4d4d4f"))
+    view.defaultFrameGraph().setClearColor(QtGui.QColor(CLEAR_COLOR))
     container = QtWidgets.QWidget.createWindowContainer(view)
     screenSize = view.screen().size()
     container.setMinimumSize(QtCore.QSize(800, 800))
     container.setMaximumSize(screenSize)
 
-    # init picker for selecting objects in 3d scene
-    render_settings = view.renderSettings()
-    picking_settings = render_settings.pickingSettings()
-    picking_settings.setFaceOrientationPickingMode(Qt3DRender.QPickingSettings.FrontAndBackFace)
-    picking_settings.setPickMethod(Qt3DRender.QPickingSettings.PrimitivePicking)
-    picking_settings.setPickResultMode(Qt3DRender.QPickingSettings.NearestPick)
-    
     # init core entities
     rootEntity = Qt3DCore.QEntity()
     cameraEntity = initialize_camera(view, rootEntity)
@@ -230,6 +871,19 @@ if __name__ == "__main__":
     view.registerAspect(input_)
 
     # init app
-    appWidget = Application(rootEntity, cameraEntity, container)
+    appWidget = Application(rootEntity, cameraEntity, container, args.scene)
+    app.aboutToQuit.connect(appWidget.shapeEditor.updateScheduler.applyPending)
+    app.aboutToQuit.connect(appWidget.shapeEditor.persistenceQueue.shutdown)
+    app.aboutToQuit.connect(closeStore)
+
+    # picks objects in the 3d scene with ray queries against the spatial index
+    pickDispatcher = PickDispatcher(view, cameraEntity, appWidget.shapeEditor)
+    appWidget.shapeEditor.sphereLod.setViewportHeight(view.height())
+    view.heightChanged.connect(appWidget.shapeEditor.sphereLod.setViewportHeight)
+
+    # renders on demand when idle and lowers quality when frames take too long
+    governor = QualityGovernor(view, rootEntity, cameraEntity, appWidget.shapeEditor,
+                               pickDispatcher, args.degrade_ms, args.recover_ms, args.idle_ms)
+    appWidget.viewLayout.addWidget(QualityOverlay(governor))
 
     sys.exit(app.exec_())
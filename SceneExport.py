@@ -0,0 +1,391 @@
+import argparse
+import json
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import time
+import numpy as np
+from SceneModel import SceneModel, TYPE_CODES, TYPE_NAMES, BASE_SCALES, hexToColor
+from SceneStore import BACKENDS, STORE_BACKEND, READ_BATCH
+from SceneFile import SceneFile
+from Tessellation import unitSphere, unitCube, bakeVertices
+
+# tessellation of exported spheres; cubes are always 12 triangles
+EXPORT_SPHERE_RINGS = 16
+EXPORT_SPHERE_SLICES = 16
+FORMATS = {'.glb': 'glb', '.obj': 'obj', '.ply': 'ply'}
+
+GLB_MAGIC = b'glTF'
+GLB_VERSION = 2
+GLB_JSON = 0x4E4F534A
+GLB_BIN = 0x004E4942
+# glTF accessor component types and buffer view targets
+FLOAT = 5126
+UNSIGNED_INT = 5125
+ARRAY_BUFFER = 34962
+ELEMENT_ARRAY_BUFFER = 34963
+
+PLY_VERTEX = np.dtype([('position', '<f4', (3,)), ('normal', '<f4', (3,)), ('color', 'u1', (3,))])
+PLY_FACE = np.dtype([('count', 'u1'), ('indices', '<i4', (3,))])
+
+# children of the glTF root node written per line of the JSON
+CHILDREN_PER_LINE = 4096
+# OBJ lines formatted per write, which bounds the size of the text in memory
+OBJ_WRITE_ROWS = 1 << 15
+
+
+"""
+Positions, normals and triangle indices of the unit mesh of every type
+"""
+def unitMeshes(rings=EXPORT_SPHERE_RINGS, slices=EXPORT_SPHERE_SLICES):
+    return {TYPE_CODES['sphere']: unitSphere(rings, slices), TYPE_CODES['cube']: unitCube()}
+
+
+"""
+Yields (model, slots) for consecutive batches of the primitives of source,
+a SceneFile or a scene store. Scene files and the sqlite store are read a
+batch at a time and the chunked store a chunk at a time; the json and
+journal stores hold their whole scene in memory anyway. Every batch is
+loaded into the same SceneModel, which also holds all groups, so world
+transforms are available; the slots of a batch are only valid until the
+next batch is requested. Slots get the scale and, in a colored group, the
+color the editor draws them with.
+"""
+def sceneBatches(source, size=READ_BATCH):
+    model = SceneModel(size)
+    scales = np.ones(max(TYPE_CODES.values()) + 1, dtype=np.float32)
+    for name, scale in BASE_SCALES.items():
+        scales[TYPE_CODES[name]] = scale
+
+    def loaded():
+        if isinstance(source, SceneFile):
+            for start in range(0, len(source), size):
+                yield source.loadInto(model, start, start + size)
+            return
+        for record in source.getGroups():
+            model.setGroupRecord(record)
+        for records in source.iterBatches(size):
+            yield model.addRecords([record for record in records if record.get('type') != 'group'])
+
+    for slots in loaded():
+        model.scales[slots] = scales[model.types[slots]][:, None]
+        applyGroupColors(model, slots)
+        yield model, slots
+        model.releaseMany(slots)
+
+
+"""
+Gives grouped slots the color of their nearest enclosing group that has
+one, as Group.colorName does in the editor. Stored records keep their own
+color.
+"""
+def applyGroupColors(model, slots):
+    grouped = slots[model.parents[slots] >= 0]
+    rows = model.parents[grouped]
+    for row in np.unique(rows).tolist():
+        group = row
+        while group >= 0 and not model.groupColors[group]:
+            group = int(model.groupParents[group])
+        if group >= 0:
+            model.colors[grouped[rows == row]] = hexToColor(model.groupColors[group])
+
+
+"""
+Size of the mesh of slots: the radius of spheres, the extents of cubes,
+times their scale
+"""
+def meshScales(model, slots):
+    dimensions = model.dimensions[slots].copy()
+    spheres = model.types[slots] == TYPE_CODES['sphere']
+    dimensions[spheres] = dimensions[spheres][:, :1]
+    return np.maximum(dimensions * model.scales[slots], np.float32(1e-6))
+
+
+"""
+Pre-transformed vertices and triangles of a batch, one type at a time.
+Yields (slots, vertices (n, v, VERTEX_FLOATS), triangles (n * t, 3)) with
+triangle indices counted from firstVertex.
+"""
+def bakedTriangles(model, slots, meshes, firstVertex):
+    for code, (positions, normals, indices) in meshes.items():
+        typeSlots = slots[model.types[slots] == code]
+        if len(typeSlots) == 0:
+            continue
+        vertices = bakeVertices(model, typeSlots, positions, normals)
+        offsets = firstVertex + np.arange(len(typeSlots), dtype=np.int64)[:, None] * len(positions)
+        triangles = (indices.astype(np.int64)[None] + offsets).reshape(-1, 3)
+        firstVertex += vertices.shape[0] * vertices.shape[1]
+        yield typeSlots, vertices, triangles
+
+
+"""
+Wavefront OBJ with vertex colors (v x y z r g b) and normals. Vertices and
+faces are written batch by batch as they are baked.
+"""
+class ObjWriter:
+    def __init__(self, filename, meshes):
+        self.filename = filename
+        self.meshes = meshes
+        self.m_file = open(filename + '.tmp', 'w', encoding='utf-8')
+        self.m_file.write("# exported by SceneExport\n")
+        self.m_vertices = 0
+        self.count = 0
+
+    def write(self, model, slots):
+        for _, vertices, triangles in bakedTriangles(model, slots, self.meshes, self.m_vertices + 1):
+            vertices = vertices.reshape(-1, vertices.shape[2])
+            self.writeRows('v %.6g %.6g %.6g %.4g %.4g %.4g\n', vertices[:, [0, 1, 2, 6, 7, 8]])
+            self.writeRows('vn %.4g %.4g %.4g\n', vertices[:, 3:6])
+            # faces reference each vertex with its normal of the same index
+            self.writeRows('f %d//%d %d//%d %d//%d\n', triangles, repeat=2)
+            self.m_vertices += len(vertices)
+        self.count += len(slots)
+
+    """
+    Formats rows a block at a time with one string operation, much faster
+    than a formatting call per row
+    """
+    def writeRows(self, rowFormat, rows, repeat=1):
+        for start in range(0, len(rows), OBJ_WRITE_ROWS):
+            block = np.repeat(rows[start:start + OBJ_WRITE_ROWS], repeat, axis=1)
+            self.m_file.write((rowFormat * len(block)) % tuple(block.ravel().tolist()))
+
+    def close(self):
+        self.m_file.close()
+        os.replace(self.filename + '.tmp', self.filename)
+        return self.count
+
+
+"""
+Binary little endian PLY with normals and vertex colors. PLY lists every
+vertex before the first face, so faces are spooled to a temporary file and
+appended once the counts for the header are known.
+"""
+class PlyWriter:
+    def __init__(self, filename, meshes):
+        self.filename = filename
+        self.meshes = meshes
+        directory = os.path.dirname(os.path.abspath(filename))
+        self.m_vertexFile = tempfile.TemporaryFile(dir=directory)
+        self.m_faceFile = tempfile.TemporaryFile(dir=directory)
+        self.m_vertices = 0
+        self.m_faces = 0
+        self.count = 0
+
+    def write(self, model, slots):
+        for typeSlots, vertices, triangles in bakedTriangles(model, slots, self.meshes,
+                                                             self.m_vertices):
+            perObject = vertices.shape[1]
+            records = np.empty(len(typeSlots) * perObject, dtype=PLY_VERTEX)
+            records['position'] = vertices[:, :, 0:3].reshape(-1, 3)
+            records['normal'] = vertices[:, :, 3:6].reshape(-1, 3)
+            records['color'] = np.repeat(model.colors[typeSlots, :3], perObject, axis=0)
+            faces = np.empty(len(triangles), dtype=PLY_FACE)
+            faces['count'] = 3
+            faces['indices'] = triangles
+            self.m_vertexFile.write(records.tobytes())
+            self.m_faceFile.write(faces.tobytes())
+            self.m_vertices += len(records)
+            self.m_faces += len(faces)
+        self.count += len(slots)
+
+    def close(self):
+        header = "\n".join([
+            "ply", "format binary_little_endian 1.0", "comment exported by SceneExport",
+            f"element vertex {self.m_vertices}",
+            "property float x", "property float y", "property float z",
+            "property float nx", "property float ny", "property float nz",
+            "property uchar red", "property uchar green", "property uchar blue",
+            f"element face {self.m_faces}",
+            "property list uchar int vertex_indices", "end_header", ""])
+        with open(self.filename + '.tmp', 'wb') as ply_file:
+            ply_file.write(header.encode('ascii'))
+            for spool in (self.m_vertexFile, self.m_faceFile):
+                spool.seek(0)
+                shutil.copyfileobj(spool, ply_file)
+                spool.close()
+        os.replace(self.filename + '.tmp', self.filename)
+        return self.count
+
+
+def srgbToLinear(values):
+    values = np.asarray(values, dtype=np.float64) / 255.0
+    return np.where(values <= 0.04045, values / 12.92, ((values + 0.055) / 1.055) ** 2.4)
+
+
+"""
+glTF binary. Every primitive is a node with its world translation,
+rotation and scale that instances one of the shared unit meshes, one mesh
+per shape and color, so the binary chunk only holds the unit geometry
+however large the scene. Nodes are streamed to a temporary file and
+assembled into the JSON chunk on close.
+"""
+class GlbWriter:
+    def __init__(self, filename, meshes):
+        self.filename = filename
+        self.meshes = meshes
+        self.m_nodeFile = tempfile.TemporaryFile('w+', encoding='utf-8',
+                                                 dir=os.path.dirname(os.path.abspath(filename)))
+        # (type code, rgb) -> mesh index, rgb -> material index
+        self.m_meshIndex = {}
+        self.m_materialIndex = {}
+        self.count = 0
+
+    def meshIndex(self, code, color):
+        key = (code, color)
+        index = self.m_meshIndex.get(key)
+        if index is None:
+            self.m_materialIndex.setdefault(color, len(self.m_materialIndex))
+            index = self.m_meshIndex[key] = len(self.m_meshIndex)
+        return index
+
+    def write(self, model, slots):
+        translations = model.worldPositions(slots).tolist()
+        rotations = model.worldRotations(slots).tolist()
+        scales = meshScales(model, slots).tolist()
+        colors = [tuple(color) for color in model.colors[slots, :3].tolist()]
+        codes = model.types[slots].tolist()
+
+        nodes = []
+        for i, slot in enumerate(slots.tolist()):
+            nodes.append(json.dumps({
+                'name': model.names[slot], 'mesh': self.meshIndex(codes[i], colors[i]),
+                'translation': translations[i], 'rotation': rotations[i], 'scale': scales[i]},
+                ensure_ascii=False, separators=(',', ':')))
+        if nodes:
+            self.m_nodeFile.write((',' if self.count else '') + ',\n'.join(nodes))
+        self.count += len(nodes)
+
+    """
+    Binary chunk with the unit meshes, plus the accessors and buffer views
+    describing it, keyed by type code
+    """
+    def geometry(self):
+        chunks, views, accessors, layout = [], [], [], {}
+        offset = 0
+        for code, (positions, normals, indices) in self.meshes.items():
+            attributes = {}
+            for name, data, target in (('POSITION', positions, ARRAY_BUFFER),
+                                       ('NORMAL', normals, ARRAY_BUFFER),
+                                       ('indices', indices, ELEMENT_ARRAY_BUFFER)):
+                data = np.ascontiguousarray(data)
+                views.append({'buffer': 0, 'byteOffset': offset, 'byteLength': data.nbytes,
+                              'target': target})
+                accessor = {'bufferView': len(views) - 1, 'count': len(data)}
+                if name == 'indices':
+                    accessor.update(componentType=UNSIGNED_INT, type='SCALAR')
+                else:
+                    accessor.update(componentType=FLOAT, type='VEC3')
+                if name == 'POSITION':
+                    accessor.update(min=data.min(axis=0).tolist(), max=data.max(axis=0).tolist())
+                accessors.append(accessor)
+                attributes[name] = len(accessors) - 1
+                chunks.append(data.tobytes())
+                offset += data.nbytes
+            layout[code] = attributes
+        return b''.join(chunks), views, accessors, layout
+
+    def close(self):
+        binary, views, accessors, layout = self.geometry()
+        binary += b'\0' * (-len(binary) % 4)
+        materials = [None] * len(self.m_materialIndex)
+        for color, index in self.m_materialIndex.items():
+            materials[index] = {'name': '#%02x%02x%02x' % color, 'pbrMetallicRoughness': {
+                'baseColorFactor': srgbToLinear(color).tolist() + [1.0],
+                'metallicFactor': 0.0, 'roughnessFactor': 0.8}}
+        meshes = [None] * len(self.m_meshIndex)
+        for (code, color), index in self.m_meshIndex.items():
+            attributes = layout[code]
+            meshes[index] = {'name': TYPE_NAMES[code], 'primitives': [{
+                'attributes': {'POSITION': attributes['POSITION'], 'NORMAL': attributes['NORMAL']},
+                'indices': attributes['indices'], 'material': self.m_materialIndex[color]}]}
+
+        head = {'asset': {'version': '2.0', 'generator': 'SceneExport'}, 'scene': 0,
+                'scenes': [{'nodes': [0]}]}
+        # glTF arrays may not be empty, as meshes and materials are without nodes
+        tail = {key: value for key, value in (
+            ('meshes', meshes), ('materials', materials), ('accessors', accessors),
+            ('bufferViews', views), ('buffers', [{'byteLength': len(binary)}])) if value}
+        directory = os.path.dirname(os.path.abspath(self.filename))
+        with tempfile.TemporaryFile('w+b', dir=directory) as json_file:
+            def text(value):
+                json_file.write(value.encode('utf-8'))
+
+            # the root node lists every primitive node as a child
+            text(json.dumps(head)[:-1] + ',"nodes":[{"name":"scene"')
+            if self.count:
+                text(',"children":[')
+                for start in range(1, self.count + 1, CHILDREN_PER_LINE):
+                    end = min(start + CHILDREN_PER_LINE, self.count + 1)
+                    text((',' if start > 1 else '') + ','.join(map(str, range(start, end))) + '\n')
+                text(']},')
+            else:
+                text('}')
+            self.m_nodeFile.seek(0)
+            while True:
+                block = self.m_nodeFile.read(1 << 16)
+                if not block:
+                    break
+                text(block)
+            self.m_nodeFile.close()
+            text('],' + json.dumps(tail)[1:])
+            text(' ' * (-json_file.tell() % 4))
+            jsonLength = json_file.tell()
+
+            with open(self.filename + '.tmp', 'wb') as glb_file:
+                glb_file.write(struct.pack('<4sII', GLB_MAGIC, GLB_VERSION,
+                                           12 + 8 + jsonLength + 8 + len(binary)))
+                glb_file.write(struct.pack('<II', jsonLength, GLB_JSON))
+                json_file.seek(0)
+                shutil.copyfileobj(json_file, glb_file)
+                glb_file.write(struct.pack('<II', len(binary), GLB_BIN))
+                glb_file.write(binary)
+        os.replace(self.filename + '.tmp', self.filename)
+        return self.count
+
+
+WRITERS = {'glb': GlbWriter, 'obj': ObjWriter, 'ply': PlyWriter}
+
+
+"""
+Streams the primitives of source (a SceneFile or scene store) into
+filename. The format follows the extension unless given. Returns the
+number of primitives written.
+"""
+def exportScene(source, filename, fmt=None, rings=EXPORT_SPHERE_RINGS,
+                slices=EXPORT_SPHERE_SLICES, batchSize=READ_BATCH):
+    fmt = fmt or FORMATS.get(os.path.splitext(filename)[1].lower())
+    if fmt not in WRITERS:
+        raise ValueError(f"cannot tell the export format of {filename}")
+    writer = WRITERS[fmt](filename, unitMeshes(rings, slices))
+    for model, slots in sceneBatches(source, batchSize):
+        writer.write(model, slots)
+    return writer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export a stored or binary scene as glTF binary, OBJ or PLY")
+    parser.add_argument("destination", help="output file, .glb, .obj or .ply")
+    parser.add_argument("--source", help="binary .scene file, or the file of the store backend")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=STORE_BACKEND)
+    parser.add_argument("--format", choices=sorted(WRITERS))
+    parser.add_argument("--rings", type=int, default=EXPORT_SPHERE_RINGS,
+                        help="rings and slices of exported spheres")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.source and args.source.endswith('.scene'):
+        source = SceneFile(args.source)
+    else:
+        storeClass, defaultFilename = BACKENDS[args.backend]
+        source = storeClass(args.source or defaultFilename)
+    try:
+        count = exportScene(source, args.destination, args.format, args.rings, args.rings)
+    finally:
+        source.close()
+    print(f"Exported {count} primitives to {args.destination} "
+          f"in {time.perf_counter() - start:.2f} s")
+    sys.exit(0)
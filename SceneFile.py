@@ -0,0 +1,209 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+import sys
+import numpy as np
+from SceneModel import SceneModel
+
+SCENE_MAGIC = b'PSCN'
+SCENE_VERSION = 1
+SCENE_BINARY = "primitive_objects.scene"
+
+# magic, version, flags, record count, record size, string table offset
+HEADER = struct.Struct('<4sHHIIQ')
+
+# one fixed-width little-endian record per primitive; names live in the
+# string table as UTF-8 at nameOffset
+RECORD_DTYPE = np.dtype([('id', '<i8'),
+                         ('type', 'u1'),
+                         ('color', 'u1', (4,)),
+                         ('padding', 'u1', (3,)),
+                         ('nameOffset', '<u4'),
+                         ('nameLength', '<u4'),
+                         ('position', '<f4', (3,)),
+                         ('rotation', '<f4', (4,)),
+                         ('dimensions', '<f4', (3,))])
+
+
+class SceneFormatError(ValueError):
+    pass
+
+
+"""
+Writes primitives given as columns (as held by SceneModel) to a binary
+scene file. The file is written next to filename and moved into place.
+"""
+def writeScene(filename, ids, types, positions, rotations, colors, dimensions, names):
+    encoded = [name.encode('utf-8') for name in names]
+    lengths = np.fromiter((len(name) for name in encoded), dtype=np.uint64, count=len(encoded))
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.uint64)
+
+    records = np.zeros(len(encoded), dtype=RECORD_DTYPE)
+    records['id'] = ids
+    records['type'] = types
+    records['color'] = colors
+    records['nameOffset'] = offsets
+    records['nameLength'] = lengths
+    records['position'] = positions
+    records['rotation'] = rotations
+    records['dimensions'] = dimensions
+
+    stringsOffset = HEADER.size + records.nbytes
+    temporary = filename + '.tmp'
+    with open(temporary, 'wb') as scene_file:
+        scene_file.write(HEADER.pack(SCENE_MAGIC, SCENE_VERSION, 0, len(records),
+                                     RECORD_DTYPE.itemsize, stringsOffset))
+        scene_file.write(records.tobytes())
+        scene_file.write(b''.join(encoded))
+    os.replace(temporary, filename)
+    return len(records)
+
+
+"""
+Columns of the given slots of model (all primitives by default) as
+writeScene takes them. They are copies, so they can be written on another
+thread while the model changes. Scene files have no groups, so grouped
+primitives get their world transforms.
+"""
+def sceneColumns(model, slots=None):
+    slots = model.activeSlots() if slots is None else np.asarray(slots, dtype=np.int64)
+    return (model.ids[slots], model.types[slots], model.worldPositions(slots),
+            model.worldRotations(slots), model.colors[slots], model.dimensions[slots],
+            [model.names[slot] for slot in slots.tolist()])
+
+
+"""
+Writes the given slots of model (all primitives by default) to filename
+"""
+def exportModel(filename, model, slots=None):
+    return writeScene(filename, *sceneColumns(model, slots))
+
+
+"""
+Read-only, memory-mapped binary scene. records is a NumPy structured view
+onto the mapping, so columns are read without copying or creating Python
+objects per field; names are decoded on request.
+"""
+class SceneFile:
+    def __init__(self, filename):
+        self.filename = filename
+        self.m_file = open(filename, 'rb')
+        try:
+            self.m_mmap = mmap.mmap(self.m_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self.m_file.close()
+            raise SceneFormatError(f"{filename} is empty")
+
+        if len(self.m_mmap) < HEADER.size:
+            self.close()
+            raise SceneFormatError(f"{filename} is truncated")
+        magic, version, flags, count, recordSize, stringsOffset = HEADER.unpack_from(self.m_mmap)
+        if magic != SCENE_MAGIC:
+            self.close()
+            raise SceneFormatError(f"{filename} is not a scene file")
+        if version != SCENE_VERSION or recordSize != RECORD_DTYPE.itemsize:
+            self.close()
+            raise SceneFormatError(f"{filename} has unsupported version {version}")
+
+        self.version = version
+        self.records = np.frombuffer(self.m_mmap, RECORD_DTYPE, count, HEADER.size)
+        self.m_strings = memoryview(self.m_mmap)[stringsOffset:]
+
+    def __len__(self):
+        return len(self.records)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    """
+    Asks the kernel to start reading the whole file in, so batches copied
+    on the GUI thread find their pages resident
+    """
+    def prefetch(self):
+        if hasattr(mmap, 'MADV_WILLNEED'):
+            self.m_mmap.madvise(mmap.MADV_WILLNEED)
+
+    def names(self, start=0, end=None):
+        records = self.records[start:end]
+        offsets = records['nameOffset'].tolist()
+        lengths = records['nameLength'].tolist()
+        strings = self.m_strings
+        return [str(strings[offset:offset + length], 'utf-8')
+                for offset, length in zip(offsets, lengths)]
+
+    """
+    Loads records start:end into model in one vectorized pass and returns
+    their slots
+    """
+    def loadInto(self, model, start=0, end=None):
+        records = self.records[start:end]
+        slots = model.allocateMany(records['type'])
+        model.ids[slots] = records['id']
+        model.positions[slots] = records['position']
+        model.rotations[slots] = records['rotation']
+        model.colors[slots] = records['color']
+        model.dimensions[slots] = records['dimensions']
+        for slot, name in zip(slots.tolist(), self.names(start, end)):
+            model.names[slot] = name
+        return slots
+
+    """
+    Unmaps the file. Views of records must not be used afterwards.
+    """
+    def close(self):
+        self.records = None
+        if getattr(self, 'm_strings', None) is not None:
+            self.m_strings.release()
+            self.m_strings = None
+        if getattr(self, 'm_mmap', None) is not None:
+            self.m_mmap.close()
+            self.m_mmap = None
+        self.m_file.close()
+
+
+"""
+Converts a pysondb JSON scene to the binary format. Values are narrowed to
+the float32 the editor keeps in memory; ids, names, types and colors are
+exact.
+"""
+def jsonToBinary(json_filename, scene_filename):
+    with open(json_filename, "r", encoding="utf-8") as json_file:
+        records = json.load(json_file)["data"]
+    model = SceneModel(max(1, len(records)))
+    slots = model.addRecords(records)
+    return exportModel(scene_filename, model, slots)
+
+
+"""
+Converts a binary scene to the pysondb JSON layout, with ids
+"""
+def binaryToJson(scene_filename, json_filename):
+    with SceneFile(scene_filename) as scene:
+        model = SceneModel(max(1, len(scene)))
+        slots = scene.loadInto(model)
+    records = model.toRecords(slots)
+    for record, persist_id in zip(records, model.ids[slots].tolist()):
+        record['id'] = persist_id
+    with open(json_filename, "w", encoding="utf-8") as json_file:
+        json.dump({"data": records}, json_file, indent=3, ensure_ascii=False)
+    return len(records)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert between JSON and binary scene files")
+    parser.add_argument("direction", choices=["to-binary", "to-json"])
+    parser.add_argument("source")
+    parser.add_argument("destination")
+    args = parser.parse_args()
+
+    if args.direction == "to-binary":
+        count = jsonToBinary(args.source, args.destination)
+    else:
+        count = binaryToJson(args.source, args.destination)
+    print(f"Converted {count} primitives into {args.destination}")
+    sys.exit(0)
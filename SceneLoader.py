@@ -0,0 +1,190 @@
+import time
+from PySide2 import QtCore
+from SceneFile import SceneFile
+
+BATCH_SIZE = 200
+FRAME_BUDGET_MS = 8.0
+# chunks of a partitioned store within this distance of the camera are loaded
+CHUNK_LOAD_RADIUS = 250.0
+STREAM_INTERVAL_MS = 250
+
+"""
+Restores the stored scene progressively. Records are read and parsed on
+the read pool of the storage worker, then primitives are built and listed
+in batches across event loop ticks so the window stays responsive while the
+scene streams in. A binary scene file is memory-mapped instead, on the
+worker as well, and each batch is copied into the scene model in one
+vectorized pass. From a chunked store only the chunks near the camera are
+read at first; the rest stream in as the camera moves towards them. A read
+that fails finishes the restore with what was loaded, and chunks that could
+not be read are requested again when the camera next moves.
+"""
+class SceneLoader(QtCore.QObject):
+    progress = QtCore.Signal(int, int)
+    finished = QtCore.Signal()
+
+    def __init__(self, shapeEditor, sceneFile=None, batchSize=BATCH_SIZE,
+                 frameBudgetMs=FRAME_BUDGET_MS):
+        super().__init__()
+        self.shapeEditor = shapeEditor
+        self.sceneFile = sceneFile
+        self.m_scene = None
+        self.batchSize = batchSize
+        self.frameBudget = frameBudgetMs / 1000.0
+        self.m_records = []
+        self.m_index = 0
+        self.loadRadius = CHUNK_LOAD_RADIUS
+        self.m_chunked = False
+        self.m_requested = set()
+        self.m_inflight = []
+        self.m_streaming = False
+
+        self.streamTimer = QtCore.QTimer(self)
+        self.streamTimer.setSingleShot(True)
+        self.streamTimer.setInterval(STREAM_INTERVAL_MS)
+        self.streamTimer.timeout.connect(self.streamChunks)
+
+    def start(self):
+        worker = self.shapeEditor.storageWorker
+        if self.sceneFile is not None:
+            worker.read(self.openScene, callback=self.beginRestore, errback=self.readFailed)
+        else:
+            worker.read(self.readRecords, self.cameraPosition(), callback=self.beginRestore,
+                        errback=self.readFailed)
+
+    def cameraPosition(self):
+        position = self.shapeEditor.m_cameraEntity.position()
+        return (position.x(), position.y(), position.z())
+
+    """
+    Runs on a worker thread; the records are delivered on the GUI thread
+    """
+    def readRecords(self, center):
+        store = self.shapeEditor.storageWorker.store()
+        if not store.chunked:
+            return store.getAll()
+        self.m_chunked = True
+        return self.readChunks(center)
+
+    """
+    Runs on a worker thread. Reads the chunks around center not requested
+    before.
+    """
+    def readChunks(self, center):
+        store = self.shapeEditor.storageWorker.store()
+        keys = [key for key in store.chunksNear(center, self.loadRadius)
+                if key not in self.m_requested]
+        self.m_requested.update(keys)
+        self.m_inflight = keys
+        return store.getChunks(keys)
+
+    """
+    Runs on a worker thread. Mapping the file is cheap, records are paged
+    in as batches read them.
+    """
+    def openScene(self):
+        self.m_scene = SceneFile(self.sceneFile)
+        self.m_scene.prefetch()
+        return self.m_scene
+
+    def beginRestore(self, records):
+        if self.m_chunked:
+            self.shapeEditor.m_cameraEntity.viewMatrixChanged.connect(self.markDirty)
+        self.restoreRecords(records)
+
+    """
+    The initial read failed; the restore finishes with an empty scene
+    """
+    def readFailed(self, error):
+        if self.m_scene is not None:
+            self.m_scene.close()
+            self.m_scene = None
+        self.m_requested.difference_update(self.m_inflight)
+        self.m_inflight = []
+        self.beginRestore([])
+
+    def markDirty(self):
+        if not self.streamTimer.isActive():
+            self.streamTimer.start()
+
+    """
+    Requests the chunks the camera has come near, one read at a time
+    """
+    def streamChunks(self):
+        if self.m_streaming:
+            self.markDirty()
+            return
+        self.m_streaming = True
+        self.shapeEditor.storageWorker.read(self.readChunks, self.cameraPosition(),
+                                            callback=self.appendRecords,
+                                            errback=self.streamFailed)
+
+    def streamFailed(self, error):
+        self.m_streaming = False
+        self.m_requested.difference_update(self.m_inflight)
+        self.m_inflight = []
+
+    """
+    Queues streamed records behind a restore in progress, skipping any the
+    editor already has because they were saved into the chunk meanwhile
+    """
+    def appendRecords(self, records):
+        self.m_streaming = False
+        self.m_inflight = []
+        records = [record for record in records
+                   if self.shapeEditor.primitiveFor(record['id']) is None]
+        if not records:
+            return
+        if self.m_index < len(self.m_records):
+            self.m_records.extend(records)
+        else:
+            self.restoreRecords(records)
+
+    def restoreRecords(self, records):
+        self.m_records = records
+        self.m_index = 0
+        self.progress.emit(0, len(records))
+        QtCore.QTimer.singleShot(0, self.restoreBatch)
+
+    """
+    Restores up to batchSize primitives, stopping early when the frame budget
+    is spent, then adds them to the scene in one go and yields back to the
+    event loop
+    """
+    def restoreBatch(self):
+        start = time.perf_counter()
+        end = min(self.m_index + self.batchSize, len(self.m_records))
+        primitives = []
+        if self.m_scene is not None:
+            primitives = self.restoreSceneRows(self.m_index, end)
+            self.m_index = end
+        while self.m_index < end:
+            primitive = self.shapeEditor.createPrimitive(self.m_records[self.m_index])
+            if primitive is not None:
+                primitives.append(primitive)
+            self.m_index += 1
+            if time.perf_counter() - start > self.frameBudget:
+                break
+
+        self.shapeEditor.addPrimitives(primitives)
+        self.progress.emit(self.m_index, len(self.m_records))
+
+        if self.m_index < len(self.m_records):
+            QtCore.QTimer.singleShot(0, self.restoreBatch)
+        else:
+            self.m_records = []
+            if self.m_scene is not None:
+                self.m_scene.close()
+                self.m_scene = None
+            self.finished.emit()
+
+    """
+    Builds primitives for rows start:end of the scene file and queues them
+    for storage
+    """
+    def restoreSceneRows(self, start, end):
+        slots = self.m_scene.loadInto(self.shapeEditor.sceneModel, start, end)
+        primitives = self.shapeEditor.createFromSlots(slots)
+        for primitive in primitives:
+            self.shapeEditor.persistenceQueue.markDirty(primitive)
+        return primitives
@@ -0,0 +1,539 @@
+import numpy as np
+
+TYPE_CODES = {'sphere': 1, 'cube': 2}
+TYPE_NAMES = {code: name for name, code in TYPE_CODES.items()}
+# uniform scale the editor draws each shape with; not persisted
+BASE_SCALES = {'sphere': 1.3, 'cube': 4.0}
+INITIAL_CAPACITY = 1024
+# persisted fields and the arrays holding them
+FIELD_ARRAYS = {'position': 'positions', 'rotation': 'rotations',
+                'color': 'colors', 'dimensions': 'dimensions', 'parent': 'parents'}
+GROUP_FIELD_ARRAYS = {'position': 'groupPositions', 'rotation': 'groupRotations',
+                      'color': 'groupColors', 'name': 'groupNames', 'parent': 'groupParents'}
+
+
+"""
+Quaternions (x, y, z, w) from Euler angles in degrees, matching
+QQuaternion.fromEulerAngles
+"""
+def eulerToQuaternions(euler):
+    half = np.radians(np.asarray(euler, dtype=np.float64)) * 0.5
+    pitch, yaw, roll = half[..., 0], half[..., 1], half[..., 2]
+    c1, s1 = np.cos(yaw), np.sin(yaw)
+    c2, s2 = np.cos(roll), np.sin(roll)
+    c3, s3 = np.cos(pitch), np.sin(pitch)
+    c1c2, s1s2 = c1 * c2, s1 * s2
+    w = c1c2 * c3 + s1s2 * s3
+    x = c1c2 * s3 + s1s2 * c3
+    y = s1 * c2 * c3 - c1 * s2 * s3
+    z = c1 * s2 * c3 - s1 * c2 * s3
+    return np.stack([x, y, z, w], axis=-1)
+
+
+"""
+Euler angles in degrees from quaternions (x, y, z, w), matching
+QQuaternion.toEulerAngles
+"""
+def quaternionsToEuler(quaternions):
+    q = np.asarray(quaternions, dtype=np.float64)
+    x, y, z, w = q[..., 0], q[..., 1], q[..., 2], q[..., 3]
+    lengthSquared = np.sum(q * q, axis=-1)
+    scale = 1.0 / np.where(lengthSquared > 0, lengthSquared, 1.0)
+    xx, xy, xz, xw = x * x * scale, x * y * scale, x * z * scale, x * w * scale
+    yy, yz, yw = y * y * scale, y * z * scale, y * w * scale
+    zz, zw = z * z * scale, z * w * scale
+
+    pitch = np.arcsin(np.clip(-2.0 * (yz - xw), -1.0, 1.0))
+    regular = np.abs(pitch) < np.pi / 2
+    yaw = np.where(regular, np.arctan2(2.0 * (xz + yw), 1.0 - 2.0 * (xx + yy)),
+                   np.sign(pitch) * np.arctan2(-2.0 * (xy - zw), 1.0 - 2.0 * (yy + zz)))
+    roll = np.where(regular, np.arctan2(2.0 * (xy + zw), 1.0 - 2.0 * (xx + zz)), 0.0)
+    return np.degrees(np.stack([pitch, yaw, roll], axis=-1))
+
+
+"""
+Hamilton products a * b of quaternions (x, y, z, w), broadcasting over
+leading dimensions
+"""
+def multiplyQuaternions(a, b):
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    ax, ay, az, aw = a[..., 0], a[..., 1], a[..., 2], a[..., 3]
+    bx, by, bz, bw = b[..., 0], b[..., 1], b[..., 2], b[..., 3]
+    return np.stack([aw * bx + ax * bw + ay * bz - az * by,
+                     aw * by - ax * bz + ay * bw + az * bx,
+                     aw * bz + ax * by - ay * bx + az * bw,
+                     aw * bw - ax * bx - ay * by - az * bz], axis=-1)
+
+
+"""
+Vectors (n, 3) rotated by quaternions (n, 4) stored xyzw
+"""
+def rotateVectors(quaternions, vectors):
+    axis = quaternions[:, :3]
+    turned = np.cross(axis, vectors) + quaternions[:, 3:] * vectors
+    return vectors + 2.0 * np.cross(axis, turned)
+
+
+def conjugateQuaternions(quaternions):
+    return quaternions * np.array([-1.0, -1.0, -1.0, 1.0], dtype=quaternions.dtype)
+
+
+def colorsToHex(colors):
+    return ['#%02x%02x%02x' % (int(r), int(g), int(b)) for r, g, b in colors[:, :3]]
+
+
+def hexToColor(text):
+    text = text.lstrip('#')
+    return (int(text[0:2], 16), int(text[2:4], 16), int(text[4:6], 16), 255)
+
+
+"""
+Columnar scene state. Every primitive owns a stable slot in contiguous NumPy
+arrays; Primitive objects are views onto their slot and push changes to
+Qt3D. Dimensions hold (radius, 0, 0) for spheres and the (x, y, z) extents
+(length, height, width) for cubes.
+
+Groups live in a second, smaller table with their own local transforms
+and parent group. parents holds the group row of each slot, or -1, and
+positions and rotations of grouped slots are relative to their group.
+World transforms of groups are recomputed lazily, once something reads
+them after a group changed.
+"""
+class SceneModel:
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.capacity = 0
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.types = np.zeros(0, dtype=np.uint8)
+        self.positions = np.zeros((0, 3), dtype=np.float32)
+        self.rotations = np.zeros((0, 4), dtype=np.float32)
+        self.scales = np.zeros((0, 3), dtype=np.float32)
+        self.colors = np.zeros((0, 4), dtype=np.uint8)
+        self.dimensions = np.zeros((0, 3), dtype=np.float32)
+        self.parents = np.zeros(0, dtype=np.int32)
+        self.names = []
+        self.m_free = []
+        self.grow(capacity)
+
+        self.groupIds = np.zeros(0, dtype=np.int64)
+        self.groupParents = np.zeros(0, dtype=np.int32)
+        self.groupPositions = np.zeros((0, 3), dtype=np.float32)
+        self.groupRotations = np.zeros((0, 4), dtype=np.float32)
+        self.groupWorldPositions = np.zeros((0, 3), dtype=np.float32)
+        self.groupWorldRotations = np.zeros((0, 4), dtype=np.float32)
+        self.groupNames = []
+        self.groupColors = []
+        self.m_groupIndex = {}
+        self.m_groupFree = []
+        self.m_worldDirty = False
+
+    def grow(self, capacity):
+        def resized(array, fill=0):
+            shape = (capacity,) + array.shape[1:]
+            grown = np.full(shape, fill, dtype=array.dtype)
+            grown[:len(array)] = array
+            return grown
+
+        self.ids = resized(self.ids)
+        self.types = resized(self.types)
+        self.positions = resized(self.positions)
+        self.rotations = resized(self.rotations)
+        self.scales = resized(self.scales, 1)
+        self.colors = resized(self.colors)
+        self.dimensions = resized(self.dimensions)
+        self.parents = resized(self.parents, -1)
+        self.names.extend([None] * (capacity - self.capacity))
+        self.m_free.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    """
+    Reserves a slot for a new primitive of primitiveType with identity
+    rotation and unit scale
+    """
+    def allocate(self, primitiveType):
+        if not self.m_free:
+            self.grow(self.capacity * 2)
+        slot = self.m_free.pop()
+        self.types[slot] = TYPE_CODES[primitiveType]
+        self.ids[slot] = 0
+        self.positions[slot] = 0.0
+        self.rotations[slot] = (0.0, 0.0, 0.0, 1.0)
+        self.scales[slot] = 1.0
+        self.colors[slot] = (0, 0, 0, 255)
+        self.dimensions[slot] = 0.0
+        self.parents[slot] = -1
+        self.names[slot] = ''
+        return slot
+
+    """
+    Reserves one slot per entry of types (type codes) in a single pass, for
+    bulk loads
+    """
+    def allocateMany(self, types):
+        types = np.asarray(types, dtype=np.uint8)
+        count = len(types)
+        if count == 0:
+            return np.zeros(0, dtype=np.int64)
+        while len(self.m_free) < count:
+            self.grow(self.capacity * 2)
+        slots = np.array(self.m_free[-count:][::-1], dtype=np.int64)
+        del self.m_free[-count:]
+
+        self.types[slots] = types
+        self.ids[slots] = 0
+        self.positions[slots] = 0.0
+        self.rotations[slots] = (0.0, 0.0, 0.0, 1.0)
+        self.scales[slots] = 1.0
+        self.colors[slots] = (0, 0, 0, 255)
+        self.dimensions[slots] = 0.0
+        self.parents[slots] = -1
+        for slot in slots.tolist():
+            self.names[slot] = ''
+        return slots
+
+    def release(self, slot):
+        self.types[slot] = 0
+        self.ids[slot] = 0
+        self.parents[slot] = -1
+        self.names[slot] = None
+        self.m_free.append(slot)
+
+    def releaseMany(self, slots):
+        self.types[slots] = 0
+        self.ids[slots] = 0
+        self.parents[slots] = -1
+        for slot in slots.tolist():
+            self.names[slot] = None
+        self.m_free.extend(slots.tolist()[::-1])
+
+    def __len__(self):
+        return self.capacity - len(self.m_free)
+
+    def activeSlots(self):
+        return np.flatnonzero(self.types)
+
+    def slotsOfType(self, primitiveType):
+        return np.flatnonzero(self.types == TYPE_CODES[primitiveType])
+
+    """
+    Active slots whose world position lies within radius of center
+    """
+    def slotsWithin(self, center, radius):
+        slots = self.activeSlots()
+        offsets = self.worldPositions(slots) - np.asarray(center, dtype=np.float32)
+        return slots[np.einsum('ij,ij->i', offsets, offsets) <= radius * radius]
+
+    """
+    Axis aligned bounds (lo, hi) of all primitive world positions
+    """
+    def bounds(self):
+        slots = self.activeSlots()
+        if len(slots) == 0:
+            return None
+        positions = self.worldPositions(slots)
+        return positions.min(axis=0), positions.max(axis=0)
+
+    """
+    Row of the group with persist_id, adding an identity group at the top
+    level when it is not known yet
+    """
+    def groupIndex(self, persist_id):
+        index = self.m_groupIndex.get(persist_id)
+        if index is not None:
+            return index
+        if not self.m_groupFree:
+            self.growGroups(max(16, 2 * len(self.groupIds)))
+        index = self.m_groupFree.pop()
+        self.m_groupIndex[persist_id] = index
+        self.groupIds[index] = persist_id
+        self.groupParents[index] = -1
+        self.groupPositions[index] = 0.0
+        self.groupRotations[index] = (0.0, 0.0, 0.0, 1.0)
+        self.groupNames[index] = ''
+        self.groupColors[index] = None
+        self.m_worldDirty = True
+        return index
+
+    def growGroups(self, capacity):
+        old = len(self.groupIds)
+
+        def resized(array, fill=0):
+            grown = np.full((capacity,) + array.shape[1:], fill, dtype=array.dtype)
+            grown[:old] = array
+            return grown
+
+        self.groupIds = resized(self.groupIds)
+        self.groupParents = resized(self.groupParents, -1)
+        self.groupPositions = resized(self.groupPositions)
+        self.groupRotations = resized(self.groupRotations)
+        self.groupWorldPositions = resized(self.groupWorldPositions)
+        self.groupWorldRotations = resized(self.groupWorldRotations)
+        self.groupNames.extend([None] * (capacity - old))
+        self.groupColors.extend([None] * (capacity - old))
+        self.m_groupFree.extend(range(capacity - 1, old - 1, -1))
+
+    def releaseGroup(self, index):
+        del self.m_groupIndex[int(self.groupIds[index])]
+        self.groupIds[index] = 0
+        self.groupParents[index] = -1
+        self.groupNames[index] = None
+        self.m_groupFree.append(index)
+        self.m_worldDirty = True
+
+    def activeGroups(self):
+        return np.flatnonzero(self.groupIds)
+
+    def slotsInGroup(self, index):
+        return np.flatnonzero((self.parents == index) & (self.types != 0))
+
+    def childGroups(self, index):
+        return np.flatnonzero((self.groupParents == index) & (self.groupIds != 0))
+
+    """
+    Flags group world transforms for recomputation after a group moved,
+    turned or changed parent
+    """
+    def markWorldDirty(self):
+        self.m_worldDirty = True
+
+    """
+    Recomputes the world transforms of all groups, parents before children,
+    if any group changed since the last call
+    """
+    def updateWorld(self):
+        if not self.m_worldDirty:
+            return
+        self.m_worldDirty = False
+        groups = self.activeGroups()
+        parents = self.groupParents[groups]
+        depth = np.zeros(len(self.groupIds), dtype=np.int32)
+        pending = groups[parents >= 0]
+        ancestors = self.groupParents[pending]
+        level = 0
+        while len(pending):
+            level += 1
+            if level > len(groups):
+                raise ValueError("group hierarchy contains a cycle")
+            depth[pending] = level
+            ancestors = self.groupParents[ancestors]
+            nested = ancestors >= 0
+            pending, ancestors = pending[nested], ancestors[nested]
+
+        top = groups[parents < 0]
+        self.groupWorldPositions[top] = self.groupPositions[top]
+        self.groupWorldRotations[top] = self.groupRotations[top]
+        for current in range(1, level + 1):
+            rows = groups[depth[groups] == current]
+            parentRows = self.groupParents[rows]
+            rotation = self.groupWorldRotations[parentRows]
+            self.groupWorldPositions[rows] = rotateVectors(rotation, self.groupPositions[rows]) + \
+                self.groupWorldPositions[parentRows]
+            self.groupWorldRotations[rows] = multiplyQuaternions(rotation, self.groupRotations[rows])
+
+    """
+    World positions of slots, applying the transforms of their groups
+    """
+    def worldPositions(self, slots):
+        positions = self.positions[slots]
+        grouped = self.parents[slots] >= 0
+        if not grouped.any():
+            return positions
+        self.updateWorld()
+        rows = self.parents[slots][grouped]
+        positions = positions.copy()
+        positions[grouped] = rotateVectors(self.groupWorldRotations[rows], positions[grouped]) + \
+            self.groupWorldPositions[rows]
+        return positions
+
+    def worldRotations(self, slots):
+        rotations = self.rotations[slots]
+        grouped = self.parents[slots] >= 0
+        if not grouped.any():
+            return rotations
+        self.updateWorld()
+        rows = self.parents[slots][grouped]
+        rotations = rotations.copy()
+        rotations[grouped] = multiplyQuaternions(self.groupWorldRotations[rows], rotations[grouped])
+        return rotations
+
+    """
+    Moves slots into group row index (-1 for the top level), rewriting
+    their local transforms so they keep their place in the world
+    """
+    def setParents(self, slots, index):
+        slots = np.asarray(slots, dtype=np.int64)
+        positions = self.worldPositions(slots)
+        rotations = self.worldRotations(slots)
+        if index >= 0:
+            self.updateWorld()
+            inverse = np.repeat(conjugateQuaternions(self.groupWorldRotations[index:index + 1]),
+                                len(slots), axis=0)
+            positions = rotateVectors(inverse, positions - self.groupWorldPositions[index])
+            rotations = multiplyQuaternions(inverse, rotations)
+        self.positions[slots] = positions
+        self.rotations[slots] = rotations
+        self.parents[slots] = index
+
+    """
+    Moves group row into parent (-1 for the top level), keeping its place
+    in the world
+    """
+    def setGroupParent(self, index, parent):
+        self.updateWorld()
+        position = self.groupWorldPositions[index:index + 1]
+        rotation = self.groupWorldRotations[index:index + 1]
+        if parent >= 0:
+            inverse = conjugateQuaternions(self.groupWorldRotations[parent:parent + 1])
+            position = rotateVectors(inverse, position - self.groupWorldPositions[parent])
+            rotation = multiplyQuaternions(inverse, rotation)
+        self.groupPositions[index] = position[0]
+        self.groupRotations[index] = rotation[0]
+        self.groupParents[index] = parent
+        self.m_worldDirty = True
+
+    """
+    Persisted fields of slot as plain Python values, compact enough to keep
+    in the undo log
+    """
+    def fields(self, slot):
+        return {'position': tuple(self.positions[slot].tolist()),
+                'rotation': tuple(self.rotations[slot].tolist()),
+                'color': tuple(self.colors[slot].tolist()),
+                'dimensions': tuple(self.dimensions[slot].tolist()),
+                'name': self.names[slot]}
+
+    """
+    Writes fields to slot; a parent is given as a group row, -1 for the top
+    level
+    """
+    def setFields(self, slot, fields):
+        for name, value in fields.items():
+            if name == 'name':
+                self.names[slot] = value
+            else:
+                getattr(self, FIELD_ARRAYS[name])[slot] = value
+
+    def groupFields(self, index):
+        return {'position': tuple(self.groupPositions[index].tolist()),
+                'rotation': tuple(self.groupRotations[index].tolist()),
+                'color': self.groupColors[index],
+                'name': self.groupNames[index]}
+
+    def setGroupFields(self, index, fields):
+        for name, value in fields.items():
+            getattr(self, GROUP_FIELD_ARRAYS[name])[index] = value
+        self.m_worldDirty = True
+
+    """
+    Parent group persist_id (None at the top level) and local transform of
+    slot, which together place it in the world
+    """
+    def placement(self, slot):
+        parent = int(self.parents[slot])
+        return {'parent': int(self.groupIds[parent]) if parent >= 0 else None,
+                'position': tuple(self.positions[slot].tolist()),
+                'rotation': tuple(self.rotations[slot].tolist())}
+
+    def groupPlacement(self, index):
+        parent = int(self.groupParents[index])
+        return {'parent': int(self.groupIds[parent]) if parent >= 0 else None,
+                'position': tuple(self.groupPositions[index].tolist()),
+                'rotation': tuple(self.groupRotations[index].tolist())}
+
+    def memoryBytes(self):
+        arrays = (self.ids, self.types, self.positions, self.rotations,
+                  self.scales, self.colors, self.dimensions, self.parents)
+        return sum(array.nbytes for array in arrays)
+
+    """
+    Loads records in the Primitive.toDict layout, keeping their ids, and
+    returns their new slots. Group records fill the group table instead;
+    records of unknown type are skipped.
+    """
+    def addRecords(self, records):
+        for record in records:
+            if record.get('type') == 'group':
+                self.setGroupRecord(record)
+        records = [record for record in records if record.get('type') in TYPE_CODES]
+        slots = self.allocateMany([TYPE_CODES[record['type']] for record in records])
+        if len(records) == 0:
+            return slots
+
+        def xyz(values):
+            return (values['x'], values['y'], values['z'])
+
+        def dimensions(record):
+            specific = record['primitive_specific']
+            if record['type'] == 'sphere':
+                return (specific['radius'], 0.0, 0.0)
+            return (specific['length'], specific['height'], specific['width'])
+
+        self.ids[slots] = [record.get('id') or 0 for record in records]
+        self.positions[slots] = [xyz(record['position']) for record in records]
+        self.rotations[slots] = eulerToQuaternions([xyz(record['rotation']) for record in records])
+        self.colors[slots] = [hexToColor(record['color']) for record in records]
+        self.dimensions[slots] = [dimensions(record) for record in records]
+        self.parents[slots] = [self.groupIndex(record['parent']) if record.get('parent') else -1
+                               for record in records]
+        for slot, record in zip(slots.tolist(), records):
+            self.names[slot] = record['name']
+        return slots
+
+    """
+    Fills the group row of a group record (see groupRecord) and returns it
+    """
+    def setGroupRecord(self, record):
+        index = self.groupIndex(record['id'])
+        position, rotation = record['position'], record['rotation']
+        self.groupParents[index] = self.groupIndex(record['parent']) if record.get('parent') else -1
+        self.groupPositions[index] = (position['x'], position['y'], position['z'])
+        self.groupRotations[index] = eulerToQuaternions(
+            (rotation['x'], rotation['y'], rotation['z']))
+        self.groupNames[index] = record['name']
+        self.groupColors[index] = record.get('color')
+        self.m_worldDirty = True
+        return index
+
+    def groupRecord(self, index):
+        position = self.groupPositions[index].astype(np.float64).tolist()
+        rotation = quaternionsToEuler(self.groupRotations[index]).tolist()
+        parent = int(self.groupParents[index])
+        return {'type': 'group', 'name': self.groupNames[index],
+                'parent': int(self.groupIds[parent]) if parent >= 0 else None,
+                'position': {'x': position[0], 'y': position[1], 'z': position[2]},
+                'rotation': {'x': rotation[0], 'y': rotation[1], 'z': rotation[2]},
+                'color': self.groupColors[index]}
+
+    """
+    Serialized records in the Primitive.toDict layout for the given slots,
+    with rotations converted in one vectorized pass
+    """
+    def toRecords(self, slots=None):
+        slots = self.activeSlots() if slots is None else np.asarray(slots, dtype=np.int64)
+        positions = self.positions[slots].astype(np.float64).tolist()
+        rotations = quaternionsToEuler(self.rotations[slots]).tolist()
+        dimensions = self.dimensions[slots].astype(np.float64).tolist()
+        colors = colorsToHex(self.colors[slots])
+        types = self.types[slots].tolist()
+        parents = self.parents[slots].tolist()
+
+        records = []
+        for i, slot in enumerate(slots.tolist()):
+            position, rotation, dimension = positions[i], rotations[i], dimensions[i]
+            record = {'name': self.names[slot],
+                      'position': {'x': position[0], 'y': position[1], 'z': position[2]},
+                      'rotation': {'x': rotation[0], 'y': rotation[1], 'z': rotation[2]},
+                      'color': colors[i]}
+            if types[i] == TYPE_CODES['sphere']:
+                record['type'] = 'sphere'
+                record['primitive_specific'] = {'radius': dimension[0]}
+            else:
+                record['type'] = 'cube'
+                record['primitive_specific'] = {'length': dimension[0],
+                                                'width': dimension[2],
+                                                'height': dimension[1]}
+            # written at the top level too, so stores that merge updates into
+            # the stored record drop the group a primitive left
+            record['parent'] = int(self.groupIds[parents[i]]) if parents[i] >= 0 else None
+            records.append(record)
+        return records
@@ -0,0 +1,633 @@
+import argparse
+import json
+import math
+import os
+import sqlite3
+import sys
+import threading
+import uuid
+from pysondb import db
+
+PRIMITIVE_OBJECTS = "primitive_objects.json"
+SCENE_DATABASE = "primitive_objects.db"
+SCENE_JOURNAL = "primitive_objects.journal"
+SCENE_CHUNKS = "primitive_objects.chunks"
+
+# edge length in world units of the cubic regions of a chunked store
+CHUNK_SIZE = 100.0
+# records per batch when a reader walks the whole store
+READ_BATCH = 4096
+# chunk of the chunked store that holds every group record and grouped primitive
+GROUP_CHUNK = ('groups',)
+
+# selects the backend used by openStore: sqlite, journal, chunked or json
+STORE_BACKEND = os.environ.get("SCENE_STORE", "sqlite")
+
+"""
+Generates an id in the same format pysondb uses so records keep their ids
+when moved between backends
+"""
+def newId():
+    return int(str(uuid.uuid4().int)[:18])
+
+
+"""
+Interface for persisted scene storage. A record is the dict produced by
+Primitive.toDict plus its 'id'.
+"""
+class SceneStore:
+    # partitioned stores can also be read a region at a time
+    chunked = False
+
+    def getAll(self):
+        raise NotImplementedError
+
+    """
+    Yields every record in lists of at most size. Stores that can read
+    incrementally override this, so walking them takes bounded memory.
+    """
+    def iterBatches(self, size=READ_BATCH):
+        records = self.getAll()
+        for start in range(0, len(records), size):
+            yield records[start:start + size]
+
+    """
+    Group records only; readers load them before the primitives they hold
+    """
+    def getGroups(self):
+        return [record for batch in self.iterBatches() for record in batch
+                if record.get('type') == 'group']
+
+    """
+    Stores a new record and returns its id
+    """
+    def add(self, record):
+        raise NotImplementedError
+
+    """
+    Applies updates ({id: record}) and deletions (set of ids) as one write.
+    Updates to ids missing from the store insert them, so undoing a
+    deletion is an ordinary update.
+    """
+    def applyBatch(self, updates, deletions):
+        raise NotImplementedError
+
+    def update(self, persist_id, record):
+        self.applyBatch({persist_id: record}, set())
+
+    def delete(self, persist_id):
+        self.applyBatch({}, {persist_id})
+
+    def addMany(self, records):
+        return [self.add(record) for record in records]
+
+    def count(self):
+        return len(self.getAll())
+
+    def close(self):
+        pass
+
+
+"""
+Original pysondb layout. Every write rewrites the whole file.
+"""
+class JsonStore(SceneStore):
+    def __init__(self, filename=PRIMITIVE_OBJECTS):
+        self.filename = filename
+        self.database = db.getDb(filename)
+
+    def getAll(self):
+        return self.database.getAll()
+
+    def add(self, record):
+        return self.database.add(dict(record))
+
+    """
+    Appends all records in one rewrite, keeping ids they already carry
+    """
+    def addMany(self, records):
+        ids = []
+        with self.database.lock:
+            with open(self.filename, "r+", encoding="utf-8") as db_file:
+                db_data = json.load(db_file)
+                for record in records:
+                    record = dict(record)
+                    record['id'] = record.get('id') or newId()
+                    ids.append(record['id'])
+                    db_data["data"].append(record)
+
+                db_file.seek(0)
+                db_file.truncate()
+                json.dump(db_data, db_file, indent=3, ensure_ascii=False)
+        return ids
+
+    def applyBatch(self, updates, deletions):
+        with self.database.lock:
+            with open(self.filename, "r+", encoding="utf-8") as db_file:
+                db_data = json.load(db_file)
+                records = []
+                missing = {persist_id: record for persist_id, record in updates.items()
+                           if persist_id not in deletions}
+                for record in db_data["data"]:
+                    if record["id"] in deletions:
+                        continue
+                    if record["id"] in missing:
+                        record.update(missing.pop(record["id"]))
+                    records.append(record)
+                records.extend(dict(record, id=persist_id)
+                               for persist_id, record in missing.items())
+
+                db_data["data"] = records
+                db_file.seek(0)
+                db_file.truncate()
+                json.dump(db_data, db_file, indent=3, ensure_ascii=False)
+
+
+"""
+One row per primitive in an SQLite database running in WAL mode
+"""
+class SQLiteStore(SceneStore):
+    def __init__(self, filename=SCENE_DATABASE):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS primitives ("
+            "id INTEGER PRIMARY KEY, type TEXT NOT NULL, name TEXT, data TEXT NOT NULL)")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS primitives_type ON primitives(type)")
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS primitives_name ON primitives(name)")
+        self.connection.commit()
+
+    def getAll(self):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT data FROM primitives ORDER BY rowid").fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def getByType(self, primitive_type):
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT data FROM primitives WHERE type = ?", (primitive_type,)).fetchall()
+        return [json.loads(data) for (data,) in rows]
+
+    def iterBatches(self, size=READ_BATCH):
+        last = 0
+        while True:
+            with self.lock:
+                rows = self.connection.execute(
+                    "SELECT rowid, data FROM primitives WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                    (last, size)).fetchall()
+            if not rows:
+                return
+            last = rows[-1][0]
+            yield [json.loads(data) for _, data in rows]
+
+    def getGroups(self):
+        return self.getByType('group')
+
+    def add(self, record):
+        return self.addMany([record])[0]
+
+    def addMany(self, records):
+        rows = []
+        ids = []
+        for record in records:
+            record = dict(record)
+            record['id'] = record.get('id') or newId()
+            ids.append(record['id'])
+            rows.append(self.row(record))
+
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO primitives (id, type, name, data) VALUES (?, ?, ?, ?)",
+                rows)
+        return ids
+
+    def applyBatch(self, updates, deletions):
+        rows = [self.row(dict(record, id=persist_id))
+                for persist_id, record in updates.items()
+                if persist_id not in deletions]
+
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO primitives (id, type, name, data) VALUES (?, ?, ?, ?)",
+                rows)
+            self.connection.executemany(
+                "DELETE FROM primitives WHERE id = ?",
+                [(persist_id,) for persist_id in deletions])
+
+    def count(self):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM primitives").fetchone()[0]
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    @staticmethod
+    def row(record):
+        return (record['id'], record['type'], record['name'], json.dumps(record))
+
+
+"""
+Append-only journal of put/delete entries, one JSON object per line. The
+current state is kept in memory and the journal is compacted in the
+background once it grows well beyond the number of live records.
+"""
+class JournalStore(SceneStore):
+    COMPACT_MIN_ENTRIES = 1000
+
+    def __init__(self, filename=SCENE_JOURNAL):
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.records = {}
+        self.entries = 0
+        self.compacting = False
+
+        if os.path.exists(filename):
+            with open(filename, "r", encoding="utf-8") as journal:
+                for line in journal:
+                    self.replay(line)
+        self.journal = open(filename, "a", encoding="utf-8")
+
+    def replay(self, line):
+        if not line.strip():
+            return
+        entry = json.loads(line)
+        if entry['op'] == 'put':
+            self.records[entry['id']] = entry['record']
+        else:
+            self.records.pop(entry['id'], None)
+        self.entries += 1
+
+    def getAll(self):
+        with self.lock:
+            return [dict(record) for record in self.records.values()]
+
+    def add(self, record):
+        return self.addMany([record])[0]
+
+    def addMany(self, records):
+        ids = []
+        lines = []
+        with self.lock:
+            for record in records:
+                record = dict(record)
+                record['id'] = record.get('id') or newId()
+                ids.append(record['id'])
+                self.records[record['id']] = record
+                lines.append(json.dumps({'op': 'put', 'id': record['id'], 'record': record}))
+            self.append(lines)
+        return ids
+
+    def applyBatch(self, updates, deletions):
+        lines = []
+        with self.lock:
+            for persist_id, record in updates.items():
+                if persist_id in deletions:
+                    continue
+                record = dict(self.records.get(persist_id, {}), **record)
+                record['id'] = persist_id
+                self.records[persist_id] = record
+                lines.append(json.dumps({'op': 'put', 'id': persist_id, 'record': record}))
+            for persist_id in deletions:
+                if self.records.pop(persist_id, None) is not None:
+                    lines.append(json.dumps({'op': 'del', 'id': persist_id}))
+            self.append(lines)
+        self.maybeCompact()
+
+    """
+    Writes journal lines. Must be called with the lock held.
+    """
+    def append(self, lines):
+        if not lines:
+            return
+        self.journal.write("\n".join(lines) + "\n")
+        self.journal.flush()
+        self.entries += len(lines)
+
+    def count(self):
+        with self.lock:
+            return len(self.records)
+
+    def maybeCompact(self):
+        with self.lock:
+            if self.compacting:
+                return
+            if self.entries < max(self.COMPACT_MIN_ENTRIES, 2 * len(self.records)):
+                return
+            self.compacting = True
+        threading.Thread(target=self.compact, daemon=True).start()
+
+    """
+    Rewrites the journal as one put per live record. The snapshot is written
+    without holding the lock; entries appended meanwhile are copied over
+    before the files are swapped.
+    """
+    def compact(self):
+        try:
+            with self.lock:
+                snapshot = list(self.records.values())
+                offset = self.journal.tell()
+
+            temp_filename = self.filename + ".compact"
+            with open(temp_filename, "w", encoding="utf-8") as temp:
+                for record in snapshot:
+                    temp.write(json.dumps({'op': 'put', 'id': record['id'], 'record': record}) + "\n")
+
+            with self.lock:
+                self.journal.close()
+                with open(self.filename, "r", encoding="utf-8") as journal, \
+                        open(temp_filename, "a", encoding="utf-8") as temp:
+                    journal.seek(offset)
+                    tail = journal.read()
+                    temp.write(tail)
+                os.replace(temp_filename, self.filename)
+                self.journal = open(self.filename, "a", encoding="utf-8")
+                self.entries = len(snapshot) + tail.count("\n")
+        finally:
+            with self.lock:
+                self.compacting = False
+
+    def close(self):
+        with self.lock:
+            self.journal.close()
+
+
+"""
+Scene partitioned into a grid of cubic regions CHUNK_SIZE units on a side,
+keyed by primitive position. Each chunk is its own JSON file in the store
+directory, next to a small manifest with the bounds and count of every
+chunk, and an index of the chunk every record id is in. Chunks are read on
+demand, and a write rewrites only the chunks it touched plus the manifest,
+and the index when records were added, removed or moved between chunks.
+Through the index, updates and deletions reach records in chunks that were
+never read. Group records are kept together in one chunk that is always
+loaded, along with the primitives in groups: their stored positions are
+relative to the group, and a group moving changes where they are without
+rewriting them.
+"""
+class ChunkedStore(SceneStore):
+    chunked = True
+    MANIFEST = "manifest.json"
+    INDEX = "index.json"
+
+    def __init__(self, directory=SCENE_CHUNKS, chunkSize=CHUNK_SIZE):
+        self.directory = directory
+        self.filename = directory
+        self.lock = threading.Lock()
+        self.chunks = {}
+        self.chunkOf = {}
+        self.chunkSize = chunkSize
+        self.manifest = {}
+
+        os.makedirs(directory, exist_ok=True)
+        manifestFile = os.path.join(directory, self.MANIFEST)
+        if os.path.exists(manifestFile):
+            with open(manifestFile, "r", encoding="utf-8") as manifest:
+                data = json.load(manifest)
+            self.chunkSize = data['chunkSize']
+            self.manifest = {tuple(entry['key']): entry for entry in data['chunks']}
+            self.readIndex()
+
+    """
+    Loads the id to chunk index, rebuilding it from the chunks for a store
+    written before it was kept
+    """
+    def readIndex(self):
+        indexFile = os.path.join(self.directory, self.INDEX)
+        if os.path.exists(indexFile):
+            with open(indexFile, "r", encoding="utf-8") as index:
+                self.chunkOf = {persist_id: tuple(key) for persist_id, key in json.load(index)['ids']}
+            return
+        for key in self.manifest:
+            self.chunkOf.update(dict.fromkeys(self.readChunk(key), key))
+        self.writeIndex()
+
+    def writeIndex(self):
+        filename = os.path.join(self.directory, self.INDEX)
+        with open(filename + ".tmp", "w", encoding="utf-8") as index:
+            json.dump({'ids': [[persist_id, list(key)] for persist_id, key in self.chunkOf.items()]},
+                      index)
+        os.replace(filename + ".tmp", filename)
+
+    def keyOf(self, record):
+        if record.get('type') == 'group' or record.get('parent'):
+            return GROUP_CHUNK
+        position = record['position']
+        return tuple(math.floor(position[axis] / self.chunkSize) for axis in 'xyz')
+
+    def chunkFile(self, key):
+        if key == GROUP_CHUNK:
+            return os.path.join(self.directory, "groups.json")
+        return os.path.join(self.directory, "chunk_{}_{}_{}.json".format(*key))
+
+    """
+    Keys of stored chunks whose bounds come within radius of center, nearest
+    first, after the group chunk
+    """
+    def chunksNear(self, center, radius):
+        distances = []
+        with self.lock:
+            groups = [GROUP_CHUNK] if GROUP_CHUNK in self.manifest else []
+            for key, entry in self.manifest.items():
+                if key == GROUP_CHUNK:
+                    continue
+                low, high = entry['bounds']
+                distance = sum(max(low[axis] - center[axis], 0.0, center[axis] - high[axis]) ** 2
+                               for axis in range(3))
+                if distance <= radius * radius:
+                    distances.append((distance, key))
+        return groups + [key for _, key in sorted(distances)]
+
+    def getChunks(self, keys):
+        with self.lock:
+            records = []
+            for key in keys:
+                records.extend(dict(record) for record in self.loadChunk(key).values())
+        return records
+
+    def getAll(self):
+        return self.getChunks(list(self.manifest))
+
+    """
+    One list per chunk, the group chunk first. Chunks the editor has not
+    loaded are read without being kept.
+    """
+    def iterBatches(self, size=READ_BATCH):
+        with self.lock:
+            keys = [key for key in self.manifest if key == GROUP_CHUNK]
+            keys += [key for key in self.manifest if key != GROUP_CHUNK]
+        for key in keys:
+            with self.lock:
+                records = self.chunks.get(key)
+                records = self.readChunk(key) if records is None else records
+                records = [dict(record) for record in records.values()]
+            for start in range(0, len(records), size):
+                yield records[start:start + size]
+
+    def getGroups(self):
+        return [record for record in self.getChunks([GROUP_CHUNK])
+                if record.get('type') == 'group']
+
+    """
+    Records of chunk key by id, read from disk the first time. Must be
+    called with the lock held.
+    """
+    def loadChunk(self, key):
+        records = self.chunks.get(key)
+        if records is None:
+            records = self.readChunk(key)
+            self.chunks[key] = records
+        return records
+
+    def readChunk(self, key):
+        if key not in self.manifest:
+            return {}
+        with open(self.chunkFile(key), "r", encoding="utf-8") as chunk:
+            return {record['id']: record for record in json.load(chunk)["data"]}
+
+    def add(self, record):
+        return self.addMany([record])[0]
+
+    def addMany(self, records):
+        updates = {}
+        for record in records:
+            updates[record.get('id') or newId()] = record
+        self.applyBatch(updates, set())
+        return list(updates)
+
+    def applyBatch(self, updates, deletions):
+        with self.lock:
+            dirty = set()
+            moved = False
+            for persist_id in deletions:
+                key = self.chunkOf.pop(persist_id, None)
+                if key is not None:
+                    self.loadChunk(key).pop(persist_id, None)
+                    dirty.add(key)
+                    moved = True
+
+            for persist_id, record in updates.items():
+                if persist_id in deletions:
+                    continue
+                key = self.keyOf(record)
+                previous = self.chunkOf.get(persist_id)
+                merged = {}
+                if previous is not None:
+                    merged = self.loadChunk(previous).pop(persist_id, {})
+                    dirty.add(previous)
+                merged.update(record)
+                merged['id'] = persist_id
+                self.loadChunk(key)[persist_id] = merged
+                if previous != key:
+                    self.chunkOf[persist_id] = key
+                    moved = True
+                dirty.add(key)
+
+            for key in dirty:
+                self.writeChunk(key)
+            if dirty:
+                self.writeManifest()
+            if moved:
+                self.writeIndex()
+
+    """
+    Rewrites one chunk file and its manifest entry. Must be called with the
+    lock held.
+    """
+    def writeChunk(self, key):
+        records = self.chunks[key]
+        filename = self.chunkFile(key)
+        if not records:
+            self.manifest.pop(key, None)
+            if os.path.exists(filename):
+                os.remove(filename)
+            return
+
+        with open(filename + ".tmp", "w", encoding="utf-8") as chunk:
+            json.dump({"data": list(records.values())}, chunk, ensure_ascii=False)
+        os.replace(filename + ".tmp", filename)
+
+        positions = [record['position'] for record in records.values()]
+        self.manifest[key] = {
+            'key': list(key), 'count': len(records),
+            'bounds': [[min(position[axis] for position in positions) for axis in 'xyz'],
+                       [max(position[axis] for position in positions) for axis in 'xyz']]}
+
+    def writeManifest(self):
+        filename = os.path.join(self.directory, self.MANIFEST)
+        with open(filename + ".tmp", "w", encoding="utf-8") as manifest:
+            json.dump({'chunkSize': self.chunkSize, 'chunks': list(self.manifest.values())},
+                      manifest, indent=3)
+        os.replace(filename + ".tmp", filename)
+
+    def count(self):
+        with self.lock:
+            return sum(entry['count'] for entry in self.manifest.values())
+
+
+BACKENDS = {'json': (JsonStore, PRIMITIVE_OBJECTS),
+            'sqlite': (SQLiteStore, SCENE_DATABASE),
+            'journal': (JournalStore, SCENE_JOURNAL),
+            'chunked': (ChunkedStore, SCENE_CHUNKS)}
+
+_store = None
+# the store may be opened from any storage worker thread
+_storeLock = threading.Lock()
+
+"""
+Returns the process wide scene store, opening it on first use. A new sqlite,
+journal or chunked store is seeded from the legacy JSON file when one exists.
+"""
+def openStore(backend=None, filename=None):
+    global _store
+    with _storeLock:
+        if _store is not None:
+            return _store
+
+        storeClass, defaultFilename = BACKENDS[backend or STORE_BACKEND]
+        filename = filename or defaultFilename
+        isNew = not os.path.exists(filename)
+        store = storeClass(filename)
+
+        if isNew and storeClass is not JsonStore and os.path.exists(PRIMITIVE_OBJECTS):
+            migrateJson(PRIMITIVE_OBJECTS, store)
+        _store = store
+        return _store
+
+
+def closeStore():
+    global _store
+    with _storeLock:
+        if _store is not None:
+            _store.close()
+            _store = None
+
+
+"""
+Imports every record of a pysondb JSON file into store, keeping ids
+"""
+def migrateJson(json_filename, store):
+    with open(json_filename, "r", encoding="utf-8") as json_file:
+        records = json.load(json_file)["data"]
+    store.addMany(records)
+    return len(records)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a pysondb scene file into another backend")
+    parser.add_argument("source", help="pysondb JSON scene file")
+    parser.add_argument("backend", choices=["sqlite", "journal", "chunked"])
+    parser.add_argument("destination")
+    args = parser.parse_args()
+
+    store = BACKENDS[args.backend][0](args.destination)
+    count = migrateJson(args.source, store)
+    store.close()
+    print(f"Imported {count} primitives into {args.destination}")
+    sys.exit(0)
@@ -0,0 +1,379 @@
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+from PySide2 import QtCore, QtGui, QtWidgets
+from PySide2.Qt3DCore import Qt3DCore
+from PySide2.Qt3DExtras import Qt3DExtras
+from PySide2.Qt3DRender import Qt3DRender
+from SceneEditor import (ShapeEditor, RightSideMenu, initialize_camera, initialize_lighting,
+                         CLEAR_COLOR)
+from SceneFile import SceneFile
+from SceneStore import BACKENDS, STORE_BACKEND, READ_BATCH
+
+THUMBNAIL_SIZE = (320, 240)
+FIELD_OF_VIEW = 45.0
+# room left around the scene bounds
+FRAMING_MARGIN = 1.1
+# time given to the instance buffers to reach the renderer before a capture
+SETTLE_MS = 200
+RENDER_TIMEOUT_MS = 60000
+# worker processes are replaced after this many scenes, which bounds what
+# Qt3D leaks between scenes
+SCENES_PER_PROCESS = 16
+# part of the cache key; bump when the thumbnails would look different
+RENDER_VERSION = 2
+MANIFEST = 'thumbnails.json'
+
+# the QApplication of a worker process
+application = None
+
+# direction from the scene center to the camera
+VIEW_DIRECTIONS = {'front': (0.0, 0.0, 1.0), 'back': (0.0, 0.0, -1.0),
+                   'left': (-1.0, 0.0, 0.0), 'right': (1.0, 0.0, 0.0),
+                   'top': (0.0, 1.0, 0.0), 'bottom': (0.0, -1.0, 0.0),
+                   'iso': (1.0, 0.8, 1.0)}
+
+
+"""
+Store or binary scene file at filename. The backend follows from the
+extension of its default file, else backend is used.
+"""
+def openScene(filename, backend=STORE_BACKEND):
+    extension = os.path.splitext(filename.rstrip(os.sep))[1]
+    if extension == '.scene':
+        return SceneFile(filename)
+    for storeClass, defaultFilename in BACKENDS.values():
+        if os.path.splitext(defaultFilename)[1] == extension:
+            return storeClass(filename)
+    return BACKENDS[backend][0](filename)
+
+
+"""
+Cache key of the thumbnails of a scene: its content, every file of it for
+a chunked store, and the render settings
+"""
+def sceneHash(filename, size):
+    digest = hashlib.blake2b(json.dumps([RENDER_VERSION, list(size)]).encode('utf-8'),
+                             digest_size=16)
+    if os.path.isdir(filename):
+        paths = sorted(os.path.join(root, name) for root, _, names in os.walk(filename)
+                       for name in names)
+    else:
+        paths = [filename]
+    for path in paths:
+        digest.update(os.path.relpath(path, filename).encode('utf-8'))
+        with open(path, 'rb') as scene:
+            for block in iter(lambda: scene.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+"""
+Camera placement that fits a sphere around bounds (lo, hi), padded by
+the largest primitive, into the view from direction. Returns position,
+view center, up vector and the near and far planes.
+"""
+def framing(bounds, padding, direction, aspect, fieldOfView=FIELD_OF_VIEW):
+    lo, hi = (np.zeros(3), np.zeros(3)) if bounds is None else bounds
+    center = (np.asarray(lo, dtype=np.float64) + hi) / 2.0
+    radius = max(np.linalg.norm(np.asarray(hi, dtype=np.float64) - lo) / 2.0 + padding, 1.0)
+    # the narrower of the two fields of view decides the distance
+    halfAngle = math.radians(fieldOfView) / 2.0
+    if aspect < 1.0:
+        halfAngle = math.atan(math.tan(halfAngle) * aspect)
+    distance = radius * FRAMING_MARGIN / math.sin(halfAngle)
+
+    direction = np.asarray(direction, dtype=np.float64)
+    direction /= np.linalg.norm(direction)
+    up = (0.0, 1.0, 0.0)
+    if abs(direction[1]) > 0.99:
+        # looking straight down or up, the front of the scene faces the bottom
+        up = (0.0, 0.0, -math.copysign(1.0, direction[1]))
+    return (center + direction * distance, center, up,
+            max(distance - radius * 2.0, distance * 1e-3), distance + radius * 2.0)
+
+
+"""
+Builds the scene graph of the editor window, camera, light and shape
+editor, around an offscreen Qt3D window and captures it to images. The
+scene is drawn by the instanced renderer straight from the scene model, so
+no primitive gets an entity of its own and nothing is written to storage.
+"""
+class ThumbnailRenderer(QtCore.QObject):
+    finished = QtCore.Signal()
+
+    def __init__(self, size=THUMBNAIL_SIZE):
+        super().__init__()
+        self.width, self.height = size
+        self.view = Qt3DExtras.Qt3DWindow()
+        self.view.defaultFrameGraph().setClearColor(QtGui.QColor(CLEAR_COLOR))
+        self.view.resize(self.width, self.height)
+
+        self.rootEntity = Qt3DCore.QEntity()
+        self.cameraEntity = initialize_camera(self.view, self.rootEntity)
+        self.lightEntity = initialize_lighting(self.rootEntity, self.cameraEntity)
+        self.lightTransform = [component for component in self.lightEntity.components()
+                               if isinstance(component, Qt3DCore.QTransform)][0]
+        self.view.setRootEntity(self.rootEntity)
+
+        # the capture node wraps the forward renderer of the window
+        self.capture = Qt3DRender.QRenderCapture()
+        self.view.activeFrameGraph().setParent(self.capture)
+        self.view.setActiveFrameGraph(self.capture)
+
+        self.objectList = QtWidgets.QListView()
+        self.rightMenu = RightSideMenu()
+        self.shapeEditor = ShapeEditor(self.rootEntity, self.cameraEntity,
+                                       self.objectList, self.rightMenu)
+        self.shapeEditor.entityPager.setMaxLive(0)
+        self.shapeEditor.entityPager.setEnabled(True)
+        self.shapeEditor.instancedRenderer.setEnabled(True)
+
+        self.m_pending = []
+        self.m_reply = None
+        self.m_started = 0.0
+        self.timings = {}
+        self.error = None
+        self.view.show()
+
+    """
+    Loads every primitive and group of source into the scene model and
+    returns the number of primitives
+    """
+    def load(self, source):
+        shapeEditor = self.shapeEditor
+        model = shapeEditor.sceneModel
+        if isinstance(source, SceneFile):
+            for start in range(0, len(source), READ_BATCH):
+                slots = source.loadInto(model, start, start + READ_BATCH)
+                shapeEditor.addPrimitives(shapeEditor.createFromSlots(slots))
+        else:
+            for record in source.getGroups():
+                shapeEditor.createPrimitive(record)
+            for records in source.iterBatches(READ_BATCH):
+                slots = model.addRecords([record for record in records
+                                          if record.get('type') != 'group'])
+                shapeEditor.addPrimitives(shapeEditor.createFromSlots(slots))
+        # members read after their group still take its color
+        for group in list(shapeEditor.m_groups.values()):
+            group.applyColor()
+        return len(model)
+
+    def frameView(self, direction):
+        model = self.shapeEditor.sceneModel
+        slots = model.activeSlots()
+        padding = 0.0
+        if len(slots):
+            padding = float((model.dimensions[slots] * model.scales[slots]).max())
+        position, center, up, near, far = framing(
+            model.bounds(), padding, direction, self.width / self.height)
+
+        self.cameraEntity.lens().setPerspectiveProjection(
+            FIELD_OF_VIEW, self.width / self.height, near, far)
+        self.cameraEntity.setPosition(QtGui.QVector3D(*position))
+        self.cameraEntity.setViewCenter(QtGui.QVector3D(*center))
+        self.cameraEntity.setUpVector(QtGui.QVector3D(*up))
+        self.lightTransform.setTranslation(self.cameraEntity.position())
+
+    """
+    Captures one image per (view, filename) and emits finished once all
+    are saved
+    """
+    def render(self, images):
+        self.m_pending = list(images)
+        self.timings = {}
+        self.renderNext()
+
+    def renderNext(self):
+        if not self.m_pending:
+            self.finished.emit()
+            return
+        view, _ = self.m_pending[0]
+        self.m_started = time.perf_counter()
+        self.frameView(VIEW_DIRECTIONS[view])
+        QtCore.QTimer.singleShot(SETTLE_MS, self.requestCapture)
+
+    def requestCapture(self):
+        self.m_reply = self.capture.requestCapture()
+        self.m_reply.completed.connect(self.saveCapture)
+
+    def saveCapture(self):
+        view, filename = self.m_pending.pop(0)
+        temporary = filename + '.tmp.png'
+        if not self.m_reply.image().save(temporary):
+            self.error = f"cannot write {filename}"
+            self.m_pending = []
+            self.finished.emit()
+            return
+        os.replace(temporary, filename)
+        self.m_reply = None
+        self.timings[view] = (time.perf_counter() - self.m_started) * 1000.0
+        self.renderNext()
+
+    def close(self):
+        self.shapeEditor.storageWorker.shutdown()
+        self.view.close()
+        self.view.deleteLater()
+        self.rootEntity.deleteLater()
+
+
+"""
+Runs in each worker process before its first scene
+"""
+def initializeWorker(platform):
+    global application
+    os.environ['QT_QPA_PLATFORM'] = platform
+    # Mesa renders on the CPU, there is no GPU to count on in a farm
+    os.environ.setdefault('LIBGL_ALWAYS_SOFTWARE', '1')
+    QtCore.QCoreApplication.setAttribute(QtCore.Qt.AA_UseSoftwareOpenGL)
+    application = QtWidgets.QApplication(sys.argv[:1])
+
+
+"""
+Worker task: renders the images of one scene. Returns timings, or the
+error that stopped it.
+"""
+def renderTask(task):
+    filename, backend, images, size, timeoutMs = task
+    result = {'scene': filename}
+    start = time.perf_counter()
+    renderer = None
+    try:
+        renderer = ThumbnailRenderer(size)
+        source = openScene(filename, backend)
+        try:
+            result['primitives'] = renderer.load(source)
+        finally:
+            source.close()
+        result['load_ms'] = (time.perf_counter() - start) * 1000.0
+
+        loop = QtCore.QEventLoop()
+        timeout = QtCore.QTimer()
+        timeout.setSingleShot(True)
+        timeout.timeout.connect(loop.quit)
+        renderer.finished.connect(loop.quit)
+        timeout.start(timeoutMs)
+        renderer.render(images)
+        loop.exec_()
+        timeout.stop()
+        result['render_ms'] = renderer.timings
+        if renderer.error is not None:
+            result['error'] = renderer.error
+        elif len(renderer.timings) < len(images):
+            result['error'] = f"timed out after {timeoutMs} ms"
+    except Exception as error:
+        result['error'] = f"{type(error).__name__}: {error}"
+    finally:
+        if renderer is not None:
+            renderer.close()
+    result['total_ms'] = (time.perf_counter() - start) * 1000.0
+    return result
+
+
+def loadManifest(outputDir):
+    try:
+        with open(os.path.join(outputDir, MANIFEST), 'r', encoding='utf-8') as manifest:
+            return json.load(manifest)
+    except (OSError, ValueError):
+        return {}
+
+
+def saveManifest(outputDir, manifest):
+    filename = os.path.join(outputDir, MANIFEST)
+    with open(filename + '.tmp', 'w', encoding='utf-8') as output:
+        json.dump(manifest, output, indent=3)
+    os.replace(filename + '.tmp', filename)
+
+
+"""
+Renders thumbnails of many scenes across a process pool, one scene per
+task. Images are named by the content hash of their scene and the view, so
+scenes that did not change since their images were rendered, or that equal
+another scene, are skipped. A scene equal to one rendered in this run is
+reported once that render finished, with its error if it failed. The
+manifest in outputDir maps every scene to its images.
+"""
+def renderScenes(filenames, outputDir, views=('iso',), size=THUMBNAIL_SIZE, workers=None,
+                 backend=STORE_BACKEND, timeoutMs=RENDER_TIMEOUT_MS, force=False,
+                 platform='offscreen'):
+    os.makedirs(outputDir, exist_ok=True)
+    manifest = loadManifest(outputDir)
+    results = []
+    tasks = []
+    # scenes whose images another queued scene renders, by hash
+    duplicates = {}
+    for filename in filenames:
+        key = sceneHash(filename, size)
+        images = {view: f'{key}-{view}.png' for view in views}
+        manifest[filename] = {'hash': key, 'images': images}
+        missing = [(view, os.path.join(outputDir, image)) for view, image in images.items()
+                   if force or not os.path.exists(os.path.join(outputDir, image))]
+        if not missing:
+            results.append({'scene': filename, 'hash': key, 'cached': True})
+        elif key in duplicates:
+            duplicates[key].append(filename)
+        else:
+            duplicates[key] = []
+            tasks.append((filename, backend, missing, size, timeoutMs))
+
+    if tasks:
+        context = multiprocessing.get_context('spawn')
+        workers = min(workers or os.cpu_count() or 1, len(tasks))
+        with context.Pool(workers, initializer=initializeWorker, initargs=(platform,),
+                          maxtasksperchild=SCENES_PER_PROCESS) as pool:
+            for result in pool.imap_unordered(renderTask, tasks):
+                entry = manifest[result['scene']]
+                result.update(hash=entry['hash'], cached=False)
+                if 'error' in result:
+                    entry['error'] = result['error']
+                results.append(result)
+                for filename in duplicates[entry['hash']]:
+                    duplicate = {'scene': filename, 'hash': entry['hash'],
+                                 'cached': 'error' not in result}
+                    if 'error' in result:
+                        duplicate['error'] = manifest[filename]['error'] = result['error']
+                    results.append(duplicate)
+            # let workers exit on their own; under eglfs Qt catches the
+            # SIGTERM that terminating the pool would send
+            pool.close()
+            pool.join()
+    saveManifest(outputDir, manifest)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Render thumbnails of scene files and stores without opening the editor")
+    parser.add_argument("scenes", nargs='+',
+                        help="binary .scene files, or store files and directories")
+    parser.add_argument("--output", default="thumbnails", help="image and manifest directory")
+    parser.add_argument("--views", nargs='+', choices=sorted(VIEW_DIRECTIONS), default=['iso'])
+    parser.add_argument("--size", type=int, nargs=2, default=THUMBNAIL_SIZE,
+                        metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument("--workers", type=int, help="render processes, one per core by default")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=STORE_BACKEND,
+                        help="backend of stores whose extension does not tell")
+    parser.add_argument("--timeout", type=float, default=RENDER_TIMEOUT_MS / 1000.0,
+                        help="seconds one scene may take to render")
+    parser.add_argument("--force", action="store_true", help="render cached scenes again")
+    parser.add_argument("--platform", default="offscreen",
+                        help="Qt platform plugin of the workers, e.g. xcb under xvfb")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = renderScenes(args.scenes, args.output, args.views, tuple(args.size),
+                           args.workers, args.backend, int(args.timeout * 1000),
+                           args.force, args.platform)
+    failed = [result for result in results if 'error' in result]
+    print(json.dumps({'scenes': len(results),
+                      'rendered': sum(not result['cached'] for result in results),
+                      'cached': sum(result['cached'] for result in results),
+                      'failed': len(failed), 'elapsed_s': time.perf_counter() - start,
+                      'results': results}, indent=3))
+    sys.exit(1 if failed else 0)
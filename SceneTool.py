@@ -0,0 +1,483 @@
+import argparse
+import collections
+import csv
+import hashlib
+import json
+import math
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from SceneModel import SceneModel
+from SceneStore import BACKENDS, STORE_BACKEND, READ_BATCH, newId
+
+# input lines parsed per worker task
+PARSE_BATCH = 20000
+# records per store write
+WRITE_BATCH = 50000
+# CSV columns; spheres use radius, cubes length, height and width
+CSV_COLUMNS = ('id', 'type', 'name', 'x', 'y', 'z', 'rx', 'ry', 'rz', 'color',
+               'radius', 'length', 'height', 'width', 'parent')
+SHAPE_FIELDS = {'sphere': ('radius',), 'cube': ('length', 'height', 'width')}
+RECORD_TYPES = ('sphere', 'cube', 'group')
+# ids are stored as signed 64 bit integers
+MAX_ID = 2 ** 63 - 1
+
+
+class RecordError(ValueError):
+    pass
+
+
+def number(value, what):
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+        raise RecordError(f"{what} is not a finite number")
+    return value
+
+
+def checkVector(record, key):
+    vector = record.get(key)
+    if not isinstance(vector, dict):
+        raise RecordError(f"missing {key}")
+    for axis in 'xyz':
+        number(vector.get(axis), f"{key}.{axis}")
+
+
+def checkId(value, what):
+    if isinstance(value, bool) or not isinstance(value, int) or not 1 <= value <= MAX_ID:
+        raise RecordError(f"bad {what} {value!r}")
+
+
+def checkColor(color):
+    if not isinstance(color, str) or len(color) != 7 or color[0] != '#':
+        raise RecordError(f"bad color {color!r}")
+    try:
+        int(color[1:], 16)
+    except ValueError:
+        raise RecordError(f"bad color {color!r}")
+
+
+"""
+Raises RecordError unless record can be restored by the editor, following
+the fields Primitive.restore and Group.restore read
+"""
+def validateRecord(record):
+    if not isinstance(record, dict):
+        raise RecordError("record is not an object")
+    primitiveType = record.get('type')
+    if primitiveType not in RECORD_TYPES:
+        raise RecordError(f"bad type {primitiveType!r}")
+    if record.get('id') is not None:
+        checkId(record['id'], 'id')
+    if not isinstance(record.get('name'), str):
+        raise RecordError("missing name")
+    checkVector(record, 'position')
+    checkVector(record, 'rotation')
+    if record.get('parent') is not None:
+        checkId(record['parent'], 'parent')
+
+    if primitiveType == 'group':
+        if record.get('color') is not None:
+            checkColor(record['color'])
+        return
+    checkColor(record.get('color'))
+    specific = record.get('primitive_specific')
+    if not isinstance(specific, dict):
+        raise RecordError("missing primitive_specific")
+    for field in SHAPE_FIELDS[primitiveType]:
+        if number(specific.get(field), f"primitive_specific.{field}") < 0:
+            raise RecordError(f"negative primitive_specific.{field}")
+
+
+"""
+Record in the Primitive.toDict layout from a CSV row given as a dict
+"""
+def csvRecord(row):
+    def value(column, convert=float):
+        text = (row.get(column) or '').strip()
+        if not text:
+            return None
+        try:
+            return convert(text)
+        except ValueError:
+            raise RecordError(f"bad {column} {text!r}")
+
+    record = {'type': (row.get('type') or '').strip(), 'name': row.get('name') or '',
+              'position': {'x': value('x'), 'y': value('y'), 'z': value('z')},
+              'rotation': {'x': value('rx') or 0.0, 'y': value('ry') or 0.0,
+                           'z': value('rz') or 0.0},
+              'color': (row.get('color') or '').strip() or None}
+    for key, column in (('id', 'id'), ('parent', 'parent')):
+        if value(column, int) is not None:
+            record[key] = value(column, int)
+    fields = SHAPE_FIELDS.get(record['type'], ())
+    if fields and all(value(field) is not None for field in fields):
+        record['primitive_specific'] = {field: value(field) for field in fields}
+    return record
+
+
+"""
+Records as the editor would store them after restoring them: loaded into
+a SceneModel and serialized back, with ids. Values are narrowed to the
+float32 the editor keeps in memory.
+"""
+def normalizeRecords(records):
+    model = SceneModel(max(1, len(records)))
+    primitives = [record for record in records if record['type'] != 'group']
+    groups = [record for record in records if record['type'] == 'group']
+    rows = [model.setGroupRecord(record) for record in groups]
+    slots = model.addRecords(primitives)
+
+    normalized = {}
+    for record, serialized in zip(primitives, model.toRecords(slots)):
+        normalized[id(record)] = dict(serialized, id=record['id'])
+    for record, row in zip(groups, rows):
+        normalized[id(record)] = dict(model.groupRecord(row), id=record['id'])
+    return [normalized[id(record)] for record in records]
+
+
+def digest(record):
+    content = {key: value for key, value in record.items() if key != 'id'}
+    return hashlib.blake2b(json.dumps(content, sort_keys=True).encode('utf-8'),
+                           digest_size=16).digest()
+
+
+"""
+Worker task: parses (for 'csv' and 'jsonl') and validates one batch, and
+normalizes the valid records. A 'csv' batch holds (line, row) pairs from
+csv.DictReader. Returns the records with their line numbers (or positions
+in the store), the errors and what the main process needs to find
+duplicates across batches.
+"""
+def processBatch(task):
+    kind, payload, firstLine = task
+    parsed = []
+    if kind == 'records':
+        parsed = [(firstLine + offset, record, None) for offset, record in enumerate(payload)]
+    elif kind == 'csv':
+        for line, row in payload:
+            try:
+                parsed.append((line, csvRecord(row), None))
+            except RecordError as error:
+                parsed.append((line, None, str(error)))
+    else:
+        for offset, text in enumerate(payload):
+            if not text.strip():
+                continue
+            try:
+                parsed.append((firstLine + offset, json.loads(text), None))
+            except json.JSONDecodeError as error:
+                parsed.append((firstLine + offset, None, f"bad json ({error})"))
+
+    valid, errors = [], []
+    for line, record, error in parsed:
+        if error is None:
+            try:
+                validateRecord(record)
+            except RecordError as invalid:
+                error = str(invalid)
+        if error is not None:
+            errors.append((line, error))
+            continue
+        if record.get('id') is None:
+            record = dict(record, id=newId())
+        valid.append((line, record))
+
+    records = normalizeRecords([record for _, record in valid]) if valid else []
+    return {'lines': [line for line, _ in valid], 'records': records, 'errors': errors,
+            'digests': [digest(record) if record['type'] != 'group' else None
+                        for record in records]}
+
+
+"""
+Results of fn over tasks, in order, with at most depth tasks in flight, so
+reading the input never runs far ahead of the workers
+"""
+def mapBounded(executor, fn, tasks, depth):
+    pending = collections.deque()
+    for task in tasks:
+        pending.append(executor.submit(fn, task))
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+"""
+Batches of the lines of a JSON Lines file, or of the rows of a CSV file
+with the line each row starts on. CSV rows are read by csv.DictReader
+from the file itself, so quoted fields may span lines.
+"""
+def fileTasks(filename, size=PARSE_BATCH):
+    with open(filename, 'r', encoding='utf-8', newline='') as source:
+        if filename.lower().endswith('.csv'):
+            reader = csv.DictReader(source)
+            # reads the header, so line_num counts it
+            reader.fieldnames
+            rows = []
+            start = reader.line_num + 1
+            for row in reader:
+                rows.append((start, row))
+                start = reader.line_num + 1
+                if len(rows) >= size:
+                    yield ('csv', rows, None)
+                    rows = []
+            if rows:
+                yield ('csv', rows, None)
+            return
+
+        first = 1
+        lines = []
+        for line in source:
+            lines.append(line)
+            if len(lines) >= size:
+                yield ('jsonl', lines, first)
+                first += len(lines)
+                lines = []
+        if lines:
+            yield ('jsonl', lines, first)
+
+
+def storeTasks(store, size=READ_BATCH):
+    first = 0
+    for records in store.iterBatches(size):
+        yield ('records', records, first)
+        first += len(records)
+
+
+"""
+Collects the outcome of every batch: counts, bounds and errors, and
+decides which records are kept. Ids seen before are duplicates; with
+dropIdentical, so are primitives equal to an earlier one in everything but
+the id.
+"""
+class BatchReport:
+    MAX_ERRORS = 100
+
+    def __init__(self, source, dropIdentical=False):
+        self.source = source
+        self.dropIdentical = dropIdentical
+        self.m_ids = set()
+        self.m_digests = set()
+        self.m_groups = set()
+        self.m_parents = set()
+        self.types = collections.Counter()
+        self.errors = collections.Counter()
+        self.examples = []
+        self.duplicateIds = 0
+        self.identical = 0
+        self.lo = np.full(3, np.inf)
+        self.hi = np.full(3, -np.inf)
+
+    def error(self, line, message):
+        # counted by kind: "bad color '#12'" as "bad color"
+        words = message.split(' ')
+        self.errors[' '.join(words[:2]) if words[0] in ('bad', 'duplicate') else message] += 1
+        if len(self.examples) < self.MAX_ERRORS:
+            self.examples.append(f"{self.source}:{line}: {message}")
+
+    """
+    Records of result that are kept
+    """
+    def accept(self, result):
+        for line, message in result['errors']:
+            self.error(line, message)
+
+        kept = []
+        for line, record, key in zip(result['lines'], result['records'], result['digests']):
+            if record['id'] in self.m_ids:
+                self.duplicateIds += 1
+                self.error(line, f"duplicate id {record['id']}")
+                continue
+            if key is not None and key in self.m_digests:
+                self.identical += 1
+                if self.dropIdentical:
+                    continue
+            self.m_ids.add(record['id'])
+            if key is not None:
+                self.m_digests.add(key)
+            self.types[record['type']] += 1
+            if record['type'] == 'group':
+                self.m_groups.add(record['id'])
+            elif record.get('parent') is None:
+                # grouped positions are relative to their group
+                position = record['position']
+                point = (position['x'], position['y'], position['z'])
+                self.lo = np.minimum(self.lo, point)
+                self.hi = np.maximum(self.hi, point)
+            if record.get('parent') is not None:
+                self.m_parents.add(record['parent'])
+            kept.append(record)
+        return kept
+
+    def invalid(self):
+        return sum(self.errors.values())
+
+    def summary(self):
+        summary = {'source': self.source, 'records': sum(self.types.values()),
+                   'types': dict(self.types), 'invalid': self.invalid() - self.duplicateIds,
+                   'duplicate_ids': self.duplicateIds, 'identical': self.identical,
+                   'orphaned_parents': len(self.m_parents - self.m_groups),
+                   'errors': dict(self.errors), 'examples': self.examples}
+        if np.isfinite(self.lo).all():
+            summary['bounds'] = [self.lo.tolist(), self.hi.tolist()]
+        return summary
+
+
+def openStoreAt(backend, filename):
+    storeClass, defaultFilename = BACKENDS[backend]
+    return storeClass(filename or defaultFilename)
+
+
+def storePath(backend, filename):
+    return filename or BACKENDS[backend][1]
+
+
+def pathBytes(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(root, name))
+                   for root, _, names in os.walk(path) for name in names)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def run(tasks, report, workers, consume=None):
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for result in mapBounded(executor, processBatch, tasks, 2 * workers):
+            kept = report.accept(result)
+            if consume is not None:
+                consume(kept)
+
+
+"""
+Validates and normalizes the records of CSV or JSON Lines files and writes
+them to the store. Records with ids already in the store replace them.
+"""
+def importFiles(filenames, store, workers=None, dropIdentical=False):
+    reports = []
+    pending = []
+
+    def write(records, final=False):
+        pending.extend(records)
+        if pending and (final or len(pending) >= WRITE_BATCH):
+            store.applyBatch({record['id']: record for record in pending}, set())
+            pending.clear()
+
+    for filename in filenames:
+        report = BatchReport(filename, dropIdentical)
+        # ids must stay unique across all input files
+        if reports:
+            report.m_ids = reports[-1].m_ids
+            report.m_digests = reports[-1].m_digests
+        run(fileTasks(filename), report, workers, write)
+        reports.append(report)
+    write([], final=True)
+    return reports
+
+
+def validateFiles(filenames, workers=None):
+    reports = []
+    for filename in filenames:
+        report = BatchReport(filename)
+        run(fileTasks(filename), report, workers)
+        reports.append(report)
+    return reports
+
+
+def inspectStore(store, name, workers=None):
+    report = BatchReport(name)
+    run(storeTasks(store), report, workers)
+    return report
+
+
+"""
+Rewrites the store without invalid records, duplicate ids and, unless
+keepIdentical, primitives identical to another but for their id. The
+records go to a fresh store of the same backend next to the old one, which
+is then replaced, so the result also carries no history or free pages.
+"""
+def compactStore(backend, filename, workers=None, keepIdentical=False):
+    path = storePath(backend, filename)
+    # keeps the extension, which pysondb requires of its files
+    root, extension = os.path.splitext(path)
+    temporary = root + '.compacting' + extension
+    if os.path.isdir(temporary):
+        shutil.rmtree(temporary)
+    elif os.path.exists(temporary):
+        os.remove(temporary)
+
+    store = openStoreAt(backend, path)
+    target = openStoreAt(backend, temporary)
+    report = BatchReport(path, dropIdentical=not keepIdentical)
+    before = pathBytes(path)
+
+    def write(records):
+        if records:
+            target.applyBatch({record['id']: record for record in records}, set())
+
+    try:
+        run(storeTasks(store), report, workers, write)
+    finally:
+        store.close()
+        target.close()
+
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.replace(temporary, path)
+    if os.path.exists(temporary + '.lock'):
+        os.remove(temporary + '.lock')
+    summary = report.summary()
+    summary.update(bytes_before=before, bytes_after=pathBytes(path))
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Import, validate, compact and inspect scene stores without the editor")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=STORE_BACKEND)
+    parser.add_argument("--store", help="store file or directory, the backend default otherwise")
+    parser.add_argument("--workers", type=int, help="worker processes, one per core by default")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    importParser = commands.add_parser("import", help="import CSV or JSON Lines files")
+    importParser.add_argument("files", nargs='+')
+    importParser.add_argument("--drop-identical", action="store_true",
+                              help="skip primitives identical to one imported before")
+    validateParser = commands.add_parser("validate", help="check files, or the store")
+    validateParser.add_argument("files", nargs='*')
+    compactParser = commands.add_parser("compact", help="deduplicate and rewrite the store")
+    compactParser.add_argument("--keep-identical", action="store_true",
+                               help="keep primitives that differ only in their id")
+    commands.add_parser("stats", help="counts, bounds and problems of the store")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "import":
+        store = openStoreAt(args.backend, args.store)
+        try:
+            result = [report.summary() for report in
+                      importFiles(args.files, store, args.workers, args.drop_identical)]
+        finally:
+            store.close()
+        failed = False
+    elif args.command == "validate" and args.files:
+        result = [report.summary() for report in validateFiles(args.files, args.workers)]
+        failed = any(report['invalid'] or report['duplicate_ids'] for report in result)
+    elif args.command == "compact":
+        result = compactStore(args.backend, args.store, args.workers, args.keep_identical)
+        failed = False
+    else:
+        path = storePath(args.backend, args.store)
+        store = openStoreAt(args.backend, path)
+        try:
+            result = inspectStore(store, path, args.workers).summary()
+        finally:
+            store.close()
+        result['bytes'] = pathBytes(path)
+        failed = args.command == "validate" and bool(
+            result['invalid'] or result['duplicate_ids'] or result['orphaned_parents'])
+
+    print(json.dumps({'command': args.command, 'elapsed_s': time.perf_counter() - start,
+                      'result': result}, indent=3))
+    sys.exit(1 if failed else 0)
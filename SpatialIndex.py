@@ -0,0 +1,428 @@
+import math
+from PySide2 import QtCore, QtGui
+
+INF = float('inf')
+# a click is a press and release closer together than this, in pixels
+CLICK_DISTANCE = 4
+CULL_INTERVAL_MS = 50
+
+"""
+Axis aligned world bounds of primitive as (lo, hi) tuples, from its bounding
+sphere
+"""
+def primitiveBounds(primitive):
+    center = primitive.worldPosition()
+    radius = primitive.boundingRadius()
+    return ((center.x() - radius, center.y() - radius, center.z() - radius),
+            (center.x() + radius, center.y() + radius, center.z() + radius))
+
+
+def union(lo1, hi1, lo2, hi2):
+    return ((min(lo1[0], lo2[0]), min(lo1[1], lo2[1]), min(lo1[2], lo2[2])),
+            (max(hi1[0], hi2[0]), max(hi1[1], hi2[1]), max(hi1[2], hi2[2])))
+
+
+"""
+Distance along the ray to the box, or None when the ray misses it
+"""
+def rayBox(origin, inverse, lo, hi):
+    if lo[0] > hi[0]:
+        return None
+    near, far = 0.0, INF
+    for axis in range(3):
+        if inverse[axis] == INF:
+            if origin[axis] < lo[axis] or origin[axis] > hi[axis]:
+                return None
+            continue
+        t1 = (lo[axis] - origin[axis]) * inverse[axis]
+        t2 = (hi[axis] - origin[axis]) * inverse[axis]
+        if t1 > t2:
+            t1, t2 = t2, t1
+        near = max(near, t1)
+        far = min(far, t2)
+        if near > far:
+            return None
+    return near
+
+
+def reciprocal(direction):
+    return tuple(1.0 / d if d != 0.0 else INF for d in direction)
+
+
+"""
+Exact hit distance of the ray against the primitive's shape, or None
+"""
+def rayPrimitive(primitive, origin, direction):
+    if primitive.primitiveType() == 'sphere':
+        center = primitive.worldPosition()
+        radius = primitive.boundingRadius()
+        offset = (origin[0] - center.x(), origin[1] - center.y(), origin[2] - center.z())
+        b = sum(offset[i] * direction[i] for i in range(3))
+        c = sum(o * o for o in offset) - radius * radius
+        a = sum(d * d for d in direction)
+        discriminant = b * b - a * c
+        if discriminant < 0:
+            return None
+        t = (-b - math.sqrt(discriminant)) / a
+        if t < 0:
+            t = (-b + math.sqrt(discriminant)) / a
+        return t if t >= 0 else None
+
+    # cubes: intersect the extents box in the cube's local space
+    inverse, invertible = primitive.worldMatrix().inverted()
+    if not invertible:
+        return None
+    localOrigin = inverse.map(QtGui.QVector3D(*origin))
+    localDirection = inverse.mapVector(QtGui.QVector3D(*direction))
+    half = (primitive.length() / 2.0, primitive.height() / 2.0, primitive.width() / 2.0)
+    localOrigin = (localOrigin.x(), localOrigin.y(), localOrigin.z())
+    localDirection = (localDirection.x(), localDirection.y(), localDirection.z())
+    return rayBox(localOrigin, reciprocal(localDirection),
+                  tuple(-h for h in half), half)
+
+
+class BVHNode:
+    __slots__ = ('lo', 'hi', 'left', 'right', 'parent', 'key')
+
+    def __init__(self, lo, hi, key=None):
+        self.lo = lo
+        self.hi = hi
+        self.left = None
+        self.right = None
+        self.parent = None
+        self.key = key
+
+
+"""
+Bounding volume hierarchy over primitive bounds. Moving or resizing a
+primitive refits its leaf and ancestors; insertions go to a small pending
+list that queries scan linearly, and the tree is rebuilt once pending
+insertions or accumulated refits make it worth it.
+"""
+class BVH:
+    def __init__(self):
+        self.m_root = None
+        self.m_leaves = {}
+        self.m_primitives = {}
+        self.m_pending = {}
+        self.m_refits = 0
+
+    def __len__(self):
+        return len(self.m_primitives)
+
+    def insert(self, primitive):
+        self.m_primitives[primitive.persist_id] = primitive
+        self.m_pending[primitive.persist_id] = primitiveBounds(primitive)
+        if len(self.m_pending) > max(64, len(self.m_primitives) // 8):
+            self.rebuild()
+
+    """
+    Adds many primitives with at most one rebuild, for bulk creation
+    """
+    def insertMany(self, primitives):
+        for primitive in primitives:
+            self.m_primitives[primitive.persist_id] = primitive
+            self.m_pending[primitive.persist_id] = primitiveBounds(primitive)
+        if len(self.m_pending) > max(64, len(self.m_primitives) // 8):
+            self.rebuild()
+
+    def remove(self, primitive):
+        key = primitive.persist_id
+        self.m_primitives.pop(key, None)
+        self.m_pending.pop(key, None)
+        leaf = self.m_leaves.pop(key, None)
+        if leaf is not None:
+            leaf.key = None
+            self.refit(leaf, (INF, INF, INF), (-INF, -INF, -INF))
+
+    def update(self, primitive):
+        key = primitive.persist_id
+        if key in self.m_pending:
+            self.m_pending[key] = primitiveBounds(primitive)
+            return
+        leaf = self.m_leaves.get(key)
+        if leaf is None:
+            return
+        lo, hi = primitiveBounds(primitive)
+        self.refit(leaf, lo, hi)
+
+    """
+    Updates many primitives, such as the members of a moved group, with a
+    single rebuild when refitting them one by one would cost more
+    """
+    def updateMany(self, primitives):
+        if len(primitives) > max(64, len(self.m_primitives) // 8):
+            self.rebuild()
+            return
+        for primitive in primitives:
+            self.update(primitive)
+
+    def refit(self, node, lo, hi):
+        node.lo, node.hi = lo, hi
+        node = node.parent
+        while node is not None:
+            node.lo, node.hi = union(node.left.lo, node.left.hi, node.right.lo, node.right.hi)
+            node = node.parent
+
+        # refitted trees lose quality as objects move away from their siblings
+        self.m_refits += 1
+        if self.m_refits > max(256, len(self.m_primitives)):
+            self.rebuild()
+
+    def rebuild(self):
+        items = []
+        for key, primitive in self.m_primitives.items():
+            lo, hi = primitiveBounds(primitive)
+            center = ((lo[0] + hi[0]) / 2.0, (lo[1] + hi[1]) / 2.0, (lo[2] + hi[2]) / 2.0)
+            items.append((key, lo, hi, center))
+
+        self.m_leaves = {}
+        self.m_pending = {}
+        self.m_refits = 0
+        self.m_root = self.build(items) if items else None
+
+    """
+    Top down build splitting at the median of the longest axis
+    """
+    def build(self, items):
+        if len(items) == 1:
+            key, lo, hi, center = items[0]
+            leaf = BVHNode(lo, hi, key)
+            self.m_leaves[key] = leaf
+            return leaf
+
+        lo = tuple(min(item[1][axis] for item in items) for axis in range(3))
+        hi = tuple(max(item[2][axis] for item in items) for axis in range(3))
+        extent = [hi[axis] - lo[axis] for axis in range(3)]
+        axis = extent.index(max(extent))
+        items.sort(key=lambda item: item[3][axis])
+        middle = len(items) // 2
+
+        node = BVHNode(lo, hi)
+        node.left = self.build(items[:middle])
+        node.right = self.build(items[middle:])
+        node.left.parent = node
+        node.right.parent = node
+        return node
+
+    """
+    Nearest primitive hit by the ray, with exact shape tests at the leaves.
+    With exact=False the bounding volumes themselves are hit.
+    """
+    def raycast(self, origin, direction, exact=True):
+        inverse = reciprocal(direction)
+        best, bestDistance = None, INF
+
+        def test(key, lo, hi):
+            nonlocal best, bestDistance
+            distance = rayBox(origin, inverse, lo, hi)
+            if distance is None or distance >= bestDistance:
+                return
+            primitive = self.m_primitives[key]
+            if exact:
+                distance = rayPrimitive(primitive, origin, direction)
+            if distance is not None and distance < bestDistance:
+                best, bestDistance = primitive, distance
+
+        stack = [self.m_root] if self.m_root is not None else []
+        while stack:
+            node = stack.pop()
+            distance = rayBox(origin, inverse, node.lo, node.hi)
+            if distance is None or distance >= bestDistance:
+                continue
+            if node.key is not None:
+                test(node.key, node.lo, node.hi)
+            elif node.left is not None:
+                stack.append(node.left)
+                stack.append(node.right)
+
+        for key, (lo, hi) in self.m_pending.items():
+            test(key, lo, hi)
+        return best
+
+    """
+    Primitives whose bounds intersect the frustum given as (a, b, c, d) planes
+    facing inwards
+    """
+    def frustumQuery(self, planes):
+        def inside(lo, hi):
+            for a, b, c, d in planes:
+                x = hi[0] if a > 0 else lo[0]
+                y = hi[1] if b > 0 else lo[1]
+                z = hi[2] if c > 0 else lo[2]
+                if a * x + b * y + c * z + d < 0:
+                    return False
+            return True
+
+        visible = set()
+        stack = [self.m_root] if self.m_root is not None else []
+        while stack:
+            node = stack.pop()
+            if not inside(node.lo, node.hi):
+                continue
+            if node.key is not None:
+                visible.add(node.key)
+            elif node.left is not None:
+                stack.append(node.left)
+                stack.append(node.right)
+
+        for key, (lo, hi) in self.m_pending.items():
+            if inside(lo, hi):
+                visible.add(key)
+        return visible
+
+
+"""
+Frustum planes of a view-projection matrix
+"""
+def frustumPlanes(viewProjection):
+    rows = [viewProjection.row(i) for i in range(4)]
+    planes = []
+    for i in range(3):
+        for sign in (1.0, -1.0):
+            plane = rows[3] + rows[i] * sign
+            planes.append((plane.x(), plane.y(), plane.z(), plane.w()))
+    return planes
+
+
+"""
+World space ray through a window position
+"""
+def cameraRay(cameraEntity, x, y, width, height):
+    viewport = QtCore.QRect(0, 0, width, height)
+    view = cameraEntity.viewMatrix()
+    projection = cameraEntity.projectionMatrix()
+    near = QtGui.QVector3D(x, height - y, 0.0).unproject(view, projection, viewport)
+    far = QtGui.QVector3D(x, height - y, 1.0).unproject(view, projection, viewport)
+    direction = (far - near).normalized()
+    return (near.x(), near.y(), near.z()), (direction.x(), direction.y(), direction.z())
+
+
+"""
+Central picking for the 3D view. Watches mouse events on the Qt3D window
+and resolves clicks and hovers with one ray query against the BVH, instead
+of a QObjectPicker on every entity. Hover picking costs a ray query per
+mouse move, so it stays off until something listens to hovered.
+"""
+class PickDispatcher(QtCore.QObject):
+    hovered = QtCore.Signal(object)
+
+    def __init__(self, view, cameraEntity, shapeEditor):
+        super().__init__()
+        self.view = view
+        self.m_cameraEntity = cameraEntity
+        self.shapeEditor = shapeEditor
+        self.hoverEnabled = False
+        self.exact = True
+        self.m_pressPosition = None
+        self.m_hovered = None
+        view.installEventFilter(self)
+
+    """
+    Turns picking on mouse move on or off; turning it off clears the hover
+    """
+    def setHoverEnabled(self, enabled):
+        self.hoverEnabled = enabled
+        if not enabled and self.m_hovered is not None:
+            self.m_hovered = None
+            self.hovered.emit(None)
+
+    """
+    Picks exact shapes, or only their bounding volumes, which is cheaper
+    """
+    def setExact(self, exact):
+        self.exact = exact
+
+    def pick(self, position):
+        origin, direction = cameraRay(self.m_cameraEntity, position.x(), position.y(),
+                                      self.view.width(), self.view.height())
+        return self.shapeEditor.spatialIndex.raycast(origin, direction, self.exact)
+
+    def eventFilter(self, watched, event):
+        if event.type() == QtCore.QEvent.MouseButtonPress and \
+                event.button() == QtCore.Qt.LeftButton:
+            self.m_pressPosition = event.pos()
+        elif event.type() == QtCore.QEvent.MouseButtonRelease and \
+                event.button() == QtCore.Qt.LeftButton and self.m_pressPosition is not None:
+            moved = (event.pos() - self.m_pressPosition).manhattanLength()
+            self.m_pressPosition = None
+            if moved <= CLICK_DISTANCE:
+                primitive = self.pick(event.pos())
+                if primitive is not None:
+                    primitive.primitiveClicked()
+        elif event.type() == QtCore.QEvent.MouseMove and self.hoverEnabled and \
+                event.buttons() == QtCore.Qt.NoButton:
+            primitive = self.pick(event.pos())
+            if primitive is not self.m_hovered:
+                self.m_hovered = primitive
+                self.hovered.emit(primitive)
+        return False
+
+
+"""
+Disables entities whose bounds are outside the camera frustum
+"""
+class FrustumCuller(QtCore.QObject):
+    def __init__(self, cameraEntity, shapeEditor):
+        super().__init__()
+        self.m_cameraEntity = cameraEntity
+        self.shapeEditor = shapeEditor
+        self.enabled = True
+        self.m_visible = set()
+        self.m_stats = {'visible': 0, 'culled': 0}
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(CULL_INTERVAL_MS)
+        self.timer.timeout.connect(self.update)
+
+        self.m_cameraEntity.viewMatrixChanged.connect(self.markDirty)
+        self.m_cameraEntity.projectionMatrixChanged.connect(self.markDirty)
+
+    def setEnabled(self, enabled):
+        self.enabled = enabled
+        self.markDirty()
+
+    def markDirty(self):
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def primitiveAdded(self, primitive):
+        self.m_visible.add(primitive.persist_id)
+        self.markDirty()
+
+    def primitiveRemoved(self, primitive):
+        self.m_visible.discard(primitive.persist_id)
+
+    """
+    Treats every entity as enabled again, after another mode re-enabled them
+    """
+    def reset(self):
+        self.m_visible = set(self.shapeEditor.spatialIndex.m_primitives)
+        self.markDirty()
+
+    def update(self):
+        shapeEditor = self.shapeEditor
+        # instanced drawing and static batching manage entity state themselves
+        if shapeEditor.instancedRenderer.enabled or shapeEditor.staticBatcher.enabled:
+            return
+
+        index = shapeEditor.spatialIndex
+        if self.enabled:
+            viewProjection = self.m_cameraEntity.projectionMatrix() * self.m_cameraEntity.viewMatrix()
+            visible = index.frustumQuery(frustumPlanes(viewProjection))
+        else:
+            visible = set(index.m_primitives)
+
+        for key in visible - self.m_visible:
+            index.m_primitives[key].setEntityEnabled(True)
+        for key in self.m_visible - visible:
+            primitive = index.m_primitives.get(key)
+            if primitive is not None:
+                primitive.setEntityEnabled(False)
+
+        self.m_visible = visible
+        self.m_stats = {'visible': len(visible), 'culled': len(index) - len(visible)}
+
+    def stats(self):
+        return dict(self.m_stats)
@@ -0,0 +1,245 @@
+import time
+import numpy as np
+from PySide2 import QtCore
+from PySide2.Qt3DCore import Qt3DCore
+from PySide2.Qt3DRender import Qt3DRender
+from InstancedRenderer import createShaderMaterial, INSTANCED_FRAGMENT_SHADER
+from Tessellation import unitSphere, unitCube, bakeVertices, VERTEX_FLOATS
+
+# baked spheres use one fixed tessellation, whatever their level of detail
+BAKE_SPHERE_RINGS = 12
+BAKE_SPHERE_SLICES = 12
+# vertices per merged buffer; a primitive is never split across buffers
+MAX_BATCH_VERTICES = 1 << 20
+VERTEX_STRIDE = VERTEX_FLOATS * 4
+
+BAKED_VERTEX_SHADER = b"""
+#version 150 core
+in vec3 vertexPosition;
+in vec3 vertexNormal;
+in vec3 vertexColor;
+
+out vec3 worldPosition;
+out vec3 worldNormal;
+out vec3 color;
+
+uniform mat4 viewProjectionMatrix;
+
+void main()
+{
+    worldPosition = vertexPosition;
+    worldNormal = vertexNormal;
+    color = vertexColor;
+    gl_Position = viewProjectionMatrix * vec4(vertexPosition, 1.0);
+}
+"""
+
+"""
+One draw of many primitives merged into a single vertex and index buffer
+"""
+class BakedBatch:
+    def __init__(self, parentEntity, material):
+        self.m_Entity = Qt3DCore.QEntity(parentEntity)
+        self.geometry = Qt3DRender.QGeometry(self.m_Entity)
+        self.vertexBuffer = Qt3DRender.QBuffer(self.geometry)
+        self.indexBuffer = Qt3DRender.QBuffer(self.geometry)
+        self.attributes = []
+
+        offset = 0
+        for name in ('vertexPosition', 'vertexNormal', 'vertexColor'):
+            attribute = Qt3DRender.QAttribute(self.geometry)
+            attribute.setName(name)
+            attribute.setAttributeType(Qt3DRender.QAttribute.VertexAttribute)
+            attribute.setVertexBaseType(Qt3DRender.QAttribute.Float)
+            attribute.setVertexSize(3)
+            attribute.setByteOffset(offset)
+            attribute.setByteStride(VERTEX_STRIDE)
+            attribute.setBuffer(self.vertexBuffer)
+            self.geometry.addAttribute(attribute)
+            self.attributes.append(attribute)
+            offset += 3 * 4
+
+        self.indexAttribute = Qt3DRender.QAttribute(self.geometry)
+        self.indexAttribute.setAttributeType(Qt3DRender.QAttribute.IndexAttribute)
+        self.indexAttribute.setVertexBaseType(Qt3DRender.QAttribute.UnsignedInt)
+        self.indexAttribute.setBuffer(self.indexBuffer)
+        self.geometry.addAttribute(self.indexAttribute)
+
+        self.renderer = Qt3DRender.QGeometryRenderer()
+        self.renderer.setGeometry(self.geometry)
+        self.renderer.setPrimitiveType(Qt3DRender.QGeometryRenderer.Triangles)
+        self.m_Entity.addComponent(self.renderer)
+        self.m_Entity.addComponent(material)
+
+    def setData(self, vertices, indices):
+        self.vertexBuffer.setData(QtCore.QByteArray(vertices.tobytes()))
+        self.indexBuffer.setData(QtCore.QByteArray(indices.tobytes()))
+        for attribute in self.attributes:
+            attribute.setCount(len(vertices))
+        self.indexAttribute.setCount(len(indices))
+        self.renderer.setVertexCount(len(indices))
+        self.m_Entity.setEnabled(len(indices) > 0)
+
+    """
+    Overwrites vertices from first on, without uploading the whole buffer
+    """
+    def updateVertices(self, first, vertices):
+        self.vertexBuffer.updateData(first * VERTEX_STRIDE, QtCore.QByteArray(vertices.tobytes()))
+
+    """
+    Collapses count vertices from first on to a point, so their triangles
+    no longer draw
+    """
+    def hideVertices(self, first, count):
+        self.vertexBuffer.updateData(first * VERTEX_STRIDE,
+                                     QtCore.QByteArray(bytes(count * VERTEX_STRIDE)))
+
+
+"""
+Optional rendering mode that bakes every primitive into a few large merged
+meshes with pre-transformed positions and vertex colors, so the whole scene
+takes one draw per buffer. Primitive entities are disabled while the mode
+is on. The selected primitive is cut out of its buffer and drawn by its own
+entity, so it can be edited; it is baked back in once deselected. Edits
+and removals rewrite just the vertex range of the primitive; only new
+primitives cause a full rebake.
+"""
+class StaticBatcher(QtCore.QObject):
+    def __init__(self, rootEntity, shapeEditor):
+        super().__init__()
+        self.m_rootEntity = rootEntity
+        self.shapeEditor = shapeEditor
+        self.enabled = False
+        self.selected = None
+        self.m_rebuildPending = False
+        self.m_batches = []
+        # persist_id -> (batch, first vertex, vertex count)
+        self.m_ranges = {}
+        self.m_meshes = None
+        self.m_stats = {'rebuilds': 0, 'updates': 0, 'last_rebuild_ms': 0.0}
+
+    def setEnabled(self, enabled):
+        if enabled == self.enabled:
+            return
+        self.enabled = enabled
+        if enabled and self.m_meshes is None:
+            self.m_Entity = Qt3DCore.QEntity(self.m_rootEntity)
+            self.material = createShaderMaterial(self.m_Entity, BAKED_VERTEX_SHADER,
+                                                 INSTANCED_FRAGMENT_SHADER)
+            self.m_meshes = {'sphere': unitSphere(BAKE_SPHERE_RINGS, BAKE_SPHERE_SLICES),
+                             'cube': unitCube()}
+
+        self.m_Entity.setEnabled(enabled)
+        for primitive in self.shapeEditor.primitives():
+            primitive.setEntityEnabled(not enabled or primitive is self.selected)
+        if not enabled:
+            self.m_ranges = {}
+            self.shapeEditor.frustumCuller.reset()
+        self.markDirty()
+
+    """
+    Un-bakes primitive and bakes the previously selected one back in
+    """
+    def setSelected(self, primitive):
+        previous = self.selected
+        self.selected = primitive
+        if not self.enabled or previous is primitive:
+            return
+        if previous is not None:
+            previous.setEntityEnabled(False)
+            self.rebake(previous)
+        if primitive is not None:
+            primitive.setEntityEnabled(True)
+            self.hide(primitive.persist_id)
+
+    """
+    Schedules one full rebake for the next event loop tick
+    """
+    def markDirty(self):
+        if not self.enabled or self.m_rebuildPending:
+            return
+        self.m_rebuildPending = True
+        QtCore.QTimer.singleShot(0, self.rebuild)
+
+    def primitiveAdded(self, primitive):
+        if self.enabled and primitive is not self.selected:
+            primitive.setEntityEnabled(False)
+
+    """
+    Rewrites the baked vertices of primitive after a committed change
+    """
+    def primitiveChanged(self, primitive):
+        if primitive is not self.selected:
+            self.rebake(primitive)
+
+    def primitiveRemoved(self, primitive):
+        if self.selected is primitive:
+            self.selected = None
+        self.hide(primitive.persist_id)
+        self.m_ranges.pop(primitive.persist_id, None)
+
+    def rebake(self, primitive):
+        # groups have no vertices of their own
+        if not self.enabled or primitive.slot is None:
+            return
+        entry = self.m_ranges.get(primitive.persist_id)
+        if entry is None:
+            self.markDirty()
+            return
+        batch, first, count = entry
+        positions, normals, _ = self.m_meshes[primitive.primitiveType()]
+        model = self.shapeEditor.sceneModel
+        batch.updateVertices(first, bakeVertices(model, np.array([primitive.slot]),
+                                                 positions, normals)[0])
+        self.m_stats['updates'] += 1
+
+    def hide(self, persist_id):
+        entry = self.m_ranges.get(persist_id)
+        if self.enabled and entry is not None:
+            entry[0].hideVertices(entry[1], entry[2])
+            self.m_stats['updates'] += 1
+
+    def rebuild(self):
+        self.m_rebuildPending = False
+        if not self.enabled:
+            return
+
+        start = time.perf_counter()
+        model = self.shapeEditor.sceneModel
+        self.m_ranges = {}
+        used = 0
+        for primitiveType, (positions, normals, indices) in self.m_meshes.items():
+            slots = model.slotsOfType(primitiveType)
+            perBatch = max(1, MAX_BATCH_VERTICES // len(positions))
+            for begin in range(0, len(slots), perBatch):
+                chunk = slots[begin:begin + perBatch]
+                if used == len(self.m_batches):
+                    self.m_batches.append(BakedBatch(self.m_Entity, self.material))
+                batch = self.m_batches[used]
+                used += 1
+
+                vertices = bakeVertices(model, chunk, positions, normals)
+                offsets = np.arange(len(chunk), dtype=np.uint32)[:, None] * len(positions)
+                for number, persist_id in enumerate(model.ids[chunk].tolist()):
+                    self.m_ranges[persist_id] = (batch, number * len(positions), len(positions))
+                batch.setData(vertices.reshape(-1, VERTEX_FLOATS),
+                              (indices[None] + offsets).ravel())
+
+        for batch in self.m_batches[used:]:
+            batch.m_Entity.setEnabled(False)
+        if self.selected is not None:
+            self.hide(self.selected.persist_id)
+        self.m_stats['rebuilds'] += 1
+        self.m_stats['last_rebuild_ms'] = (time.perf_counter() - start) * 1000.0
+
+    def drawCalls(self):
+        if not self.enabled:
+            return sum(1 for primitive in self.shapeEditor.primitives())
+        batches = sum(1 for batch in self.m_batches if batch.m_Entity.isEnabled())
+        return batches + (1 if self.selected is not None else 0)
+
+    def stats(self):
+        stats = dict(self.m_stats)
+        stats['batches'] = sum(1 for batch in self.m_batches if batch.m_Entity.isEnabled())
+        stats['baked'] = len(self.m_ranges)
+        return stats
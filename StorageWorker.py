@@ -0,0 +1,74 @@
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from PySide2 import QtCore
+from SceneStore import openStore
+
+READ_WORKERS = 2
+
+"""
+Runs storage I/O off the GUI thread. Reads and parsing go to a small pool
+and may run concurrently; writes go to a single lane, so they reach the
+store in submission order and every persist_id sees its updates and
+deletions in order. Results come back on the GUI thread through a queued
+signal. A task that fails is reported through the failed signal and, if
+given, to its errback with the exception, also on the GUI thread.
+"""
+class StorageWorker(QtCore.QObject):
+    resultReady = QtCore.Signal(object, object)
+    failed = QtCore.Signal(str, str)
+
+    def __init__(self, store=None, readers=READ_WORKERS):
+        super().__init__()
+        self.m_store = store
+        self.m_readers = ThreadPoolExecutor(max_workers=readers,
+                                            thread_name_prefix='storage-read')
+        self.m_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='storage-write')
+        self.m_closed = False
+        self.resultReady.connect(self.deliver, QtCore.Qt.QueuedConnection)
+
+    """
+    Store used by the tasks, the process wide store unless one was given.
+    It is opened on first use, on whichever worker thread needs it.
+    """
+    def store(self):
+        return self.m_store if self.m_store is not None else openStore()
+
+    def read(self, function, *args, callback=None, errback=None):
+        return self.submit(self.m_readers, function, args, callback, errback)
+
+    def write(self, function, *args, callback=None, errback=None):
+        return self.submit(self.m_writer, function, args, callback, errback)
+
+    def submit(self, executor, function, args, callback, errback):
+        return executor.submit(self.run, function, args, callback, errback)
+
+    """
+    Runs on a worker thread. Failures are reported through the failed
+    signal instead of being lost in the future.
+    """
+    def run(self, function, args, callback, errback):
+        try:
+            result = function(*args)
+        except Exception as error:
+            traceback.print_exc()
+            self.failed.emit(getattr(function, '__name__', str(function)), str(error))
+            if errback is not None:
+                self.resultReady.emit(errback, error)
+            return None
+        if callback is not None:
+            self.resultReady.emit(callback, result)
+        return result
+
+    def deliver(self, callback, result):
+        callback(result)
+
+    """
+    Waits for every queued write to reach the store, then stops both pools.
+    Connected to application exit through the persistence queue.
+    """
+    def shutdown(self):
+        if self.m_closed:
+            return
+        self.m_closed = True
+        self.m_writer.shutdown(wait=True)
+        self.m_readers.shutdown(wait=True)
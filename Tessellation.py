@@ -0,0 +1,73 @@
+import numpy as np
+from SceneModel import TYPE_CODES
+
+# position (3), normal (3), color (3)
+VERTEX_FLOATS = 9
+
+
+"""
+Positions, normals and triangle indices of a unit radius UV sphere
+"""
+def unitSphere(rings, slices):
+    theta, phi = np.meshgrid(np.linspace(0.0, np.pi, rings + 1),
+                             np.linspace(0.0, 2.0 * np.pi, slices + 1), indexing='ij')
+    positions = np.stack([np.sin(theta) * np.cos(phi), np.cos(theta),
+                          np.sin(theta) * np.sin(phi)], axis=-1).reshape(-1, 3)
+    ring, piece = np.meshgrid(np.arange(rings), np.arange(slices), indexing='ij')
+    first = (ring * (slices + 1) + piece).ravel()
+    second = first + slices + 1
+    indices = np.stack([first, second, first + 1, first + 1, second, second + 1], axis=-1)
+    return (positions.astype(np.float32), positions.astype(np.float32),
+            indices.ravel().astype(np.uint32))
+
+
+"""
+Positions, normals and triangle indices of a unit cube centered on the
+origin, four vertices per face so faces shade flat
+"""
+def unitCube():
+    positions, normals, indices = [], [], []
+    for axis in range(3):
+        u, v = [other for other in range(3) if other != axis]
+        for sign in (-1.0, 1.0):
+            base = len(positions)
+            for du, dv in ((-1.0, -1.0), (1.0, -1.0), (1.0, 1.0), (-1.0, 1.0)):
+                corner = [0.0, 0.0, 0.0]
+                corner[axis], corner[u], corner[v] = sign * 0.5, du * 0.5, dv * 0.5
+                normal = [0.0, 0.0, 0.0]
+                normal[axis] = sign
+                positions.append(corner)
+                normals.append(normal)
+            indices += [base, base + 1, base + 2, base, base + 2, base + 3]
+    return (np.array(positions, dtype=np.float32), np.array(normals, dtype=np.float32),
+            np.array(indices, dtype=np.uint32))
+
+
+"""
+Rotates vectors (n, v, 3) by quaternions (n, 4) stored xyzw
+"""
+def rotate(quaternions, vectors):
+    axis = quaternions[:, None, :3]
+    turned = np.cross(axis, vectors) + quaternions[:, None, 3:] * vectors
+    return vectors + 2.0 * np.cross(axis, turned)
+
+
+"""
+Pre-transformed, colored vertices (n, v, VERTEX_FLOATS) of the given model
+slots, all of one type, for the unit mesh (positions, normals), placed in
+the world through their groups
+"""
+def bakeVertices(model, slots, positions, normals):
+    extents = model.dimensions[slots]
+    if model.types[slots[:1]].tolist() == [TYPE_CODES['sphere']]:
+        extents = np.repeat(extents[:, :1], 3, axis=1)
+    extents = np.maximum(extents * model.scales[slots], np.float32(1e-6))
+    quaternions = model.worldRotations(slots)
+
+    vertices = np.empty((len(slots), len(positions), VERTEX_FLOATS), dtype=np.float32)
+    vertices[:, :, 0:3] = rotate(quaternions, positions[None] * extents[:, None]) + \
+        model.worldPositions(slots)[:, None]
+    turned = rotate(quaternions, normals[None] / extents[:, None])
+    vertices[:, :, 3:6] = turned / np.linalg.norm(turned, axis=2, keepdims=True)
+    vertices[:, :, 6:9] = (model.colors[slots, :3] / np.float32(255.0))[:, None]
+    return vertices
@@ -0,0 +1,165 @@
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from PySide2 import QtWidgets, QtCore
+
+TRACE_ENV = "EDITOR_TRACE"
+# events kept in memory before older ones stop being recorded
+MAX_EVENTS = 1000000
+STATS_REFRESH_MS = 1000
+
+# hot paths wrapped in spans when tracing is enabled, on whichever of the
+# instrumented classes define them
+TRACED_METHODS = ('persist', 'restore', 'remove', 'restoreData', 'restorePrimitive',
+                  'addPrimitives', 'handleClickedPrimitive', 'createCube', 'createSphere',
+                  'populate_fields', 'delete_primitive', 'restoreBatch', 'readRecords',
+                  'undo', 'redo', 'applyPending', 'materialize', 'dematerialize')
+
+"""
+Records timed spans and counters and writes them as a Chrome/Perfetto trace.
+Spans may end on any thread; the storage worker records its reads and
+writes from its pools.
+"""
+class Tracer:
+    def __init__(self, path):
+        self.path = path
+        self.pid = os.getpid()
+        self.origin = time.perf_counter()
+        self.events = []
+        self.stats = {}
+        self.dropped = 0
+        self.lock = threading.Lock()
+
+    def timestamp(self, counter):
+        return (counter - self.origin) * 1e6
+
+    def record(self, name, start, end):
+        duration = (end - start) * 1000.0
+        with self.lock:
+            stat = self.stats.get(name)
+            if stat is None:
+                stat = self.stats[name] = {'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0}
+            stat['calls'] += 1
+            stat['total_ms'] += duration
+            stat['max_ms'] = max(stat['max_ms'], duration)
+
+            if len(self.events) >= MAX_EVENTS:
+                self.dropped += 1
+                return
+            self.events.append({'name': name, 'ph': 'X', 'pid': self.pid,
+                                'tid': threading.get_ident(),
+                                'ts': self.timestamp(start), 'dur': duration * 1000.0})
+
+    @contextlib.contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def counter(self, name, values):
+        with self.lock:
+            if len(self.events) < MAX_EVENTS:
+                self.events.append({'name': name, 'ph': 'C', 'pid': self.pid,
+                                    'ts': self.timestamp(time.perf_counter()), 'args': values})
+
+    def wrap(self, function, name):
+        @functools.wraps(function)
+        def traced(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.record(name, start, time.perf_counter())
+        return traced
+
+    """
+    Wraps the traced methods each class defines itself, so overrides and
+    the base implementations they call show up as nested spans
+    """
+    def instrument(self, classes):
+        for cls in classes:
+            for methodName in TRACED_METHODS:
+                if methodName in cls.__dict__:
+                    setattr(cls, methodName, self.wrap(
+                        cls.__dict__[methodName], f"{cls.__name__}.{methodName}"))
+
+    def summary(self):
+        with self.lock:
+            stats = [(name, dict(stat)) for name, stat in self.stats.items()]
+        return sorted(stats, key=lambda item: item[1]['total_ms'], reverse=True)
+
+    """
+    Writes the recorded events to path and returns how many were written
+    """
+    def save(self):
+        with self.lock:
+            events = list(self.events)
+        with open(self.path, 'w', encoding='utf-8') as trace_file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms',
+                       'otherData': {'dropped_events': self.dropped}}, trace_file)
+        return len(events)
+
+
+_tracer = None
+
+
+"""
+Turns tracing on for the given classes. Nothing is wrapped unless this is
+called, so disabled tracing costs nothing on the hot paths.
+"""
+def enableTracing(path, classes):
+    global _tracer
+    _tracer = Tracer(path)
+    _tracer.instrument(classes)
+    return _tracer
+
+
+def activeTracer():
+    return _tracer
+
+
+"""
+Span for ad hoc instrumentation; a no-op context when tracing is off
+"""
+def span(name):
+    if _tracer is None:
+        return contextlib.nullcontext()
+    return _tracer.span(name)
+
+
+"""
+Small table of per-span call counts and timings, refreshed periodically
+"""
+class TraceStatsPanel(QtWidgets.QWidget):
+    COLUMNS = ('Span', 'Calls', 'Total ms', 'Mean ms', 'Max ms')
+
+    def __init__(self, tracer):
+        QtWidgets.QWidget.__init__(self)
+        self.tracer = tracer
+        layout = QtWidgets.QVBoxLayout()
+        self.setLayout(layout)
+
+        self.table = QtWidgets.QTableWidget(0, len(self.COLUMNS), self)
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.verticalHeader().hide()
+        layout.addWidget(QtWidgets.QLabel("Trace statistics"))
+        layout.addWidget(self.table)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(STATS_REFRESH_MS)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start()
+
+    def refresh(self):
+        rows = self.tracer.summary()
+        self.table.setRowCount(len(rows))
+        for row, (name, stat) in enumerate(rows):
+            values = (name, str(stat['calls']), f"{stat['total_ms']:.1f}",
+                      f"{stat['total_ms'] / stat['calls']:.3f}", f"{stat['max_ms']:.2f}")
+            for column, value in enumerate(values):
+                self.table.setItem(row, column, QtWidgets.QTableWidgetItem(value))
@@ -0,0 +1,260 @@
+import collections
+import json
+import time
+from PySide2 import QtCore
+from SceneModel import quaternionsToEuler
+
+MAX_ENTRIES = 1000
+MAX_BYTES = 4 * 1024 * 1024
+# edits to the same fields of one primitive closer together than this are one step
+COALESCE_MS = 1000
+# rough sizes used to account entries against MAX_BYTES
+ENTRY_BYTES = 128
+FIELD_BYTES = 96
+
+"""
+One undoable step. Edits keep only the changed fields as
+{persist_id: {field: (old, new)}}; creations and removals keep the full
+records so the primitives can be rebuilt. Grouping and ungrouping keep the
+group record and, as deltas, the parent and local transform of each member.
+"""
+class UndoEntry:
+    __slots__ = ('kind', 'deltas', 'records', 'time', 'size')
+
+    def __init__(self, kind, deltas=None, records=None):
+        self.kind = kind
+        self.deltas = deltas
+        self.records = records
+        self.time = time.monotonic()
+        self.size = self.measure()
+
+    def measure(self):
+        size = ENTRY_BYTES
+        if self.records is not None:
+            size += len(json.dumps(self.records))
+        for fields in (self.deltas or {}).values():
+            for old, new in fields.values():
+                size += FIELD_BYTES
+                if isinstance(old, str) or isinstance(new, str):
+                    size += len(old or '') + len(new or '')
+        return size
+
+
+"""
+Delta based undo and redo. Each step is applied inside a ShapeEditor
+transaction, so it reaches storage as a single queued write. The log is
+capped by entry count and by approximate size, dropping the oldest steps.
+"""
+class UndoStack(QtCore.QObject):
+    changed = QtCore.Signal()
+
+    def __init__(self, shapeEditor, maxEntries=MAX_ENTRIES, maxBytes=MAX_BYTES):
+        super().__init__()
+        self.shapeEditor = shapeEditor
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+        self.m_undo = collections.deque()
+        self.m_redo = []
+        self.m_bytes = 0
+        self.m_applying = False
+        self.m_stats = {'recorded': 0, 'coalesced': 0, 'dropped': 0, 'undos': 0, 'redos': 0}
+
+    def canUndo(self):
+        return bool(self.m_undo)
+
+    def canRedo(self):
+        return bool(self.m_redo)
+
+    """
+    Records the fields of primitive that differ from before, a snapshot
+    taken with SceneModel.fields when its transaction began
+    """
+    def recordEdit(self, primitive, before):
+        if self.m_applying:
+            return
+        after = primitive.fields()
+        fields = {name: (value, after[name]) for name, value in before.items()
+                  if value != after[name]}
+        if not fields:
+            return
+
+        top = self.m_undo[-1] if self.m_undo else None
+        if top is not None and not self.m_redo and top.kind == 'edit' and \
+                list(top.deltas) == [primitive.persist_id] and \
+                top.deltas[primitive.persist_id].keys() == fields.keys() and \
+                (time.monotonic() - top.time) * 1000.0 < COALESCE_MS:
+            previous = top.deltas[primitive.persist_id]
+            for name, (old, new) in fields.items():
+                previous[name] = (previous[name][0], new)
+            self.m_bytes -= top.size
+            top.time = time.monotonic()
+            top.size = top.measure()
+            self.m_bytes += top.size
+            self.m_stats['coalesced'] += 1
+            return
+
+        self.push(UndoEntry('edit', deltas={primitive.persist_id: fields}))
+
+    def recordCreate(self, primitives):
+        if not self.m_applying and primitives:
+            self.push(UndoEntry('create', records=self.records(primitives)))
+
+    def recordRemove(self, primitives):
+        if not self.m_applying and primitives:
+            self.push(UndoEntry('remove', records=self.records(primitives)))
+
+    """
+    Records a grouping ('group') or ungrouping ('ungroup') of group, with
+    the placements of its members before and after (see
+    ShapeEditor.placements)
+    """
+    def recordGroup(self, kind, group, before, after):
+        if self.m_applying:
+            return
+        model = self.shapeEditor.sceneModel
+        model.updateWorld()
+        record = dict(group.toDict(), id=group.persist_id)
+        record['world'] = self.world(model.groupWorldPositions[group.index:group.index + 1],
+                                     model.groupWorldRotations[group.index:group.index + 1])[0]
+        deltas = {persist_id: {name: (placement[name], after[persist_id][name])
+                               for name in placement}
+                  for persist_id, placement in before.items()}
+        self.push(UndoEntry(kind, deltas=deltas, records=[record]))
+
+    """
+    Full records of primitives. Grouped ones also keep their world
+    transform, to fall back on if their group is gone when they are restored.
+    """
+    def records(self, primitives):
+        model = self.shapeEditor.sceneModel
+        slots = [primitive.slot for primitive in primitives]
+        records = model.toRecords(slots)
+        grouped = [i for i, slot in enumerate(slots) if model.parents[slot] >= 0]
+        if grouped:
+            groupedSlots = [slots[i] for i in grouped]
+            world = self.world(model.worldPositions(groupedSlots),
+                               model.worldRotations(groupedSlots))
+            for i, transform in zip(grouped, world):
+                records[i]['world'] = transform
+        for record, primitive in zip(records, primitives):
+            record['id'] = primitive.persist_id
+        return records
+
+    def world(self, positions, rotations):
+        rotations = quaternionsToEuler(rotations).tolist()
+        return [{'position': dict(zip('xyz', position)), 'rotation': dict(zip('xyz', rotation))}
+                for position, rotation in zip(positions.astype(float).tolist(), rotations)]
+
+    def push(self, entry):
+        self.m_bytes -= sum(redone.size for redone in self.m_redo)
+        self.m_redo = []
+        self.m_undo.append(entry)
+        self.m_bytes += entry.size
+        self.m_stats['recorded'] += 1
+        self.trim()
+        self.changed.emit()
+
+    def trim(self):
+        while self.m_undo and (len(self.m_undo) > self.maxEntries or
+                               self.m_bytes > self.maxBytes):
+            self.m_bytes -= self.m_undo.popleft().size
+            self.m_stats['dropped'] += 1
+
+    def undo(self):
+        # edits still waiting for the next frame belong before this step
+        self.shapeEditor.updateScheduler.applyPending()
+        if not self.m_undo:
+            return
+        entry = self.m_undo.pop()
+        self.apply(entry, False)
+        self.m_redo.append(entry)
+        self.m_stats['undos'] += 1
+        self.changed.emit()
+
+    def redo(self):
+        self.shapeEditor.updateScheduler.applyPending()
+        if not self.m_redo:
+            return
+        entry = self.m_redo.pop()
+        self.apply(entry, True)
+        self.m_undo.append(entry)
+        self.m_stats['redos'] += 1
+        self.changed.emit()
+
+    """
+    Applies entry forwards (redo) or backwards (undo) as one transaction
+    """
+    def apply(self, entry, forward):
+        self.m_applying = True
+        try:
+            with self.shapeEditor.transaction():
+                if entry.kind == 'edit':
+                    for persist_id, fields in entry.deltas.items():
+                        primitive = self.shapeEditor.primitiveFor(persist_id)
+                        if primitive is not None:
+                            primitive.applyFields({name: values[1 if forward else 0]
+                                                   for name, values in fields.items()})
+                elif entry.kind in ('group', 'ungroup'):
+                    self.applyGroup(entry, forward == (entry.kind == 'group'), forward)
+                elif (entry.kind == 'create') == forward:
+                    self.shapeEditor.restorePrimitives(
+                        [self.restorable(record) for record in entry.records])
+                else:
+                    primitives = [self.shapeEditor.primitiveFor(record['id'])
+                                  for record in entry.records]
+                    self.shapeEditor.removePrimitives(
+                        [primitive for primitive in primitives if primitive is not None])
+        finally:
+            self.m_applying = False
+        self.shapeEditor.stackedLayout.refreshPrimitiveEditor()
+
+    """
+    Recreates the group of entry and moves its members in, or moves them out
+    and dissolves it
+    """
+    def applyGroup(self, entry, grouped, forward):
+        record = entry.records[0]
+        if grouped:
+            group = self.shapeEditor.groupFor(record['id'])
+            group.restore(self.restorable(record))
+            group.persist(True)
+        for persist_id, fields in entry.deltas.items():
+            item = self.shapeEditor.primitiveFor(persist_id)
+            if item is not None:
+                self.place(item, {name: values[1 if forward else 0]
+                                  for name, values in fields.items()})
+        if not grouped:
+            group = self.shapeEditor.findGroup(record['id'])
+            if group is not None:
+                self.shapeEditor.ungroup(group)
+
+    """
+    Gives item a stored parent and local transform. When that group is gone
+    the item moves to the top level instead, keeping its place in the world.
+    """
+    def place(self, item, placement):
+        parent = placement['parent']
+        group = self.shapeEditor.findGroup(parent) if parent else None
+        if parent and group is None:
+            item.setParentGroup(None)
+            return
+        item.applyFields(dict(placement, parent=group.index if group is not None else -1))
+
+    """
+    Record to rebuild a primitive or group from; one whose group is gone is
+    restored at the top level at its world transform
+    """
+    def restorable(self, record):
+        world = record.get('world')
+        if world is None:
+            return record
+        record = {key: value for key, value in record.items() if key != 'world'}
+        if record.get('parent') and self.shapeEditor.findGroup(record['parent']) is None:
+            record.update(world, parent=None)
+        return record
+
+    def stats(self):
+        stats = dict(self.m_stats)
+        stats['entries'] = len(self.m_undo) + len(self.m_redo)
+        stats['bytes'] = self.m_bytes
+        return stats
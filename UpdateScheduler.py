@@ -0,0 +1,83 @@
+import time
+from PySide2 import QtCore
+from PySide2.Qt3DLogic import Qt3DLogic
+
+# applies pending updates even when no frame is rendered, e.g. on demand rendering
+FALLBACK_INTERVAL_MS = 50
+
+"""
+Collects live edits from the editor widgets and applies them once per
+rendered frame. Only the latest value of each property of a primitive is
+kept, so typing or dragging faster than the frame rate never queues more
+than one transform or mesh change per property. All pending updates of one
+primitive are applied in a single transaction.
+"""
+class UpdateScheduler(QtCore.QObject):
+    def __init__(self, rootEntity, shapeEditor):
+        super().__init__()
+        self.shapeEditor = shapeEditor
+        # primitive -> {setter name: (setter, args)}
+        self.m_pending = {}
+        self.m_stats = {'scheduled': 0, 'coalesced': 0, 'dropped': 0, 'applied': 0,
+                        'frames': 0, 'last_apply_ms': 0.0, 'max_apply_ms': 0.0}
+
+        self.frameAction = Qt3DLogic.QFrameAction(rootEntity)
+        rootEntity.addComponent(self.frameAction)
+        self.frameAction.triggered.connect(self.applyPending)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(FALLBACK_INTERVAL_MS)
+        self.timer.timeout.connect(self.applyPending)
+
+    """
+    Queues setter(*args) on primitive, replacing a pending call of the same
+    setter
+    """
+    def schedule(self, primitive, setter, *args):
+        updates = self.m_pending.setdefault(primitive, {})
+        if setter.__name__ in updates:
+            self.m_stats['coalesced'] += 1
+        updates[setter.__name__] = (setter, args)
+        self.m_stats['scheduled'] += 1
+        if not self.timer.isActive():
+            self.timer.start()
+
+    def hasPending(self):
+        return bool(self.m_pending)
+
+    """
+    Discards the pending updates of a removed primitive
+    """
+    def primitiveRemoved(self, primitive):
+        updates = self.m_pending.pop(primitive, None)
+        if updates:
+            self.m_stats['dropped'] += len(updates)
+
+    """
+    Applies everything pending; called on each frame, by the fallback timer
+    and before anything that must see the latest edits, such as undo
+    """
+    def applyPending(self, dt=None):
+        if not self.m_pending:
+            return
+        start = time.perf_counter()
+        pending = self.m_pending
+        self.m_pending = {}
+        self.timer.stop()
+
+        for primitive, updates in pending.items():
+            with primitive.transaction():
+                for setter, args in updates.values():
+                    setter(*args)
+            self.m_stats['applied'] += len(updates)
+
+        elapsed = (time.perf_counter() - start) * 1000.0
+        self.m_stats['frames'] += 1
+        self.m_stats['last_apply_ms'] = elapsed
+        self.m_stats['max_apply_ms'] = max(self.m_stats['max_apply_ms'], elapsed)
+
+    def stats(self):
+        stats = dict(self.m_stats)
+        stats['pending'] = sum(len(updates) for updates in self.m_pending.values())
+        return stats
@@ -0,0 +1,168 @@
+"""
+Headless benchmark suite for the editor hot paths. Each scene size runs in
+its own process so peak RSS is measured per size. Results are written as
+JSON and can be compared against an earlier run.
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_editor.py --output bench.json
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_editor.py --compare old.json
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+from common import generateRecords, openTemporaryStore, createEditor, summarize
+from PySide2 import QtWidgets, QtCore, QtGui
+from SceneStore import closeStore
+
+SIZES = [100, 1000, 10000, 100000]
+# median regressions larger than this fraction are reported by --compare
+REGRESSION_THRESHOLD = 0.10
+
+
+def timed(samples, call, *args):
+    start = time.perf_counter()
+    result = call(*args)
+    samples.append((time.perf_counter() - start) * 1000.0)
+    return result
+
+
+def waitFor(app, condition):
+    while not condition():
+        app.processEvents(QtCore.QEventLoop.AllEvents, 50)
+
+
+def storeSize(store):
+    return sum(os.path.getsize(path) for path in glob.glob(store.filename + '*'))
+
+
+"""
+Runs every benchmark for one scene size and returns the results
+"""
+def runSize(app, count, operations):
+    closeStore()
+    store = openTemporaryStore()
+    records = generateRecords(count)
+    for record in records:
+        del record['id']
+    store.addMany(records)
+
+    view, rootEntity, shapeEditor = createEditor()
+    rightMenu = shapeEditor.stackedLayout
+    results = {'objects': count}
+
+    # restore through the progressive loader until the last batch lands
+    start = time.perf_counter()
+    loader = shapeEditor.restoreData()
+    finished = []
+    loader.finished.connect(lambda: finished.append(True))
+    waitFor(app, lambda: finished)
+    results['restoreData_ms'] = (time.perf_counter() - start) * 1000.0
+
+    rng = random.Random(0)
+    primitives = list(shapeEditor.primitives())
+    sample = [rng.choice(primitives) for _ in range(min(operations, len(primitives)))]
+
+    persist, click, openEditor, fieldUpdate, applyUpdate = [], [], [], [], []
+    for primitive in sample:
+        primitive.setPosition(primitive.position() + QtGui.QVector3D(1.0, 0.0, 0.0), False)
+        timed(persist, primitive.persist, True)
+        timed(click, shapeEditor.handleClickedPrimitive, primitive)
+        timed(openEditor, rightMenu.openPrimitiveEditor, primitive)
+        editor = rightMenu.stackWidget.currentWidget()
+        timed(fieldUpdate, editor.transform_widget.X_edit.setText, str(rng.uniform(-10, 10)))
+        # what the next frame does with the edit
+        timed(applyUpdate, shapeEditor.updateScheduler.applyPending)
+
+    shapeEditor.persistenceQueue.flush().result()
+    results['persist'] = summarize(persist)
+    results['handleClickedPrimitive'] = summarize(click)
+    results['openPrimitiveEditor'] = summarize(openEditor)
+    results['field_update'] = summarize(fieldUpdate)
+    results['apply_update'] = summarize(applyUpdate)
+    results['flush_ms'] = shapeEditor.persistenceQueue.stats()['last_flush_ms']
+
+    remove = []
+    for primitive in dict.fromkeys(sample):
+        timed(remove, primitive.remove)
+    shapeEditor.persistenceQueue.shutdown()
+    results['remove'] = summarize(remove)
+
+    results['disk_bytes'] = storeSize(store)
+    results['peak_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    view.close()
+    closeStore()
+    return results
+
+
+def gitRevision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def medians(results):
+    values = {}
+    for entry in results:
+        for name, value in entry.items():
+            if isinstance(value, dict):
+                values[(entry['objects'], name)] = value['median_ms']
+            elif name.endswith('_ms'):
+                values[(entry['objects'], name)] = value
+    return values
+
+
+"""
+Prints benchmarks whose median got slower than the previous run by more
+than REGRESSION_THRESHOLD
+"""
+def compare(previous, current):
+    before = medians(previous['results'])
+    after = medians(current['results'])
+    regressions = 0
+    for key, value in sorted(after.items()):
+        old = before.get(key)
+        if old and value > old * (1.0 + REGRESSION_THRESHOLD):
+            regressions += 1
+            print(f"{key[1]} @ {key[0]} objects: {old:.3f} ms -> {value:.3f} ms")
+    print(f"{regressions} regressions against {previous.get('revision')}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--operations", type=int, default=200)
+    parser.add_argument("--output", default="bench_output.json")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--single", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        app = QtWidgets.QApplication(sys.argv)
+        print(json.dumps(runSize(app, args.single, args.operations)))
+        sys.exit(0)
+
+    results = []
+    for count in args.sizes:
+        output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), '--single', str(count),
+             '--operations', str(args.operations)], text=True)
+        results.append(json.loads(output.strip().splitlines()[-1]))
+
+    report = {'revision': gitRevision(), 'timestamp': time.time(), 'results': results}
+    with open(args.output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, indent=3)
+    print(json.dumps(report, indent=3))
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as previous_file:
+            sys.exit(1 if compare(json.load(previous_file), report) else 0)
@@ -0,0 +1,71 @@
+"""
+Streams generated scenes of growing size from a binary scene file, or from
+a scene store, into every export format. Reports export times, output sizes
+and peak Python memory. Peak memory stays flat as the scene grows for scene
+files and the sqlite store, which are read a batch at a time. The chunked
+store reads a chunk at a time, so it grows with the largest chunk, and the
+json and journal stores hold the whole scene.
+
+    python benchmarks/bench_export.py --count 10000 100000
+    python benchmarks/bench_export.py --count 10000 50000 --source chunked
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from common import generateRecords
+from SceneModel import SceneModel
+from SceneFile import SceneFile, exportModel
+from SceneStore import BACKENDS
+from SceneExport import WRITERS, exportScene
+
+
+def openSource(source, path):
+    if source == 'scene':
+        return SceneFile(path)
+    return BACKENDS[source][0](path)
+
+
+def measure(source, path, filename, fmt):
+    scene = openSource(source, path)
+    try:
+        tracemalloc.start()
+        start = time.perf_counter()
+        exportScene(scene, filename, fmt)
+        elapsed = (time.perf_counter() - start) * 1000.0
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        scene.close()
+    return {'export_ms': elapsed, 'peak_bytes': peak, 'file_bytes': os.path.getsize(filename)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument("--format", choices=sorted(WRITERS), nargs='+', default=sorted(WRITERS))
+    parser.add_argument("--source", choices=['scene'] + sorted(BACKENDS), default='scene')
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='editor-bench-')
+    results = {}
+    for count in args.count:
+        records = generateRecords(count)
+        path = os.path.join(directory, f'scene{count}.{args.source}')
+        if args.source == 'scene':
+            model = SceneModel(count)
+            exportModel(path, model, model.addRecords(records))
+            del model
+        else:
+            store = openSource(args.source, path)
+            store.addMany(records)
+            store.close()
+        del records
+
+        results[count] = {fmt: measure(args.source, path,
+                                       os.path.join(directory, f'scene{count}.{fmt}'), fmt)
+                          for fmt in args.format}
+    print(json.dumps(results, indent=3))
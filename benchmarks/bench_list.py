@@ -0,0 +1,116 @@
+"""
+Measures the object list on a large scene: memory of the list model against
+one QListWidgetItem per primitive, incremental search while typing, renames,
+scrolling through the virtualized view and removing many rows at once. Each
+list is built in its own process, and its memory is the growth of peak RSS
+while it is filled.
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_list.py --count 100000
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from common import generateRecords, openTemporaryStore, createEditor, summarize
+from PySide2 import QtWidgets
+
+LISTS = ['model', 'widget']
+
+
+def timedCalls(calls):
+    samples = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return summarize(samples)
+
+
+def peakRssMb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+"""
+Peak RSS growth in MB while listing every primitive, either in the list
+model or with one widget item each
+"""
+def listRssMb(kind, count):
+    openTemporaryStore()
+    view, rootEntity, shapeEditor = createEditor()
+    primitives = [shapeEditor.createPrimitive(record) for record in generateRecords(count)]
+
+    before = peakRssMb()
+    if kind == 'model':
+        shapeEditor.objectListModel.addPrimitives(primitives)
+    else:
+        listWidget = QtWidgets.QListWidget()
+        for primitive in primitives:
+            listWidget.addItem(QtWidgets.QListWidgetItem(primitive.name()))
+    return peakRssMb() - before
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--query", default="Object 1234")
+    parser.add_argument("--single", choices=LISTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv)
+    if args.single is not None:
+        print(json.dumps(listRssMb(args.single, args.count)))
+        sys.exit(0)
+
+    memory = {}
+    for kind in LISTS:
+        output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), '--single', kind,
+             '--count', str(args.count)], text=True)
+        memory[kind] = json.loads(output.strip().splitlines()[-1])
+
+    openTemporaryStore()
+    view, rootEntity, shapeEditor = createEditor()
+    records = generateRecords(args.count)
+    primitives = [shapeEditor.createPrimitive(record) for record in records]
+    shapeEditor.addPrimitives(primitives)
+
+    listModel = shapeEditor.objectListModel
+    listView = shapeEditor.m_objectListView
+    listView.resize(300, 800)
+    listView.show()
+
+    # one filter per keystroke, then clearing the search box
+    typing = [args.query[:length] for length in range(1, len(args.query) + 1)]
+    search = timedCalls([lambda text=text: listModel.setFilter(text) for text in typing])
+    clear = timedCalls([lambda: listModel.setFilter('')])
+
+    renamed = primitives[:200]
+    rename = timedCalls([lambda p=p: p.setName(p.name() + ' renamed', False) for p in renamed])
+
+    def scrollPage():
+        bar = listView.verticalScrollBar()
+        bar.setValue(bar.value() + bar.pageStep())
+        app.processEvents()
+    scroll = timedCalls([scrollPage] * 200)
+
+    # every tenth primitive in one step, as undoing a large array does
+    removed = primitives[::10]
+    start = time.perf_counter()
+    shapeEditor.removePrimitives(removed)
+    removeMs = (time.perf_counter() - start) * 1000.0
+
+    print(json.dumps({'objects': args.count,
+                      'list_model_rss_mb': memory['model'],
+                      'widget_items_rss_mb': memory['widget'],
+                      'search_keystroke': search,
+                      'search_matches': len(listModel.m_names.search(args.query)),
+                      'clear_filter': clear,
+                      'rename': rename,
+                      'scroll_page': scroll,
+                      'removed': len(removed),
+                      'remove_many_ms': removeMs}, indent=3))
+    shapeEditor.persistenceQueue.shutdown()
@@ -0,0 +1,48 @@
+"""
+Measures sphere triangle counts and frame times with screen-space level of
+detail turned off and on, for a field of spheres seen from a distance.
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_lod.py --count 10000
+"""
+import argparse
+import json
+import sys
+
+from common import generateRecords, openTemporaryStore, createEditor, measureFrames, summarize
+from PySide2 import QtWidgets, QtGui
+
+
+def runMode(app, lodEnabled, records, frames, distance):
+    view, rootEntity, shapeEditor = createEditor()
+    shapeEditor.m_cameraEntity.setPosition(QtGui.QVector3D(0, 0, distance))
+    shapeEditor.sphereLod.setViewportHeight(view.height())
+    shapeEditor.sphereLod.setEnabled(lodEnabled)
+    view.show()
+
+    for record in records:
+        shapeEditor.restorePrimitive(record)
+    shapeEditor.sphereLod.update()
+
+    frameTimes = summarize(measureFrames(app, rootEntity, frames))
+    stats = shapeEditor.sphereLod.stats()
+    view.close()
+    shapeEditor.persistenceQueue.shutdown()
+    return {'lod': lodEnabled, 'spheres': len(records),
+            'sphere_triangles': stats['sphere_triangles'],
+            'lod_update_ms': stats['last_update_ms'],
+            'frame_ms_median': frameTimes['median_ms'],
+            'frame_ms_p95': frameTimes['p95_ms']}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--distance", type=float, default=150.0)
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv)
+    openTemporaryStore()
+    records = [record for record in generateRecords(args.count * 2) if record['type'] == 'sphere']
+    results = [runMode(app, enabled, records, args.frames, args.distance) for enabled in (False, True)]
+    print(json.dumps(results, indent=3))
@@ -0,0 +1,41 @@
+"""
+Compares per-object serialization through Primitive.toDict with vectorized
+serialization from the SceneModel, and reports the model's memory use.
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_model.py --count 100000
+"""
+import argparse
+import json
+import sys
+import time
+
+from common import generateRecords, openTemporaryStore, createEditor
+from PySide2 import QtWidgets
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=100000)
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv)
+    openTemporaryStore()
+    view, rootEntity, shapeEditor = createEditor()
+    for record in generateRecords(args.count):
+        shapeEditor.restorePrimitive(record)
+
+    start = time.perf_counter()
+    perObject = [primitive.toDict() for primitive in shapeEditor.primitives()]
+    perObjectMs = (time.perf_counter() - start) * 1000.0
+
+    start = time.perf_counter()
+    vectorized = shapeEditor.sceneModel.toRecords()
+    vectorizedMs = (time.perf_counter() - start) * 1000.0
+
+    shapeEditor.persistenceQueue.shutdown()
+    print(json.dumps({'objects': args.count,
+                      'toDict_ms': perObjectMs,
+                      'toRecords_ms': vectorizedMs,
+                      'model_bytes': shapeEditor.sceneModel.memoryBytes(),
+                      'model_bytes_per_object': shapeEditor.sceneModel.memoryBytes() / args.count},
+                     indent=3))
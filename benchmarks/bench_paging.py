@@ -0,0 +1,74 @@
+"""
+Compares the editor with every primitive materialized against entity
+paging, for a large scene while the camera orbits. Reports live entities,
+peak RSS, frame times and the pager's hit/miss counters. Each mode runs in
+its own process so RSS is measured separately.
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_paging.py --count 100000
+"""
+import argparse
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from common import generateRecords, openTemporaryStore, createEditor, measureFrames, summarize
+from PySide2 import QtWidgets, QtGui
+
+
+def runMode(app, paging, count, steps, radius):
+    view, rootEntity, shapeEditor = createEditor()
+    pager = shapeEditor.entityPager
+    pager.setRadius(radius)
+    pager.setEnabled(paging)
+    view.show()
+
+    start = time.perf_counter()
+    for record in generateRecords(count):
+        shapeEditor.restorePrimitive(record)
+    pager.update()
+    loadMs = (time.perf_counter() - start) * 1000.0
+
+    camera = shapeEditor.m_cameraEntity
+    frameTimes = []
+    for step in range(steps):
+        angle = 2.0 * math.pi * step / steps
+        camera.setPosition(QtGui.QVector3D(math.cos(angle) * 60.0, 0.0, math.sin(angle) * 60.0))
+        pager.update()
+        frameTimes.extend(measureFrames(app, rootEntity, 5))
+
+    frames = summarize(frameTimes)
+    result = {'paging': paging, 'objects': count, 'load_ms': loadMs,
+              'frame_ms_median': frames['median_ms'], 'frame_ms_p95': frames['p95_ms'],
+              'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+              'pager': pager.stats()}
+    view.close()
+    shapeEditor.persistenceQueue.shutdown()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=100000)
+    parser.add_argument("--steps", type=int, default=24)
+    parser.add_argument("--radius", type=float, default=40.0)
+    parser.add_argument("--single", choices=["on", "off"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.single is not None:
+        app = QtWidgets.QApplication(sys.argv)
+        openTemporaryStore()
+        print(json.dumps(runMode(app, args.single == "on", args.count, args.steps, args.radius)))
+        sys.exit(0)
+
+    results = []
+    for mode in ("off", "on"):
+        output = subprocess.check_output(
+            [sys.executable, os.path.abspath(__file__), '--single', mode,
+             '--count', str(args.count), '--steps', str(args.steps),
+             '--radius', str(args.radius)], text=True)
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    print(json.dumps(results, indent=3))
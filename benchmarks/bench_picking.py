@@ -0,0 +1,64 @@
+"""
+Compares the cost of finding the list row of a clicked primitive with a
+linear scan over the object list and with the persist_id index.
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_picking.py --counts 10 1000 100000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from common import generateRecords, openTemporaryStore, createEditor, summarize
+from PySide2 import QtWidgets
+from PrimitiveListModel import PrimitiveRole
+
+
+"""
+Lookup as handleClickedPrimitive did it before the index existed
+"""
+def linearLookup(listModel, primitive):
+    found = None
+    listModel.fetchTo(len(listModel))
+    for row in range(listModel.rowCount()):
+        index = listModel.index(row)
+        if listModel.data(index, PrimitiveRole) == primitive:
+            found = index
+    return found
+
+
+def timeLookups(lookup, primitives, clicks):
+    samples = []
+    for primitive in primitives[:clicks]:
+        start = time.perf_counter()
+        lookup(primitive)
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return summarize(samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 1000, 10000, 100000])
+    parser.add_argument("--clicks", type=int, default=200)
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv)
+    openTemporaryStore()
+
+    results = []
+    for count in args.counts:
+        view, rootEntity, shapeEditor = createEditor()
+        for record in generateRecords(count):
+            shapeEditor.restorePrimitive(record)
+
+        primitives = list(shapeEditor.primitives())
+        random.Random(0).shuffle(primitives)
+        listModel = shapeEditor.objectListModel
+        results.append({
+            'objects': count,
+            'linear_scan': timeLookups(lambda p: linearLookup(listModel, p), primitives, args.clicks),
+            'indexed': timeLookups(listModel.indexOf, primitives, args.clicks)})
+        shapeEditor.persistenceQueue.shutdown()
+
+    print(json.dumps(results, indent=3))
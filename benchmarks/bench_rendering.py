@@ -0,0 +1,67 @@
+"""
+Compares draw calls and frame times for a generated scene rendered with
+per-primitive meshes, shared cached meshes, instanced rendering and static
+batching. Baked runs also report the time to bake the scene and to select
+a primitive, which cuts it out of its merged mesh. Frames are paced by the
+display refresh, so a mode that renders faster than that reports the
+refresh interval as its frame time. On a software rasterizer such as
+llvmpipe frame times follow the vertices drawn rather than the draw calls,
+so merged and instanced meshes gain little there; compare them on a GPU.
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_rendering.py --count 20000
+"""
+import argparse
+import json
+import sys
+import time
+
+from common import generateRecords, openTemporaryStore, createEditor, measureFrames, summarize
+from PySide2 import QtWidgets, QtGui
+from GeometryCache import GeometryCache
+
+
+def runMode(app, mode, records, frames):
+    view, rootEntity, shapeEditor = createEditor()
+    shapeEditor.m_cameraEntity.setPosition(QtGui.QVector3D(0, 0, 150.0))
+    shapeEditor.geometryCache = GeometryCache(rootEntity, shared=(mode != 'unique'))
+    view.show()
+
+    for record in records:
+        shapeEditor.restorePrimitive(record)
+    shapeEditor.instancedRenderer.setEnabled(mode == 'instanced')
+    shapeEditor.staticBatcher.setEnabled(mode == 'baked')
+    renderer = shapeEditor.staticBatcher if mode == 'baked' else shapeEditor.instancedRenderer
+
+    frameTimes = summarize(measureFrames(app, rootEntity, frames))
+    result = {'mode': mode, 'objects': len(records),
+              'draw_calls': renderer.drawCalls(),
+              'cached_components': shapeEditor.geometryCache.stats()['components'],
+              'frame_ms_median': frameTimes['median_ms'],
+              'frame_ms_p95': frameTimes['p95_ms']}
+
+    if mode == 'baked':
+        result['bake_ms'] = shapeEditor.staticBatcher.stats()['last_rebuild_ms']
+        select = []
+        for primitive in list(shapeEditor.primitives())[:100]:
+            start = time.perf_counter()
+            shapeEditor.handleClickedPrimitive(primitive)
+            select.append((time.perf_counter() - start) * 1000.0)
+        result['select'] = summarize(select)
+
+    view.close()
+    shapeEditor.persistenceQueue.shutdown()
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=10000)
+    parser.add_argument("--frames", type=int, default=120)
+    parser.add_argument("--modes", nargs="+", default=['unique', 'shared', 'instanced', 'baked'])
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv)
+    openTemporaryStore()
+    records = generateRecords(args.count)
+    results = [runMode(app, mode, records, args.frames) for mode in args.modes]
+    print(json.dumps(results, indent=3))
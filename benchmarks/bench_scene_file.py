@@ -0,0 +1,58 @@
+"""
+Compares loading a scene from the pysondb JSON layout with loading the
+binary scene format through mmap, into a SceneModel. Reports load times,
+peak Python memory and file sizes.
+
+    python benchmarks/bench_scene_file.py --count 100000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from common import generateRecords
+from SceneModel import SceneModel
+from SceneFile import SceneFile, jsonToBinary
+
+
+def measure(load):
+    tracemalloc.start()
+    start = time.perf_counter()
+    load()
+    elapsed = (time.perf_counter() - start) * 1000.0
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'load_ms': elapsed, 'peak_bytes': peak}
+
+
+def loadJson(filename):
+    with open(filename, "r", encoding="utf-8") as json_file:
+        records = json.load(json_file)["data"]
+    SceneModel(len(records)).addRecords(records)
+
+
+def loadBinary(filename):
+    with SceneFile(filename) as scene:
+        scene.loadInto(SceneModel(len(scene)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=100000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='editor-bench-')
+    jsonFile = os.path.join(directory, 'scene.json')
+    sceneFile = os.path.join(directory, 'scene.scene')
+    with open(jsonFile, 'w', encoding='utf-8') as output:
+        json.dump({'data': generateRecords(args.count)}, output, indent=3)
+    jsonToBinary(jsonFile, sceneFile)
+
+    print(json.dumps({'objects': args.count,
+                      'json': dict(measure(lambda: loadJson(jsonFile)),
+                                   file_bytes=os.path.getsize(jsonFile)),
+                      'binary': dict(measure(lambda: loadBinary(sceneFile)),
+                                     file_bytes=os.path.getsize(sceneFile))}, indent=3))
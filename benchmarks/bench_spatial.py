@@ -0,0 +1,57 @@
+"""
+Times ray picks and frustum queries against the spatial index as the scene
+grows, to check hover and click latency stays flat.
+
+    QT_QPA_PLATFORM=offscreen python benchmarks/bench_spatial.py --counts 1000 10000 100000
+"""
+import argparse
+import json
+import random
+import sys
+import time
+
+from common import generateRecords, openTemporaryStore, createEditor, summarize
+from PySide2 import QtWidgets
+from SpatialIndex import cameraRay, frustumPlanes
+
+
+def timeCalls(call, arguments):
+    samples = []
+    for argument in arguments:
+        start = time.perf_counter()
+        call(argument)
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return summarize(samples)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--counts", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--picks", type=int, default=500)
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv)
+    openTemporaryStore()
+
+    results = []
+    for count in args.counts:
+        view, rootEntity, shapeEditor = createEditor()
+        for record in generateRecords(count):
+            shapeEditor.restorePrimitive(record)
+        shapeEditor.spatialIndex.rebuild()
+
+        camera = shapeEditor.m_cameraEntity
+        rng = random.Random(0)
+        rays = [cameraRay(camera, rng.uniform(0, 1280), rng.uniform(0, 720), 1280, 720)
+                for _ in range(args.picks)]
+        planes = frustumPlanes(camera.projectionMatrix() * camera.viewMatrix())
+
+        index = shapeEditor.spatialIndex
+        results.append({
+            'objects': count,
+            'pick': timeCalls(lambda ray: index.raycast(*ray), rays),
+            'pick_bounds_only': timeCalls(lambda ray: index.raycast(ray[0], ray[1], False), rays),
+            'frustum_query': timeCalls(index.frustumQuery, [planes] * 20)})
+        shapeEditor.persistenceQueue.shutdown()
+
+    print(json.dumps(results, indent=3))
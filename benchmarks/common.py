@@ -0,0 +1,85 @@
+"""
+Helpers shared by the benchmark scripts: synthetic scenes and a ShapeEditor
+wired to a throwaway store.
+"""
+import os
+import random
+import statistics
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+from PySide2 import QtWidgets, QtCore
+from PySide2.Qt3DCore import Qt3DCore
+from PySide2.Qt3DExtras import Qt3DExtras
+from PySide2.Qt3DLogic import Qt3DLogic
+from SceneStore import openStore
+from SceneEditor import ShapeEditor, RightSideMenu, initialize_camera, initialize_lighting
+
+COLORS = ['#158eff', '#ff5a1f', '#7bd148', '#cccccc']
+
+
+def generateRecords(count, seed=0):
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        record = {'id': i + 1, 'name': f'Object {i}',
+                  'position': {'x': rng.uniform(-50, 50), 'y': rng.uniform(-50, 50),
+                               'z': rng.uniform(-50, 50)},
+                  'rotation': {'x': 0.0, 'y': rng.uniform(0, 90), 'z': 0.0},
+                  'color': rng.choice(COLORS)}
+        if i % 2:
+            record['type'] = 'sphere'
+            record['primitive_specific'] = {'radius': rng.choice([0.5, 1.0, 2.0])}
+        else:
+            record['type'] = 'cube'
+            record['primitive_specific'] = {'length': 1.0, 'width': 1.0, 'height': 1.0}
+        records.append(record)
+    return records
+
+
+def openTemporaryStore(backend='sqlite'):
+    directory = tempfile.mkdtemp(prefix='editor-bench-')
+    return openStore(backend, os.path.join(directory, 'bench.' + backend))
+
+
+"""
+Builds the same scene graph as __main__ around a ShapeEditor. Returns the
+view, root entity and editor.
+"""
+def createEditor():
+    view = Qt3DExtras.Qt3DWindow()
+    view.resize(1280, 720)
+    rootEntity = Qt3DCore.QEntity()
+    cameraEntity = initialize_camera(view, rootEntity)
+    initialize_lighting(rootEntity, cameraEntity)
+    view.setRootEntity(rootEntity)
+
+    objectList = QtWidgets.QListView()
+    objectList.setUniformItemSizes(True)
+    shapeEditor = ShapeEditor(rootEntity, cameraEntity, objectList, RightSideMenu())
+    return view, rootEntity, shapeEditor
+
+
+"""
+Renders frames frames and returns their durations in milliseconds
+"""
+def measureFrames(app, rootEntity, frames):
+    durations = []
+    frameAction = Qt3DLogic.QFrameAction(rootEntity)
+    rootEntity.addComponent(frameAction)
+    frameAction.triggered.connect(lambda dt: durations.append(dt * 1000.0))
+
+    while len(durations) < frames:
+        app.processEvents(QtCore.QEventLoop.AllEvents, 50)
+
+    rootEntity.removeComponent(frameAction)
+    return durations[1:]
+
+
+def summarize(samples):
+    ordered = sorted(samples)
+    return {'median_ms': statistics.median(ordered),
+            'p95_ms': ordered[max(0, int(len(ordered) * 0.95) - 1)],
+            'samples': len(ordered)}
@@ -0,0 +1,56 @@
+import numpy as np
+from SceneExport import sceneBatches, exportScene, PLY_VERTEX
+from SceneStore import JournalStore
+
+
+def sphere(persist_id, color, parent=None):
+    return {'type': 'sphere', 'name': f'Sphere {persist_id}', 'parent': parent,
+            'position': {'x': float(persist_id), 'y': 0.0, 'z': 0.0},
+            'rotation': {'x': 0.0, 'y': 0.0, 'z': 0.0},
+            'color': color, 'primitive_specific': {'radius': 1.0}}
+
+
+def group(persist_id, color, parent=None):
+    return {'type': 'group', 'name': f'Group {persist_id}', 'parent': parent,
+            'position': {'x': 0.0, 'y': 0.0, 'z': 0.0},
+            'rotation': {'x': 0.0, 'y': 0.0, 'z': 0.0}, 'color': color}
+
+
+"""
+Store with a green group holding an uncolored nested group, an uncolored
+group, and one member in each plus a primitive at the top level, all red
+or blue as stored
+"""
+def coloredGroupStore(tmp_path):
+    store = JournalStore(str(tmp_path / 'scene.journal'))
+    store.applyBatch({1: group(1, '#00ff00'), 2: group(2, None, parent=1),
+                      3: group(3, None),
+                      10: sphere(10, '#ff0000', parent=2), 11: sphere(11, '#ff0000', parent=3),
+                      12: sphere(12, '#0000ff')}, set())
+    return store
+
+
+def test_members_take_the_nearest_group_color(tmp_path):
+    store = coloredGroupStore(tmp_path)
+    colors = {}
+    for model, slots in sceneBatches(store):
+        for slot in slots.tolist():
+            colors[int(model.ids[slot])] = tuple(model.colors[slot, :3].tolist())
+    store.close()
+
+    assert colors == {10: (0, 255, 0), 11: (255, 0, 0), 12: (0, 0, 255)}
+
+
+def test_ply_export_uses_group_color(tmp_path):
+    store = coloredGroupStore(tmp_path)
+    filename = str(tmp_path / 'scene.ply')
+    assert exportScene(store, filename, rings=4, slices=4) == 3
+    store.close()
+
+    with open(filename, 'rb') as ply_file:
+        data = ply_file.read()
+    header, body = data.split(b'end_header\n', 1)
+    count = int(header.split(b'element vertex ')[1].split(b'\n')[0])
+    vertices = np.frombuffer(body[:count * PLY_VERTEX.itemsize], dtype=PLY_VERTEX)
+    colors = {tuple(color) for color in vertices['color'].tolist()}
+    assert colors == {(0, 255, 0), (255, 0, 0), (0, 0, 255)}